@@ -0,0 +1,144 @@
+"""
+A HubStateMonitor that runs on the caller's asyncio event loop instead of its
+own thread, with awaitable streams of state changes.
+
+Usage:
+```python
+from basic_bot.commons.hub_state import HubState
+from basic_bot.commons.async_hub_state_monitor import AsyncHubStateMonitor
+
+async def main():
+    monitor = AsyncHubStateMonitor(HubState({}), "my_service", ["servo_angles"])
+    monitor.start()
+
+    # wait until central_hub has a value for the key that satisfies the predicate
+    angles = await monitor.wait_for("servo_angles", lambda a: a["pan"] > 90, timeout=5)
+
+    # or handle each new value as it arrives
+    async for angles in monitor.watch("servo_angles"):
+        print(angles)
+
+    await monitor.close()
+
+asyncio.run(main())
+```
+
+All callbacks (on_connect, on_state_update) are called on the caller's loop,
+so they must not block.  `watch()` and `wait_for()` subscribe to their key if
+it is not already subscribed.
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Set
+
+from basic_bot.commons.hub_state_monitor import HubStateMonitor
+
+
+class AsyncHubStateMonitor(HubStateMonitor):
+    """HubStateMonitor on the caller's event loop with watch() and wait_for()."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """Takes the same arguments as HubStateMonitor."""
+        super().__init__(*args, **kwargs)
+        self.task: Optional["asyncio.Task[None]"] = None
+        self.watchers: Dict[str, Set["asyncio.Queue[Any]"]] = {}
+
+    def start(self) -> None:
+        """
+        Start monitoring as a task on the running event loop.  Must be called
+        from a coroutine or callback of that loop.
+        """
+        self.should_exit = False
+        self.loop = asyncio.get_running_loop()
+        self.task = self.loop.create_task(self.monitor_state())
+
+    def stop(self) -> None:
+        """
+        Stop monitoring.  Iterators returned by watch() stop waiting.  Use
+        `await close()` to also wait for the connection to close.
+        """
+        super().stop()
+        for queues in self.watchers.values():
+            for queue in queues:
+                _put_latest(queue, _STOP)
+
+    async def close(self) -> None:
+        """Stop monitoring and wait for the connection to close."""
+        self.stop()
+        if self.task:
+            await self.task
+
+    async def watch(
+        self, key: str, initial: bool = False, latest_only: bool = True
+    ) -> AsyncIterator[Any]:
+        """
+        Async iterator of the values of `key` as they are received.
+
+        Args:
+
+        - key: state key or path selector to watch
+        - initial: if true, first yield the current value of the key if
+            hub_state has one
+        - latest_only: if true (default) a consumer that is slower than the
+            updates only gets the latest value; otherwise every value is
+            queued
+        """
+        self._ensure_subscribed(key)
+        queue: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=1 if latest_only else 0)
+        self.watchers.setdefault(key, set()).add(queue)
+        try:
+            if initial and key in self.hub_state.state:
+                yield self.hub_state.state[key]
+            while not self.should_exit:
+                value = await queue.get()
+                if value is _STOP:
+                    return
+                yield value
+        finally:
+            self.watchers[key].discard(queue)
+
+    async def wait_for(
+        self,
+        key: str,
+        predicate: Optional[Callable[[Any], bool]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        Return the value of `key` once it satisfies `predicate`, or once it has
+        any value if no predicate is given.  Returns immediately if the current
+        value in hub_state satisfies it.  Raises asyncio.TimeoutError after
+        `timeout` seconds and returns None if the monitor is stopped.
+        """
+
+        async def _wait() -> Any:
+            values = self.watch(key, initial=True)
+            try:
+                async for value in values:
+                    if predicate is None or predicate(value):
+                        return value
+                return None
+            finally:
+                # unregisters the watcher now instead of when garbage collected
+                await values.aclose()  # type: ignore[attr-defined]
+
+        return await asyncio.wait_for(_wait(), timeout)
+
+    def on_state_applied(self, msg_data: Dict[str, Any]) -> None:
+        for key, value in msg_data.items():
+            for queue in self.watchers.get(key, ()):
+                _put_latest(queue, value)
+
+    def _ensure_subscribed(self, key: str) -> None:
+        if self.subscribed_keys != "*" and key not in self.subscribed_keys:
+            self.add_subscriptions([key])
+
+
+# sent to watchers when the monitor is stopped
+_STOP = object()
+
+
+def _put_latest(queue: "asyncio.Queue[Any]", value: Any) -> None:
+    """Put value on the queue, replacing the oldest value if the queue is full."""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(value)
@@ -8,73 +8,201 @@ https://blog.miguelgrinberg.com/post/flask-video-streaming-revisited
 Thank you, @adeept and @miguelgrinberg!
 """
 
+import asyncio
 import time
 import threading
-from typing import Generator, Optional, Any, Union
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Generator, List, Optional, Tuple, Union
 import numpy as np
 
-from basic_bot.commons import log
+from basic_bot.commons import constants as c, log
 from basic_bot.commons.fps_stats import FpsStats
 
-try:
-    from greenlet import getcurrent as get_ident  # type: ignore
-except ImportError:
-    try:
-        from thread import get_ident  # type: ignore
-    except ImportError:
-        from _thread import get_ident
 
+@dataclass
+class CameraFrame:
+    """A frame captured by the camera."""
 
-class CameraEvent(object):
+    # increments by one with each frame captured, starting at 1
+    seq: int
+    # time.time() when the frame was read from the camera
+    timestamp: float
+    image: Union[bytes, np.ndarray]
+
+
+class FrameRing:
     """
-    An Event-like class that signals all active clients when a new frame is
-    available.
+    The last `size` frames captured.  Consumers wait for a frame newer than
+    the last one they processed with `get_after()` from a thread, or
+    `await wait_after()` from a coroutine.
     """
 
-    def __init__(self) -> None:
-        # Dictionary mapping thread IDs to [event, timestamp] tuples
-        self.events: dict[int, list[Any]] = {}
-
-    def wait(self) -> bool:
-        """Invoked from each client's thread to wait for the next frame."""
-        ident = get_ident()
-        if ident not in self.events:
-            # this is a new client
-            # add an entry for it in the self.events dict
-            # each entry has two elements, a threading.Event() and a timestamp
-            self.events[ident] = [threading.Event(), time.time()]
-        return self.events[ident][0].wait() or False
-
-    def set(self) -> None:
-        """Invoked by the camera thread when a new frame is available."""
-        now = time.time()
-        remove: Optional[int] = None
-        for ident, event in self.events.items():
-            if not event[0].isSet():
-                # if this client's event is not set, then set it
-                # also update the last set timestamp to now
-                event[0].set()
-                event[1] = now
-            else:
-                # if the client's event is already set, it means the client
-                # did not process a previous frame
-                # if the event stays set for more than 5 seconds, then assume
-                # the client is gone and remove it
-                if now - event[1] > 5:
-                    remove = ident
-        if remove:
-            del self.events[remove]
-
-    def clear(self) -> None:
-        """Invoked from each client's thread after a frame was processed."""
-        self.events[get_ident()][0].clear()
+    def __init__(self, size: int) -> None:
+        self.frames: Deque[CameraFrame] = deque(maxlen=max(1, size))
+        self.condition = threading.Condition()
+        self.is_closed = False
+        # coroutines waiting in wait_after(); woken via their loop
+        self.async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def push(self, image: Union[bytes, np.ndarray], timestamp: float) -> CameraFrame:
+        """Add a frame and wake the consumers waiting for it."""
+        with self.condition:
+            seq = self.frames[-1].seq + 1 if self.frames else 1
+            frame = CameraFrame(seq, timestamp, image)
+            self.frames.append(frame)
+            self.condition.notify_all()
+            self._wake_async_waiters()
+        return frame
+
+    def latest(self) -> Optional[CameraFrame]:
+        """The most recent frame without waiting, or None if there is none."""
+        frames = self.frames
+        return frames[-1] if frames else None
+
+    def get_after(
+        self, seq: int, timeout: Optional[float] = None, newest: bool = True
+    ) -> Optional[CameraFrame]:
+        """
+        Wait for a frame with a sequence number greater than `seq`.  If `newest`,
+        returns the most recent frame; otherwise returns the frame after `seq`,
+        or the oldest frame kept if that one is gone.  Returns None on timeout
+        or when closed.
+        """
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: self.is_closed or (self.frames and self.frames[-1].seq > seq),
+                timeout,
+            ):
+                return None
+            return self._frame_after(seq, newest)
+
+    async def wait_after(
+        self, seq: int, timeout: Optional[float] = None, newest: bool = True
+    ) -> Optional[CameraFrame]:
+        """
+        Like get_after() but waits without blocking the event loop.  The camera
+        thread wakes the waiting coroutine with call_soon_threadsafe.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            with self.condition:
+                if self.is_closed:
+                    return None
+                if self.frames and self.frames[-1].seq > seq:
+                    return self._frame_after(seq, newest)
+                waiter = (loop, loop.create_future())
+                self.async_waiters.append(waiter)
+            try:
+                remaining = None if deadline is None else deadline - loop.time()
+                await asyncio.wait_for(waiter[1], remaining)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                with self.condition:
+                    if waiter in self.async_waiters:
+                        self.async_waiters.remove(waiter)
+
+    def close(self) -> None:
+        """Wake all waiting consumers; get_after returns None from now on."""
+        with self.condition:
+            self.is_closed = True
+            self.condition.notify_all()
+            self._wake_async_waiters()
+
+    def _frame_after(self, seq: int, newest: bool) -> Optional[CameraFrame]:
+        if self.is_closed:
+            return None
+        if newest:
+            return self.frames[-1]
+        for frame in self.frames:
+            if frame.seq > seq:
+                return frame
+        return None  # not reached, the last frame is newer
+
+    def _wake_async_waiters(self) -> None:
+        waiters, self.async_waiters = self.async_waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_set_future_done, future)
+            except RuntimeError:
+                pass  # loop closed
+
+
+def _set_future_done(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class FrameConsumer:
+    """
+    Reads frames for one consumer, like the MJPEG stream or recognition, and
+    counts the frames it processed and the frames it missed.  Get one with
+    `camera.consumer(name)`.
+    """
+
+    def __init__(self, ring: FrameRing, name: str, newest: bool = True) -> None:
+        """
+        Args:
+
+        - ring: the frames of the camera
+        - name: identifies the consumer in BaseCamera.consumer_stats()
+        - newest: skip to the most recent frame (default), or read frames in
+            order as long as they are still in the ring, as a recorder would
+        """
+        self.ring = ring
+        self.name = name
+        self.newest = newest
+        self.last_seq = 0
+        self.frames = 0
+        self.dropped = 0
+
+    def next(self, timeout: Optional[float] = None) -> Optional[CameraFrame]:
+        """
+        Wait for the next frame.  Returns None on timeout or if the camera
+        is stopped.
+        """
+        return self._count(self.ring.get_after(self.last_seq, timeout, self.newest))
+
+    async def next_async(self, timeout: Optional[float] = None) -> Optional[CameraFrame]:
+        """Like next() but waits without blocking the event loop."""
+        frame = await self.ring.wait_after(self.last_seq, timeout, self.newest)
+        return self._count(frame)
+
+    def _count(self, frame: Optional[CameraFrame]) -> Optional[CameraFrame]:
+        if frame is None:
+            return None
+        if self.last_seq > 0:
+            self.dropped += frame.seq - self.last_seq - 1
+        self.last_seq = frame.seq
+        self.frames += 1
+        return frame
+
+    def stats(self) -> Dict[str, Any]:
+        return {"frames": self.frames, "dropped": self.dropped, "last_seq": self.last_seq}
 
 
 class BaseCamera(object):
     """
     BaseCamera is an abstract base class that for camera implementations.  It
-    creates a background thread that reads frames from the camera and signals
-    when a new frame is available.
+    creates a background thread that reads frames from the camera and keeps the
+    last BB_CAMERA_FRAME_BUFFER_SIZE frames, each with a sequence number and
+    capture timestamp.
+
+    Consumers can wait for a frame newer than the one they have:
+    ```python
+    camera = Camera()
+    frames = camera.consumer("my_consumer")
+    while True:
+        frame = frames.next(timeout=1)  # CameraFrame or None
+        ...
+    ```
+    or use `get_frame_after(seq, timeout)` and `latest()` directly.  Each
+    consumer's count of frames processed and missed is in consumer_stats().
+
+    From a coroutine, use `await camera.next_frame(seq)` or
+    `await frames.next_async()`, which wait without blocking the event loop.
     """
 
     thread: Optional[threading.Thread] = (
@@ -84,9 +212,15 @@ class BaseCamera(object):
         None  # current frame is stored here by background thread
     )
 
-    event = CameraEvent()
+    ring = FrameRing(c.BB_CAMERA_FRAME_BUFFER_SIZE)
     fps_stats = FpsStats()
 
+    # consumers by name; see consumer()
+    consumers: Dict[str, FrameConsumer] = {}
+    # `seq` of the last frame returned by get_frame() to each thread; thread
+    # local so that nothing is left behind by threads that have exited
+    get_frame_local = threading.local()
+
     is_stopped = False
 
     def __init__(self) -> None:
@@ -96,24 +230,61 @@ class BaseCamera(object):
             BaseCamera.thread = threading.Thread(target=self._thread)
             BaseCamera.thread.start()
 
-            # # wait until frames are available
-            # while self.get_frame() is None:
-            #     time.sleep(0)
-
     def get_frame(self) -> Optional[Union[bytes, np.ndarray]]:
-        """Return the current camera frame."""
-        # wait for a signal from the camera thread
+        """
+        Wait for a frame newer than the one last returned to the calling thread
+        and return it, or None if the camera is stopped.
+        """
         if BaseCamera.is_stopped:
             return None
 
-        BaseCamera.event.wait()
-        BaseCamera.event.clear()
+        local = BaseCamera.get_frame_local
+        frame = BaseCamera.ring.get_after(getattr(local, "seq", 0))
+        if frame is None:
+            return None
+        local.seq = frame.seq
+        return frame.image
+
+    def get_frame_after(
+        self, seq: int, timeout: Optional[float] = None
+    ) -> Optional[CameraFrame]:
+        """
+        Wait for the most recent frame if its sequence number is greater than
+        `seq`.  Returns None on timeout or if the camera is stopped.
+        """
+        return BaseCamera.ring.get_after(seq, timeout)
+
+    async def next_frame(
+        self, after_seq: int = 0, timeout: Optional[float] = None
+    ) -> Optional[CameraFrame]:
+        """
+        Await the most recent frame if its sequence number is greater than
+        `after_seq`, without blocking the event loop.  Returns None on timeout
+        or if the camera is stopped.
+        """
+        return await BaseCamera.ring.wait_after(after_seq, timeout)
 
-        return BaseCamera.frame
+    def latest(self) -> Optional[CameraFrame]:
+        """The most recent frame without waiting, or None before the first frame."""
+        return BaseCamera.ring.latest()
+
+    def consumer(self, name: str, newest: bool = True) -> FrameConsumer:
+        """
+        Return a FrameConsumer that reads frames and counts the frames it
+        misses.  See FrameConsumer.
+        """
+        consumer = FrameConsumer(BaseCamera.ring, name, newest)
+        BaseCamera.consumers[name] = consumer
+        return consumer
+
+    def remove_consumer(self, consumer: FrameConsumer) -> None:
+        """Remove a consumer that is done from consumer_stats()."""
+        if BaseCamera.consumers.get(consumer.name) is consumer:
+            del BaseCamera.consumers[consumer.name]
 
     def stop(self) -> None:
-        BaseCamera.event.set()  # wake up the threads to exit
         BaseCamera.is_stopped = True
+        BaseCamera.ring.close()  # wake up the threads to exit
 
     @staticmethod
     def frames() -> Generator[Union[bytes, np.ndarray], None, None]:
@@ -125,6 +296,11 @@ class BaseCamera(object):
         """Return the fps stats dictionary."""
         return cls.fps_stats.stats()
 
+    @classmethod
+    def consumer_stats(cls) -> Dict[str, Any]:
+        """Frames processed and dropped by each consumer, by name."""
+        return {name: consumer.stats() for name, consumer in cls.consumers.items()}
+
     @classmethod
     def _thread(cls) -> None:
         """Camera background thread."""
@@ -136,7 +312,7 @@ class BaseCamera(object):
                 log.debug("Stopping camera thread")
                 break
             BaseCamera.frame = frame
-            BaseCamera.event.set()  # send signal to clients
+            BaseCamera.ring.push(frame, time.time())  # wakes consumers
 
             BaseCamera.fps_stats.increment()
             time.sleep(0)
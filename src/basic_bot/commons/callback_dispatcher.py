@@ -0,0 +1,169 @@
+"""
+Runs callbacks on a pool of worker threads while keeping the calls for each
+"lane" (usually a state key) in order.
+
+HubStateMonitor calls on_state_update on the thread that reads the websocket.
+A slow callback, like one that moves servos, keeps the monitor from reading and
+the messages back up in central_hub.  Passing a CallbackDispatcher to the monitor
+moves the callbacks off of the reading thread:
+
+```python
+from basic_bot.commons.callback_dispatcher import CallbackDispatcher
+
+dispatcher = CallbackDispatcher(max_workers=2, latest_only_keys=["servo_angles"])
+monitor = HubStateMonitor(
+    hub_state, "servo_control", ["servo_angles", "servo_config"],
+    on_state_update=handle_state_update,
+    callback_dispatcher=dispatcher,
+)
+```
+
+Calls in the same lane run one at a time in the order dispatched; calls in
+different lanes may run at the same time on different workers.  In a "latest only"
+lane, a call still waiting to run is replaced by a newer one so that stale
+commands are skipped.
+
+`dispatcher.stats()` reports the queue depth, dropped calls and callback
+durations of each lane.
+"""
+
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Literal, Tuple, Union
+
+from basic_bot.commons import log
+
+Call = Tuple[Callable[..., Any], Tuple[Any, ...]]
+
+
+@dataclass
+class Lane:
+    """The pending calls and metrics of one lane."""
+
+    latest_only: bool
+    pending: Deque[Call] = field(default_factory=deque)
+    is_running: bool = False
+    calls: int = 0
+    dropped: int = 0
+    errors: int = 0
+    max_queued: int = 0
+    total_duration: float = 0.0
+    max_duration: float = 0.0
+    last_duration: float = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self.pending),
+            "max_queued": self.max_queued,
+            "calls": self.calls,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "avg_duration": self.total_duration / self.calls if self.calls else 0.0,
+            "max_duration": self.max_duration,
+            "last_duration": self.last_duration,
+        }
+
+
+class CallbackDispatcher:
+    """Per lane ordered dispatch of callbacks to a thread pool."""
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        latest_only_keys: Union[List[str], Literal["*"], None] = None,
+    ) -> None:
+        """
+        Args:
+
+        - max_workers: number of worker threads
+        - latest_only_keys: lanes that skip calls superseded by a newer call
+            before they start, or "*" for all lanes
+        """
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="bb_callback"
+        )
+        self.latest_only_keys = latest_only_keys or []
+        self.lanes: Dict[str, Lane] = {}
+        self.lock = threading.Lock()
+        self.is_shutdown = False
+
+    def dispatch(self, lane_key: str, fn: Callable[..., Any], *args: Any) -> None:
+        """
+        Queue `fn(*args)` to run after the calls already queued in the lane.
+        Does nothing after shutdown().
+        """
+        with self.lock:
+            if self.is_shutdown:
+                return
+            lane = self.lanes.get(lane_key)
+            if lane is None:
+                latest_only = (
+                    self.latest_only_keys == "*" or lane_key in self.latest_only_keys
+                )
+                lane = self.lanes[lane_key] = Lane(latest_only)
+
+            if lane.latest_only and lane.pending:
+                lane.dropped += len(lane.pending)
+                lane.pending.clear()
+            lane.pending.append((fn, args))
+            lane.max_queued = max(lane.max_queued, len(lane.pending))
+
+            if lane.is_running:
+                return
+            lane.is_running = True
+
+        try:
+            self.executor.submit(self._drain, lane_key, lane)
+        except RuntimeError:
+            # shut down since the lock was released
+            with self.lock:
+                lane.pending.clear()
+                lane.is_running = False
+
+    def _drain(self, lane_key: str, lane: Lane) -> None:
+        while True:
+            with self.lock:
+                if not lane.pending:
+                    lane.is_running = False
+                    return
+                fn, args = lane.pending.popleft()
+
+            started_at = time.monotonic()
+            try:
+                fn(*args)
+            except Exception:
+                lane.errors += 1
+                log.error(f"callback_dispatcher: error in callback for {lane_key}")
+                traceback.print_exc()
+            duration = time.monotonic() - started_at
+
+            lane.calls += 1
+            lane.last_duration = duration
+            lane.total_duration += duration
+            lane.max_duration = max(lane.max_duration, duration)
+
+    def queue_depth(self) -> int:
+        """Total number of calls waiting to run."""
+        with self.lock:
+            return sum(len(lane.pending) for lane in self.lanes.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lanes = {key: lane.stats() for key, lane in self.lanes.items()}
+        return {
+            "queue_depth": sum(lane["queued"] for lane in lanes.values()),
+            "dropped": sum(lane["dropped"] for lane in lanes.values()),
+            "lanes": lanes,
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the workers.  Calls still queued are not run."""
+        with self.lock:
+            self.is_shutdown = True
+            for lane in self.lanes.values():
+                lane.pending.clear()
+        self.executor.shutdown(wait=wait)
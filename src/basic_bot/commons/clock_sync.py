@@ -0,0 +1,121 @@
+"""
+NTP style estimation of the offset between the local clock and central_hub's clock.
+
+Each service uses its own wall clock, which may drift from other hosts, especially
+on a Raspberry Pi without an RTC shortly after boot.  central_hub replies to a
+`ping` that carries a `t0` timestamp with its own receive and send times:
+
+```json
+{"type": "ping", "data": {"t0": 1712345678.100}}
+{"type": "pong", "data": {"t0": 1712345678.100, "t1": 1712345679.350, "t2": 1712345679.351}}
+```
+
+When the pong arrives at local time `t3`:
+
+- round trip time = (t3 - t0) - (t2 - t1)
+- offset = ((t1 - t0) + (t2 - t3)) / 2
+
+The offset of the sample with the lowest round trip in the recent window is
+used as the estimate because that sample has the least queuing error.
+
+Usage:
+
+```python
+clock = ClockSync()
+await messages.send_ping(websocket, clock.ping_data())
+# ... when the pong is received
+clock.handle_pong(msg_data)
+hub_time = clock.to_hub_time(time.time())
+```
+
+HubStateMonitor does this periodically and exposes the estimate as
+`monitor.clock` and `monitor.clock_offset`.
+"""
+
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional
+
+
+@dataclass
+class ClockSample:
+    """One ping / pong exchange."""
+
+    offset: float
+    rtt: float
+    received_at: float
+
+
+class ClockSync:
+    """Keeps a window of ping / pong samples and the resulting offset estimate."""
+
+    def __init__(self, window: int = 8) -> None:
+        """
+        Args:
+
+        - window: the number of recent samples to choose the best estimate from
+        """
+        self.samples: Deque[ClockSample] = deque(maxlen=window)
+        self.best: Optional[ClockSample] = None
+
+    @property
+    def is_synced(self) -> bool:
+        """True once at least one pong has been received."""
+        return self.best is not None
+
+    @property
+    def offset(self) -> float:
+        """Seconds to add to local time to get hub time. 0 until synced."""
+        return self.best.offset if self.best else 0.0
+
+    @property
+    def rtt(self) -> Optional[float]:
+        """Round trip time in seconds of the sample used for the offset."""
+        return self.best.rtt if self.best else None
+
+    def ping_data(self) -> Dict[str, Any]:
+        """Returns the data to send with a `ping` message."""
+        return {"t0": time.time()}
+
+    def handle_pong(
+        self, data: Any, t3: Optional[float] = None
+    ) -> Optional[ClockSample]:
+        """
+        Add a sample from the `data` of a pong message.  Returns None if the pong
+        does not have timing data, for example in reply to a ping without `t0`.
+        """
+        t3 = time.time() if t3 is None else t3
+        if not isinstance(data, dict) or not all(k in data for k in ("t0", "t1", "t2")):
+            return None
+
+        t0, t1, t2 = float(data["t0"]), float(data["t1"]), float(data["t2"])
+        sample = ClockSample(
+            offset=((t1 - t0) + (t2 - t3)) / 2,
+            rtt=max((t3 - t0) - (t2 - t1), 0.0),
+            received_at=t3,
+        )
+        self.samples.append(sample)
+        self.best = min(self.samples, key=lambda s: s.rtt)
+        return sample
+
+    def to_hub_time(self, local_ts: float) -> float:
+        """Convert a local timestamp to hub time."""
+        return local_ts + self.offset
+
+    def from_hub_time(self, hub_ts: float) -> float:
+        """Convert a hub timestamp to local time."""
+        return hub_ts - self.offset
+
+    def hub_time(self) -> float:
+        """The current time in hub time."""
+        return self.to_hub_time(time.time())
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the current estimate as a dictionary."""
+        return {
+            "synced": self.is_synced,
+            "offset": self.offset,
+            "rtt": self.rtt,
+            "samples": len(self.samples),
+        }
@@ -126,5 +126,27 @@ config_file_schema = {
                 },
             },
         },
+        #
+        # Optional dtype and shape of state keys whose values are numeric
+        # arrays.  central_hub validates updates of these keys and stores them
+        # as NumPy arrays.  See basic_bot.commons.state_schema.
+        "state_schemas": {
+            "type": "object",
+            "additionalProperties": {
+                "type": "object",
+                "properties": {
+                    #
+                    # NumPy dtype name like "float32", "float64", "int16" or "uint8"
+                    "dtype": {"type": "string"},
+                    #
+                    # Length of each dimension; null for any length.
+                    # Example: [null, 4] for a list of any number of boxes
+                    "shape": {
+                        "type": "array",
+                        "items": {"type": ["integer", "null"]},
+                    },
+                },
+            },
+        },
     },
 }
@@ -61,6 +61,48 @@ BB_HUB_URI = f"ws://{BB_HUB_HOST}:{BB_HUB_PORT}/ws"
 This is the full URI to connect to the central_hub service websocket.
 """
 
+BB_HUB_HEARTBEAT_INTERVAL = env.env_float("BB_HUB_HEARTBEAT_INTERVAL", 2)
+"""
+In seconds, how often services ping central_hub to measure round trip time,
+event loop lag and the offset between the local clock and the hub clock.
+See basic_bot.commons.hub_heartbeat.
+"""
+
+BB_HUB_LAG_THRESHOLD = env.env_float("BB_HUB_LAG_THRESHOLD", 0.1)
+"""
+In seconds, central_hub flags a service as `lagging` in `subsystem_stats` when the
+event loop lag it reports is greater than this, or when its heartbeat is overdue
+by more than this.
+"""
+
+BB_RECONNECT_FIRST_DELAY = env.env_float("BB_RECONNECT_FIRST_DELAY", 0.25)
+"""
+In seconds, the most that hub clients wait before the first attempt to reconnect
+after losing the connection.  The actual wait is random up to this value so
+that services don't all reconnect at the same moment.
+See basic_bot.commons.reconnect_policy.
+"""
+
+BB_RECONNECT_BASE_DELAY = env.env_float("BB_RECONNECT_BASE_DELAY", 0.5)
+"""
+In seconds, the wait before the second attempt to reconnect.  The wait doubles
+for each following attempt up to BB_RECONNECT_MAX_DELAY.
+"""
+
+BB_RECONNECT_MAX_DELAY = env.env_float(
+    "BB_RECONNECT_MAX_DELAY", 0.5 if BB_ENV == "test" else 30.0
+)
+"""
+In seconds, the longest wait between attempts to reconnect.
+"""
+
+BB_TRACE_FILE = env.env_string("BB_TRACE_FILE", "")
+"""
+When set, services write latency spans for traced state updates to this file
+in Chrome trace / Perfetto JSON format.  All services can share the same file.
+See basic_bot.commons.tracing.  Tracing is disabled by default.
+"""
+
 # =============== Motor Control Service Constants
 
 BB_MOTOR_I2C_ADDRESS = env.env_int("BB_MOTOR_I2C_ADDRESS", 0x60)
@@ -125,6 +167,12 @@ BB_CAMERA_FPS = env.env_int("BB_CAMERA_FPS", 30)
 The camera setting frames per second.
 """
 
+BB_CAMERA_FRAME_BUFFER_SIZE = env.env_int("BB_CAMERA_FRAME_BUFFER_SIZE", 4)
+"""
+The number of most recent camera frames kept by the camera for consumers
+that fall behind.  See basic_bot.commons.base_camera.
+"""
+
 BB_VISION_WIDTH = env.env_int("BB_VISION_WIDTH", 640)
 """
 In pixels, this is the width of the camera frame to capture.
@@ -213,6 +261,62 @@ BB_DISABLE_RECOGNITION_PROVIDER = env.env_bool("BB_DISABLE_RECOGNITION_PROVIDER"
 Set this to True to disable the recognition provider.
 """
 
+BB_RECOGNITION_WORKERS = env.env_int("BB_RECOGNITION_WORKERS", 0)
+"""
+Number of worker processes that run object detection for the recognition
+provider.  0 (default) runs detection in a thread of the vision process.
+Each worker loads its own copy of the model and is passed frames through
+shared memory.  See basic_bot.commons.detection_pool.
+"""
+
+BB_RECOGNITION_WORKER_TIMEOUT = env.env_float("BB_RECOGNITION_WORKER_TIMEOUT", 10)
+"""
+Seconds that a detection worker process may spend on one frame before it is
+considered hung and is restarted.
+"""
+
+BB_MOTION_GATE = env.env_bool("BB_MOTION_GATE", False)
+"""
+Set this to True to only run object detection on frames that differ from the
+last frame detected, or the frame before them, by more than
+BB_MOTION_THRESHOLD, or when BB_MOTION_MAX_INTERVAL seconds have passed since
+the last detection.  The recognition provider publishes whether the scene is
+changing as the `motion` key.  See basic_bot.commons.motion_detector.
+"""
+
+BB_MOTION_THRESHOLD = env.env_float("BB_MOTION_THRESHOLD", 0.01)
+"""
+Fraction, 0 - 1, of a downscaled grayscale frame that must have changed to be
+motion.  Used with BB_MOTION_GATE.
+"""
+
+BB_MOTION_MAX_INTERVAL = env.env_float("BB_MOTION_MAX_INTERVAL", 5)
+"""
+In seconds, the longest that object detection is skipped by BB_MOTION_GATE when
+nothing changes.
+"""
+
+BB_OBJECT_TRACKING = env.env_bool("BB_OBJECT_TRACKING", False)
+"""
+Set this to True to track the objects detected by the recognition provider
+across frames.  Each object in `recognition` gets a `track_id` and a `velocity`,
+and between detections the predicted boxes of the tracked objects are published
+for every camera frame.  See basic_bot.commons.object_tracker.
+"""
+
+BB_TRACKING_IOU_THRESHOLD = env.env_float("BB_TRACKING_IOU_THRESHOLD", 0.3)
+"""
+Minimum intersection over union, 0 - 1, of a detected object's bounding box
+with the predicted box of a tracked object for them to be the same object.
+"""
+
+BB_TRACKING_MAX_AGE = env.env_float("BB_TRACKING_MAX_AGE", 1)
+"""
+In seconds, how long a tracked object is kept, and its box predicted, after it
+was last detected.  Frames skipped by BB_MOTION_GATE because nothing moved count
+as detections of the tracked objects where they were last seen.
+"""
+
 BB_VIDEO_PATH = env.env_string("BB_VIDEO_PATH", "./recorded_video")
 """
 The path where the vision service saves recorded video.
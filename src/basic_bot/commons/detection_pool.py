@@ -0,0 +1,289 @@
+"""
+Runs object detection in worker processes so that inference does not compete
+with capture, streaming and the rest of the vision service for one GIL.
+
+Each worker process loads its own detector and has one shared memory slot
+that the parent copies frames into, so frames are never pickled.  Only the
+frame's shape and sequence number are sent to the worker, and the detected
+objects are sent back with the sequence number over a pipe.
+
+```python
+from basic_bot.commons.detection_pool import DetectionPool
+
+pool = DetectionPool(num_workers=2)
+pool.start()
+while True:
+    frame = frames.next()
+    pool.submit(frame)  # False if all workers are busy
+    for result in pool.get_results(timeout=0.01):
+        print(result.seq, result.objects)
+pool.stop()
+```
+
+Workers that crash, or take longer than BB_RECOGNITION_WORKER_TIMEOUT seconds
+to detect a frame, are restarted.  Enable in the vision service by setting
+BB_RECOGNITION_WORKERS to the number of workers.
+"""
+
+import importlib
+import multiprocessing
+import multiprocessing.connection
+import time
+import traceback
+from dataclasses import dataclass, field
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from basic_bot.commons import constants as c, log
+from basic_bot.commons.base_camera import CameraFrame
+
+DEFAULT_DETECTOR = "basic_bot.commons.tflite_detect.TFLiteDetect"
+
+# forked children would inherit the threads and locks of the vision service
+_mp = multiprocessing.get_context("spawn")
+
+
+@dataclass
+class DetectionResult:
+    """The objects detected in a frame by a worker."""
+
+    seq: int
+    objects: List[Dict[str, Any]]
+    # shape of the frame
+    shape: Tuple[int, ...]
+    # capture time of the frame
+    timestamp: float
+    # seconds the worker spent detecting
+    duration: float
+    worker: int
+
+
+@dataclass
+class _Worker:
+    index: int
+    shm: SharedMemory
+    process: Any = None
+    conn: Any = None
+    # sequence number of the frame being detected, or None if idle
+    busy_seq: Optional[int] = None
+    busy_since: float = 0.0
+    # capture time of the frame being detected
+    busy_timestamp: float = 0.0
+    frames: int = 0
+    restarts: int = 0
+    durations: List[float] = field(default_factory=list)
+
+
+class DetectionPool:
+    """A pool of detection worker processes fed through shared memory."""
+
+    def __init__(
+        self,
+        num_workers: Optional[int] = None,
+        detector: str = DEFAULT_DETECTOR,
+        slot_size: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """
+        Args:
+
+        - num_workers: number of worker processes; default BB_RECOGNITION_WORKERS
+        - detector: import path of the detector class that each worker
+            instantiates; it must have a `get_prediction(frame)` method
+        - slot_size: bytes of shared memory for each worker's frame; defaults
+            to the size of a BB_VISION_WIDTH x BB_VISION_HEIGHT BGR frame.
+            Frames that are larger are skipped.
+        - timeout: seconds a worker may spend on a frame before it is
+            terminated and restarted; default BB_RECOGNITION_WORKER_TIMEOUT
+        """
+        self.num_workers = max(1, num_workers or c.BB_RECOGNITION_WORKERS)
+        self.detector = detector
+        self.slot_size = slot_size or c.BB_VISION_WIDTH * c.BB_VISION_HEIGHT * 3
+        self.timeout = c.BB_RECOGNITION_WORKER_TIMEOUT if timeout is None else timeout
+        self.workers: List[_Worker] = []
+        self.is_stopped = False
+        self.skipped_too_large = 0
+
+    def start(self) -> None:
+        """Start the worker processes."""
+        for index in range(self.num_workers):
+            worker = _Worker(index, SharedMemory(create=True, size=self.slot_size))
+            self.workers.append(worker)
+            self._start_worker(worker)
+
+    def stop(self) -> None:
+        """Stop the workers and release their shared memory."""
+        self.is_stopped = True
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            try:
+                worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(timeout=2)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+                worker.conn.close()
+            worker.shm.close()
+            worker.shm.unlink()
+        self.workers = []
+
+    def idle_workers(self) -> int:
+        return sum(1 for worker in self.workers if worker.busy_seq is None)
+
+    def submit(self, frame: CameraFrame) -> bool:
+        """
+        Copy the frame to the shared memory of an idle worker and have it
+        detect objects in the frame.  Returns False, without waiting, if no
+        worker is idle.
+        """
+        self._restart_dead_workers()
+        worker = next((w for w in self.workers if w.busy_seq is None), None)
+        if worker is None:
+            return False
+
+        image = np.asarray(frame.image)
+        if image.nbytes > self.slot_size:
+            self.skipped_too_large += 1
+            log.error(
+                f"detection_pool: skipping {image.shape} frame larger than slot_size"
+            )
+            return False
+
+        slot: np.ndarray = np.ndarray(image.shape, dtype=image.dtype, buffer=worker.shm.buf)
+        slot[...] = image
+        try:
+            worker.conn.send((frame.seq, image.shape, image.dtype.str))
+        except (BrokenPipeError, OSError):
+            # the worker died since _restart_dead_workers(); it is
+            # restarted on the next call
+            log.error(f"detection_pool: worker {worker.index} is not running")
+            worker.busy_seq = None
+            return False
+        worker.busy_seq = frame.seq
+        worker.busy_since = time.time()
+        worker.busy_timestamp = frame.timestamp
+        return True
+
+    def get_results(self, timeout: Optional[float] = 0) -> List[DetectionResult]:
+        """
+        Results of the workers that have finished, waiting up to `timeout`
+        seconds for at least one.  Results from several workers may not be
+        in the order the frames were submitted.
+        """
+        self._restart_dead_workers()
+        busy = [w for w in self.workers if w.busy_seq is not None]
+        if not busy:
+            return []
+
+        ready = multiprocessing.connection.wait([w.conn for w in busy], timeout)
+        results = []
+        for worker in busy:
+            if worker.conn not in ready:
+                continue
+            try:
+                seq, objects, shape, duration = worker.conn.recv()
+            except (EOFError, OSError):
+                continue  # restarted on the next call
+            worker.busy_seq = None
+            worker.frames += 1
+            worker.durations = (worker.durations + [duration])[-30:]
+            results.append(
+                DetectionResult(
+                    seq,
+                    objects,
+                    tuple(shape),
+                    worker.busy_timestamp,
+                    duration,
+                    worker.index,
+                )
+            )
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": [
+                {
+                    "frames": worker.frames,
+                    "restarts": worker.restarts,
+                    "busy": worker.busy_seq is not None,
+                    "avg_duration": (
+                        sum(worker.durations) / len(worker.durations)
+                        if worker.durations
+                        else 0.0
+                    ),
+                }
+                for worker in self.workers
+            ],
+            "skipped_too_large": self.skipped_too_large,
+        }
+
+    def _start_worker(self, worker: _Worker) -> None:
+        parent_conn, child_conn = _mp.Pipe()
+        worker.conn = parent_conn
+        worker.busy_seq = None
+        worker.process = _mp.Process(
+            target=_worker_main,
+            args=(child_conn, worker.shm.name, self.detector),
+            name=f"detection_worker_{worker.index}",
+            daemon=True,
+        )
+        worker.process.start()
+        child_conn.close()
+
+    def _restart_dead_workers(self) -> None:
+        """Restart the workers that have exited or are hung."""
+        if self.is_stopped:
+            return
+        now = time.time()
+        for worker in self.workers:
+            if worker.process.is_alive():
+                if worker.busy_seq is None or now - worker.busy_since < self.timeout:
+                    continue
+                log.error(
+                    f"detection_pool: worker {worker.index} is hung on frame "
+                    f"{worker.busy_seq}; terminating"
+                )
+                worker.process.terminate()
+                worker.process.join(timeout=2)
+                if worker.process.is_alive():
+                    worker.process.kill()
+                    worker.process.join()
+            log.error(
+                f"detection_pool: worker {worker.index} exited with "
+                f"{worker.process.exitcode}; restarting"
+            )
+            worker.conn.close()
+            worker.restarts += 1
+            self._start_worker(worker)
+
+
+def _worker_main(conn: Any, shm_name: str, detector_path: str) -> None:
+    """Entry point of the worker processes."""
+    module_name, class_name = detector_path.rsplit(".", 1)
+    detector = getattr(importlib.import_module(module_name), class_name)()
+    shm = SharedMemory(name=shm_name)
+    try:
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            seq, shape, dtype = request
+            frame: np.ndarray = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            started_at = time.time()
+            try:
+                objects = detector.get_prediction(frame)
+            except Exception:
+                traceback.print_exc()
+                objects = []
+            conn.send((seq, objects, shape, time.time() - started_at))
+            del frame  # release the view of shm.buf
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        shm.close()
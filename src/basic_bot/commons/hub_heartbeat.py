@@ -0,0 +1,148 @@
+"""
+Periodic pings from services to central_hub that measure round trip time and
+detect a blocked asyncio event loop.
+
+Every `BB_HUB_HEARTBEAT_INTERVAL` seconds, HubHeartbeat sends a `ping` with a `t0`
+timestamp plus the stats measured so far:
+
+```json
+{
+    "type": "ping",
+    "data": {
+        "t0": 1712345678.100,
+        "interval": 2.0,
+        "rtt": 0.0004,
+        "jitter": 0.0001,
+        "loop_lag": 0.0002
+    }
+}
+```
+
+`loop_lag` is how much later than requested the heartbeat's own `asyncio.sleep`
+returned.  A service whose event loop is blocked, for example by a blocking
+`camera.get_frame()` call, will show a large loop lag and long gaps between pings.
+
+central_hub records these stats for each identity in `subsystem_stats` and flags
+services that are lagging.  The pong replies are used to update the round trip
+stats and the clock offset estimate (see basic_bot.commons.clock_sync).
+
+Usage:
+
+```python
+heartbeat = HubHeartbeat()
+asyncio.create_task(heartbeat.run(websocket))
+...
+# for each message received:
+if msg["type"] == "pong":
+    heartbeat.handle_pong(msg.get("data"))
+```
+
+For services that only publish and never read from the websocket, use
+`asyncio.create_task(heartbeat.consume(websocket))` to read and handle the pongs.
+HubStateMonitor does all of this for you.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Dict, Optional
+
+import websockets
+from websockets.client import WebSocketClientProtocol
+
+from basic_bot.commons import constants as c, messages
+from basic_bot.commons.clock_sync import ClockSync
+
+# weight of the newest sample in the moving averages
+SMOOTHING = 1 / 8
+
+
+class HubHeartbeat:
+    """Sends pings and keeps round trip time, jitter and loop lag stats."""
+
+    def __init__(
+        self, clock: Optional[ClockSync] = None, interval: Optional[float] = None
+    ) -> None:
+        """
+        Args:
+
+        - clock: optional ClockSync to update with each pong.  One is created if
+            not provided.
+        - interval: seconds between pings; defaults to BB_HUB_HEARTBEAT_INTERVAL
+        """
+        self.clock = clock or ClockSync()
+        self.interval = interval if interval is not None else c.BB_HUB_HEARTBEAT_INTERVAL
+        self.rtt: Optional[float] = None
+        self.jitter: float = 0.0
+        self.loop_lag: float = 0.0
+        self.max_loop_lag: float = 0.0
+        self.pongs_received = 0
+        self.is_stopping = False
+
+    def stop(self) -> None:
+        self.is_stopping = True
+
+    def ping_data(self) -> Dict[str, Any]:
+        """Returns the data to send with the next `ping` message."""
+        data = self.clock.ping_data()
+        data["interval"] = self.interval
+        data["loop_lag"] = self.loop_lag
+        if self.rtt is not None:
+            data["rtt"] = self.rtt
+            data["jitter"] = self.jitter
+        return data
+
+    def handle_pong(self, data: Any) -> None:
+        """Update the round trip stats from the `data` of a received pong."""
+        sample = self.clock.handle_pong(data)
+        if sample is None:
+            return
+
+        self.pongs_received += 1
+        if self.rtt is None:
+            self.rtt = sample.rtt
+        else:
+            # RFC 3550 style interarrival jitter
+            self.jitter += (abs(sample.rtt - self.rtt) - self.jitter) * SMOOTHING
+            self.rtt += (sample.rtt - self.rtt) * SMOOTHING
+
+    async def run(self, websocket: WebSocketClientProtocol) -> None:
+        """Send pings until the websocket is closed or stop() is called."""
+        try:
+            # a quick burst on connect gives a usable clock estimate right away
+            for _i in range(4):
+                await messages.send_ping(websocket, self.ping_data())
+                await asyncio.sleep(0.05)
+
+            while not self.is_stopping:
+                sleep_started = time.monotonic()
+                await asyncio.sleep(self.interval)
+                self.loop_lag = max(time.monotonic() - sleep_started - self.interval, 0)
+                self.max_loop_lag = max(self.max_loop_lag, self.loop_lag)
+                await messages.send_ping(websocket, self.ping_data())
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def consume(self, websocket: WebSocketClientProtocol) -> None:
+        """
+        Read all messages from the websocket and handle the pongs.  For services
+        that publish but never otherwise read from the websocket.
+        """
+        try:
+            async for message in websocket:
+                msg = json.loads(message)
+                if msg.get("type") == "pong":
+                    self.handle_pong(msg.get("data"))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the heartbeat stats as a dictionary."""
+        return {
+            "rtt": self.rtt,
+            "jitter": self.jitter,
+            "loop_lag": self.loop_lag,
+            "max_loop_lag": self.max_loop_lag,
+            "pongs_received": self.pongs_received,
+            "clock": self.clock.stats(),
+        }
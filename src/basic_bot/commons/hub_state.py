@@ -1,8 +1,52 @@
 import json
+import threading
 import time
-from typing import Dict, Any, List, Optional
+from types import MappingProxyType
+from typing import Dict, Any, List, Mapping, Optional, Tuple
+
+import numpy as np
 
 import basic_bot.commons.log as log
+from basic_bot.commons.messages import Blob, json_default
+from basic_bot.commons.state_schema import ArraySchema
+
+# separates the keys of a path selector like "subsystem_stats.vision.online"
+PATH_SEPARATOR = "."
+
+# returned by get_path and resolve_path when asked to tell a missing path
+# apart from a path with a value of None
+MISSING = object()
+
+
+def is_path(key: str) -> bool:
+    """True if key is a path selector into the value of a top level key."""
+    return PATH_SEPARATOR in key
+
+
+def path_root(path: str) -> str:
+    """The top level state key of a path selector."""
+    return path.split(PATH_SEPARATOR, 1)[0]
+
+
+def resolve_path(value: Any, segments: List[str], default: Any = None) -> Any:
+    """
+    Follow path `segments` into a value of nested dictionaries and lists.
+    Segments that are integers index lists.  Returns `default` if the path
+    does not exist.
+    """
+    for segment in segments:
+        if isinstance(value, dict):
+            if segment not in value:
+                return default
+            value = value[segment]
+        elif isinstance(value, (list, tuple, np.ndarray)):
+            try:
+                value = value[int(segment)]
+            except (ValueError, IndexError):
+                return default
+        else:
+            return default
+    return value
 
 
 class HubState:
@@ -10,45 +54,164 @@ class HubState:
     This class manages the local state of the hub.  It is initialized with a default
     initial state and can be updated with new state data.
 
+    Updates are copy-on-write: each update makes a new top level dictionary with
+    the changed keys and swaps it in with a single assignment, leaving the
+    previous dictionary untouched.  `hub_state.state` is therefore a consistent
+    snapshot that other threads can read without locks, and a reference to it
+    will not change under the reader:
+
+    ```python
+    state = hub_state.state  # or hub_state.snapshot() for a read only view
+    pan, tilt = state["servo_angles"]["pan"], state["servo_angles"]["tilt"]
+    ```
+
+    Don't modify `state`, or the values in it, in place; use update() so that
+    readers holding a previous snapshot are not affected.  Values are shared
+    between snapshots so the cost of an update is the copy of the top level
+    keys, not of the whole state.
+
+    Keys may have an ArraySchema (see basic_bot.commons.state_schema).  Their
+    values are validated by update() and stored as read only NumPy arrays.
     """
 
-    def __init__(self, default_state: Dict[str, Any] = {}) -> None:
+    def __init__(
+        self,
+        default_state: Dict[str, Any] = {},
+        schemas: Optional[Dict[str, ArraySchema]] = None,
+    ) -> None:
         """
-        Initializes the hub state with the default state.
+        Initializes the hub state with the default state and optional schemas
+        by state key.
         """
-        self.state: Dict[str, Any] = {}
-        self.state.update(default_state)
+        self.schemas: Dict[str, ArraySchema] = dict(schemas or {})
+        # (version, state) swapped as one so that they always agree
+        self._current: Tuple[int, Dict[str, Any]] = (
+            0,
+            self._apply_schemas(dict(default_state)),
+        )
+        # serializes writers; readers never lock
+        self._write_lock = threading.Lock()
+        # binary data of keys updated via blob frames; state[key] has the Blob.ref()
+        self.blobs: Dict[str, Blob] = {}
         log.info(f"hub_state initialized with {self.state}")
 
+    @property
+    def state(self) -> Dict[str, Any]:
+        """The current state.  Treat as read only, see class comment."""
+        return self._current[1]
+
+    @property
+    def version(self) -> int:
+        """Incremented with every update."""
+        return self._current[0]
+
+    def snapshot(self) -> Mapping[str, Any]:
+        """A read only view of the current state that never changes."""
+        return MappingProxyType(self._current[1])
+
+    def versioned_snapshot(self) -> Tuple[int, Mapping[str, Any]]:
+        """The version and snapshot() of the current state, read together."""
+        version, state = self._current
+        return version, MappingProxyType(state)
+
+    def set_schemas(self, schemas: Dict[str, ArraySchema]) -> None:
+        """Add or replace the schemas of keys and apply them to current values."""
+        with self._write_lock:
+            self.schemas = {**self.schemas, **schemas}
+            version, state = self._current
+            self._current = (version + 1, self._apply_schemas(dict(state)))
+
+    def update(self, key_values: Dict[str, Any], touch: bool = True) -> int:
+        """
+        Replace the values of the keys in `key_values`.  If `touch` is true, also
+        sets `{key}_updated_at` to the current time for each key.  Returns the
+        new version.
+
+        Raises state_schema.SchemaError, without changing the state, if a value
+        does not match the schema of its key.
+        """
+        changes = self._apply_schemas(dict(key_values))
+        if touch:
+            now = time.time()
+            for key in key_values:
+                changes[f"{key}_updated_at"] = now
+        with self._write_lock:
+            version, state = self._current
+            new_state = dict(state)
+            new_state.update(changes)
+            self._current = (version + 1, new_state)
+            return version + 1
+
+    def _apply_schemas(self, key_values: Dict[str, Any]) -> Dict[str, Any]:
+        if self.schemas:
+            for key, value in key_values.items():
+                schema = self.schemas.get(key)
+                if schema is not None and value is not None:
+                    key_values[key] = schema.coerce(key, value)
+        return key_values
+
     def get(self, keys_requested: List[str]) -> Dict[str, Any]:
-        """Return the requested state data for a list of state keys."""
+        """
+        Return the requested state data for a list of state keys.
+
+        Keys may also be path selectors like "servo_actual_angles.pan" in
+        which case the returned dictionary has the path as the key and the
+        selected sub-value as the value.
+        """
+        state = self.state
         requested_state = None
         if keys_requested:
-            requested_state = {
-                key: self.state[key] for key in keys_requested if key in self.state
-            }
+            requested_state = {}
+            for key in keys_requested:
+                if key in state:
+                    requested_state[key] = state[key]
+                elif is_path(key):
+                    root, *segments = key.split(PATH_SEPARATOR)
+                    value = resolve_path(state.get(root, MISSING), segments, MISSING)
+                    if value is not MISSING:
+                        requested_state[key] = value
         else:
-            requested_state = self.state
+            requested_state = state
         return requested_state
 
+    def get_path(self, path: str, default: Any = None) -> Any:
+        """
+        Return the value at a path selector like "subsystem_stats.vision.online"
+        or `default` if the path does not exist.
+        """
+        root, *segments = path.split(PATH_SEPARATOR)
+        state = self.state
+        if root not in state:
+            return default
+        return resolve_path(state[root], segments, default)
+
     def update_state_from_message_data(self, message_data: Dict[str, Any]) -> None:
         """Update state from received message data."""
-        for key, data in message_data.items():
-            self.state[key] = data
-            self.state[f"{key}_updated_at"] = time.time()
+        self.update(message_data)
+
+    def update_blob(self, key: str, blob: Blob) -> Dict[str, Any]:
+        """
+        Store the blob for a key and set the state of the key to the json
+        reference of the blob.  Returns the reference.
+        """
+        self.blobs = {**self.blobs, key: blob}
+        ref = blob.ref()
+        self.update({key: ref})
+        return ref
+
+    def get_blob(self, key: str) -> Optional[Blob]:
+        """Return the blob for a key or None."""
+        return self.blobs.get(key)
 
     def serialize_state(self, keys_requested: Optional[List[str]] = None) -> str:
         """Serialize the current state to JSON."""
 
-        keys_requested = keys_requested or list(self.state.keys())
-        requested_state = self.state
-        if keys_requested:
-            requested_state = {
-                key: self.state[key] for key in keys_requested if key in self.state
-            }
+        requested_state = self.get(keys_requested or [])
 
         try:
-            return json.dumps({"type": "state", "data": requested_state})
+            return json.dumps(
+                {"type": "state", "data": requested_state}, default=json_default
+            )
         except json.JSONDecodeError as e:
             log.error(f"Failed to serialize state: {e}")
             return json.dumps({"type": "state", "data": {}})
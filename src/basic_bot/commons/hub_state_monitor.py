@@ -1,19 +1,22 @@
 import threading
 import asyncio
+import concurrent.futures
 import websockets
 import traceback
 import json
 from contextlib import asynccontextmanager
 
-from typing import Any, Callable, Optional, List, AsyncGenerator, Union, Literal
+from typing import Any, Callable, Dict, Optional, List, AsyncGenerator, Union, Literal
 from websockets.client import WebSocketClientProtocol
 
-from basic_bot.commons import constants as c, messages, log
+from basic_bot.commons import constants as c, messages, log, tracing
+from basic_bot.commons.callback_dispatcher import CallbackDispatcher
+from basic_bot.commons.hub_heartbeat import HubHeartbeat
 from basic_bot.commons.hub_state import HubState
-
-
-# TODO: This class should maybe be a singleton.
-should_exit = False
+from basic_bot.commons.reconnect_policy import ReconnectPolicy
+from basic_bot.commons.state_publisher import StatePublisher
+from basic_bot.commons.state_schema import SchemaError
+from basic_bot.commons.tracing import TraceContext
 
 
 class HubStateMonitor:
@@ -45,6 +48,40 @@ class HubStateMonitor:
     to the "test_key" key from the central hub and updates the local state with the
     new value.
 
+    If a received state update carries a trace context (see basic_bot.commons.tracing),
+    the monitor stamps `<identity>.deliver` when the message is received and
+    `<identity>.callback_done` after the callback returns.  While the callback
+    runs, `tracing.current_trace()` returns the trace so that it can be continued
+    by any state update the callback sends.
+
+    While connected, the monitor periodically pings central_hub to measure the
+    round trip time and event loop lag (see basic_bot.commons.hub_heartbeat) which
+    central_hub records in `subsystem_stats`, and to estimate the offset between
+    the local clock and the hub clock.  The estimate is available via
+    `monitor.clock` (see basic_bot.commons.clock_sync) and `monitor.clock_offset`.
+    Trace stamps added by the monitor are converted to hub time.
+
+    Keys in `blob_keys` are received as binary frames instead of json (see
+    "Binary blobs" in basic_bot.services.central_hub).  The on_state_update
+    callback is called with a msg_type of "blobUpdate" and data of
+    `{key: messages.Blob}`, and the blob is stored via `hub_state.update_blob`.
+
+    To send state updates, use `monitor.publish({"key": value})` which may be
+    called from any thread or coroutine:
+    ```python
+    monitor.publish({"vision": {"recording": True}})
+    # or, to wait until the update has been sent
+    monitor.publish({"vision": {"recording": True}}).result(timeout=1)
+    ```
+    Publishes are sent on the monitor's event loop.  Publishes made before the
+    loop gets to them, or while disconnected, are merged into one `updateState`
+    message; later values of a key replace earlier ones.
+
+    Each HubStateMonitor has its own connection and thread.  To share one
+    connection among the components of a process, see
+    basic_bot.commons.shared_hub_client.  For blocking reads of the latest
+    values from synchronous code, see basic_bot.commons.sync_hub_client.
+
     For a more complex example using callbacks, see [usage in daphbot example - daphbot_service](https://github.com/littlebee/daphbot-due/blob/aa7ed90d60df33009c5bd252c31fa0fb25076fad/src/daphbot_service.py#L75)
 
     """
@@ -70,18 +107,27 @@ class HubStateMonitor:
                 None,
             ]
         ] = None,
+        blob_keys: Optional[List[str]] = None,
+        callback_dispatcher: Optional[CallbackDispatcher] = None,
     ) -> None:
         """
         Instantiate a HubStateMonitor object.
 
         Note that subscribed_keys may be an empty list if you just want to
         publish state updates to the central hub and not receive any state updates.
+
+        If a `callback_dispatcher` is provided, on_state_update is called on its
+        worker threads, once for each key of a message with only the data of
+        that key, in order per key.  The callback then runs after the update
+        has been applied to hub_state.  See basic_bot.commons.callback_dispatcher.
         """
         self.hub_state = hub_state
         self.identity = identity
         self.subscribed_keys = subscribed_keys
         self.on_state_update = on_state_update
         self.on_connect = on_connect
+        self.blob_keys = blob_keys or []
+        self.callback_dispatcher = callback_dispatcher
 
         # background thread connects to central_hub and listens for state updates
         self.thread = threading.Thread(target=self._thread)
@@ -89,17 +135,201 @@ class HubStateMonitor:
         # web socket if we are connected, None otherwise
         self.connected_socket: Optional[WebSocketClientProtocol] = None
 
+        # the event loop of the background thread once started
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.should_exit = False
+
+        # key values published but not yet sent; see publish()
+        self.publish_lock = threading.Lock()
+        self.pending_publish: Dict[str, Any] = {}
+        self.pending_futures: List[concurrent.futures.Future] = []
+        self.pending_trace: Optional[TraceContext] = None
+        self.flush_scheduled = False
+
+        # pings central_hub for round trip stats and the estimate of local
+        # clock vs central_hub clock
+        self.heartbeat = HubHeartbeat()
+        self.clock = self.heartbeat.clock
+
+        # backoff with jitter between attempts to reconnect
+        self.reconnect_policy = ReconnectPolicy()
+
+        # reset on connect so that they send the next value of each key
+        self.publishers: List[StatePublisher] = []
+
     def start(self) -> None:
-        global should_exit
         """Starts the background thread that listens for state updates and updates HubState"""
+        self.should_exit = False
         self.thread.start()
-        should_exit = False
 
     def stop(self) -> None:
-        global should_exit
         """Stops the background thread that listens for state updates and updates HubState"""
         log.info("Stopping hub_state_monitor thread.")
-        should_exit = True
+        self.should_exit = True
+        self.heartbeat.stop()
+        if self.callback_dispatcher:
+            self.callback_dispatcher.shutdown(wait=False)
+        # closing the socket wakes the thread if it is waiting on a message
+        if self.loop and self.connected_socket and not self.loop.is_closed():
+            try:
+                asyncio.run_coroutine_threadsafe(self.connected_socket.close(), self.loop)
+            except RuntimeError:
+                pass  # loop already stopped
+
+    def publish(
+        self, key_values: Dict[str, Any], trace: Optional[TraceContext] = None
+    ) -> concurrent.futures.Future:
+        """
+        Send an `updateState` message to central_hub with the key values.  May be
+        called from any thread or coroutine and does not block.
+
+        Returns a concurrent.futures.Future that is resolved once the update
+        has been sent.  Use `asyncio.wrap_future()` to await it from a coroutine.
+        If not connected, the update is sent once connected.
+        """
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self.publish_lock:
+            self.pending_publish.update(key_values)
+            self.pending_futures.append(future)
+            if trace is not None:
+                self.pending_trace = trace
+            schedule = not self.flush_scheduled
+            self.flush_scheduled = True
+
+        if schedule:
+            self._schedule_flush()
+        return future
+
+    def _apply_schemas(self, msg_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The message data with the values of keys that have a schema in
+        hub_state coerced to it, and without the keys whose values don't match.
+        """
+        schemas = self.hub_state.schemas
+        if not schemas:
+            return msg_data
+        valid = {}
+        for key, value in msg_data.items():
+            schema = schemas.get(key)
+            if schema is not None and value is not None:
+                try:
+                    value = schema.coerce(key, value)
+                except SchemaError as e:
+                    log.error(f"hub_state_monitor: dropped value that failed schema: {e}")
+                    continue
+            valid[key] = value
+        return valid
+
+    def add_publisher(self, publisher: StatePublisher) -> None:
+        """
+        Reset the StatePublisher, which forgets the values it has sent, each
+        time the monitor connects to central_hub.
+        """
+        self.publishers.append(publisher)
+
+    def _schedule_flush(self) -> None:
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            # flushed when the loop starts and connects
+            return
+        try:
+            loop.call_soon_threadsafe(lambda: loop.create_task(self._flush_publish()))
+        except RuntimeError:
+            pass  # loop closed since checked
+
+    async def _flush_publish(self) -> None:
+        websocket = self.connected_socket
+        if websocket is None:
+            # keep pending until connected; see monitor_state
+            with self.publish_lock:
+                self.flush_scheduled = False
+            return
+
+        with self.publish_lock:
+            key_values = self.pending_publish
+            futures = self.pending_futures
+            trace = self.pending_trace
+            self.pending_publish = {}
+            self.pending_futures = []
+            self.pending_trace = None
+            self.flush_scheduled = False
+
+        if not key_values:
+            return
+        try:
+            await messages.send_update_state(
+                websocket, key_values, trace=trace, clock=self.clock
+            )
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+        else:
+            for future in futures:
+                future.set_result(None)
+
+    def _cancel_pending_publish(self) -> None:
+        with self.publish_lock:
+            futures = self.pending_futures
+            self.pending_publish = {}
+            self.pending_futures = []
+        for future in futures:
+            future.cancel()
+
+    def add_subscriptions(
+        self,
+        keys: Union[List[str], Literal["*"]],
+        blob_keys: Optional[List[str]] = None,
+    ) -> None:
+        """
+        Subscribe to more state keys and blob keys.  May be called from any
+        thread before or after start().  If connected, the subscriptions are
+        sent to central_hub along with a request for the current state of the
+        new keys.
+        """
+        new_keys: Union[List[str], Literal["*"]] = []
+        if keys == "*":
+            new_keys = "*" if self.subscribed_keys != "*" else []
+            self.subscribed_keys = "*"
+        elif self.subscribed_keys != "*":
+            new_keys = [k for k in keys if k not in self.subscribed_keys]
+            self.subscribed_keys = list(self.subscribed_keys) + new_keys
+        new_blob_keys = [k for k in blob_keys or [] if k not in self.blob_keys]
+        self.blob_keys = self.blob_keys + new_blob_keys
+
+        if self.loop and self.connected_socket and (new_keys or new_blob_keys):
+            asyncio.run_coroutine_threadsafe(
+                self._send_subscriptions(self.connected_socket, new_keys, new_blob_keys),
+                self.loop,
+            )
+
+    async def _send_subscriptions(
+        self,
+        websocket: WebSocketClientProtocol,
+        keys: Union[List[str], Literal["*"]],
+        blob_keys: List[str],
+    ) -> None:
+        if len(keys) > 0:
+            await messages.send_subscribe(websocket, keys)
+            await messages.send_get_state(websocket, keys if keys != "*" else None)
+        if len(blob_keys) > 0:
+            await messages.send_subscribe_blobs(websocket, blob_keys)
+            await messages.send_get_blob(websocket, blob_keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """Heartbeat and, if dispatching off the loop, callback stats."""
+        return {
+            "heartbeat": self.heartbeat.stats(),
+            "reconnect": self.reconnect_policy.stats(),
+            "callbacks": (
+                self.callback_dispatcher.stats() if self.callback_dispatcher else None
+            ),
+        }
+
+    @property
+    def clock_offset(self) -> float:
+        """Seconds to add to local time.time() to get central_hub time."""
+        return self.clock.offset
 
     @asynccontextmanager
     async def connect_to_hub(
@@ -108,55 +338,69 @@ class HubStateMonitor:
         log.info(f"hub_state_monitor connecting to central_hub at {c.BB_HUB_URI}")
         async with websockets.client.connect(c.BB_HUB_URI) as websocket:
             log.info("hub_state_monitor connected to central_hub")
-            state_keys = self.subscribed_keys if self.subscribed_keys != "*" else None
             self.connected_socket = websocket
             await messages.send_identity(websocket, self.identity)
-            if len(self.subscribed_keys) > 0:
-                await messages.send_subscribe(websocket, self.subscribed_keys)
-                await messages.send_get_state(websocket, state_keys)
+            await self._send_subscriptions(
+                websocket, self.subscribed_keys, self.blob_keys
+            )
             yield websocket
 
     async def parse_next_message(
         self, websocket: WebSocketClientProtocol
-    ) -> AsyncGenerator[tuple[str, dict[str, Any]], None]:
+    ) -> AsyncGenerator[tuple[str, dict[str, Any], Optional[TraceContext]], None]:
         async for message in websocket:
-            if should_exit:
+            if self.should_exit:
                 return
 
+            if isinstance(message, bytes):
+                try:
+                    key, blob = messages.blob_from_frame(message)
+                except ValueError as e:
+                    log.error(f"hub_state_monitor received bad binary frame: {e}")
+                    continue
+                if c.BB_LOG_ALL_MESSAGES:
+                    log.info(f"hub_state_monitor received blob: {key} {blob.ref()}")
+                yield "blobUpdate", {key: blob}, None
+                continue
+
             msg = json.loads(message)
+            trace = tracing.from_message(msg)
+            if trace is not None:
+                trace.hold(self.identity, "deliver", self.clock)
             if c.BB_LOG_ALL_MESSAGES:
                 log.info(f"hub_state_monitor received: {msg}")
             msg_type = msg.get("type")
             msg_data = msg.get("data")
 
-            yield msg_type, msg_data
+            yield msg_type, msg_data, trace
 
-            if should_exit:
+            if self.should_exit:
                 return
 
     async def monitor_state(self) -> None:
-        while not should_exit:
+        self.loop = asyncio.get_running_loop()
+        while not self.should_exit:
             try:
-                if should_exit:
+                if self.should_exit:
                     return  # we want to just exit if we are not running
                 async with self.connect_to_hub() as websocket:
+                    self.reconnect_policy.reset()
+                    for publisher in self.publishers:
+                        publisher.reset()
 
                     if self.on_connect:
                         self.on_connect(websocket)
 
-                    async for msg_type, msg_data in self.parse_next_message(websocket):
-                        if msg_type in ["state", "stateUpdate"]:
-                            """
-                            The order here is intentional.  We want the on_state_update
-                            to still be able to query the pre-changed state via hub_state
-                            if it needs to.  See class comment.
-                            """
-                            if self.on_state_update:
-                                self.on_state_update(websocket, msg_type, msg_data)
+                    if self.pending_futures:
+                        await self._flush_publish()
 
-                            self.hub_state.update_state_from_message_data(msg_data)
+                    heartbeat_task = asyncio.create_task(self.heartbeat.run(websocket))
+                    try:
+                        await self._handle_messages(websocket)
+                    finally:
+                        heartbeat_task.cancel()
 
-                    if should_exit:
+                    if self.should_exit:
                         return
 
                     await asyncio.sleep(0)
@@ -166,10 +410,105 @@ class HubStateMonitor:
                     traceback.print_exc()
 
             self.connected_socket = None
-            delay = 1 if c.BB_ENV == "test" else 5
-            log.info(f"central_hub socket disconnected. Reconnecting in {delay} sec...")
-            await asyncio.sleep(delay)
+            if self.should_exit:
+                return
+            log.info("central_hub socket disconnected.")
+            await self.reconnect_policy.wait()
+
+    async def _handle_messages(self, websocket: WebSocketClientProtocol) -> None:
+        async for msg_type, msg_data, trace in self.parse_next_message(websocket):
+            if msg_type in ["state", "stateUpdate"]:
+                valid_data = self._apply_schemas(msg_data)
+                if msg_data and not valid_data:
+                    continue  # every key failed its schema
+                msg_data = valid_data
+
+            if msg_type == "pong":
+                self.heartbeat.handle_pong(msg_data)
+
+            elif msg_type in ["state", "stateUpdate"] and self.callback_dispatcher:
+                self.hub_state.update_state_from_message_data(msg_data)
+                self.on_state_applied(msg_data)
+                self._dispatch_state_update(websocket, msg_type, msg_data, trace)
+
+            elif msg_type in ["state", "stateUpdate"]:
+                """
+                The order here is intentional.  We want the on_state_update
+                to still be able to query the pre-changed state via hub_state
+                if it needs to.  See class comment.
+                """
+                if self.on_state_update:
+                    token = tracing.set_current_trace(trace)
+                    try:
+                        self.on_state_update(websocket, msg_type, msg_data)
+                    finally:
+                        tracing.reset_current_trace(token)
+
+                self.hub_state.update_state_from_message_data(msg_data)
+                self.on_state_applied(msg_data)
+
+                if trace is not None:
+                    trace.stamp("callback_done")
+                    tracing.record(trace, self.identity)
+
+            elif msg_type == "blobUpdate":
+                if self.callback_dispatcher:
+                    for key, blob in msg_data.items():
+                        self.hub_state.update_blob(key, blob)
+                    self._dispatch_state_update(websocket, msg_type, msg_data, None)
+                else:
+                    if self.on_state_update:
+                        self.on_state_update(websocket, msg_type, msg_data)
+                    for key, blob in msg_data.items():
+                        self.hub_state.update_blob(key, blob)
+                self.on_state_applied(msg_data)
+
+    def _dispatch_state_update(
+        self,
+        websocket: WebSocketClientProtocol,
+        msg_type: str,
+        msg_data: Dict[str, Any],
+        trace: Optional[TraceContext],
+    ) -> None:
+        assert self.callback_dispatcher
+        if not self.on_state_update:
+            if trace is not None:
+                tracing.record(trace, self.identity)
+            return
+
+        for index, (key, value) in enumerate(msg_data.items()):
+            # the trace follows the first key
+            key_trace = trace if index == 0 else None
+            self.callback_dispatcher.dispatch(
+                key, self._run_callback, websocket, msg_type, {key: value}, key_trace
+            )
+
+    def _run_callback(
+        self,
+        websocket: WebSocketClientProtocol,
+        msg_type: str,
+        msg_data: Dict[str, Any],
+        trace: Optional[TraceContext],
+    ) -> None:
+        assert self.on_state_update
+        token = tracing.set_current_trace(trace)
+        try:
+            self.on_state_update(websocket, msg_type, msg_data)
+        finally:
+            tracing.reset_current_trace(token)
+        if trace is not None:
+            trace.stamp("callback_done")
+            tracing.record(trace, self.identity)
+
+    def on_state_applied(self, msg_data: Dict[str, Any]) -> None:
+        """
+        Called on the monitor's loop after a state update has been applied to
+        hub_state.  For subclasses; does nothing by default.
+        """
 
     def _thread(self) -> None:
         log.info("Starting hub_state_monitor thread.")
-        asyncio.run(self.monitor_state())
+        try:
+            asyncio.run(self.monitor_state())
+        finally:
+            self._cancel_pending_publish()
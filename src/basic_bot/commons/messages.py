@@ -1,14 +1,40 @@
 """
 Functions from this module are used to send messages to the central_hub
 via websockets.
+
+A service that updates several keys in one control tick can batch its
+`updateState` messages so that central_hub receives, and fans out, one message
+instead of one per call.  See UpdateBatcher:
+
+```python
+batcher = messages.UpdateBatcher(websocket, window_ms=5)
+...
+# merged with other updates sent in the next 5ms
+await messages.send_update_state(websocket, {"motors": motors})
+```
 """
 
+import asyncio
 import json
+import struct
+import weakref
 from dataclasses import dataclass
 from enum import Enum
-from typing import Optional, List, Dict, Any, Union, Literal, Protocol, runtime_checkable
+from typing import (
+    Optional,
+    List,
+    Dict,
+    Any,
+    Tuple,
+    Union,
+    Literal,
+    Protocol,
+    runtime_checkable,
+)
 
 from basic_bot.commons import log, constants as c
+from basic_bot.commons.clock_sync import ClockSync
+from basic_bot.commons.tracing import TraceContext
 
 
 class MessageTypeIn(Enum):
@@ -18,6 +44,10 @@ class MessageTypeIn(Enum):
     GET_STATE = "getState"
     UPDATE_STATE = "updateState"
     PING = "ping"
+    # sent as binary websocket frames; see encode_blob_frame
+    UPDATE_BLOB = "updateBlob"
+    SUBSCRIBE_BLOBS = "subscribeBlobs"
+    GET_BLOB = "getBlob"
 
 
 class MessageTypeOut(Enum):
@@ -26,6 +56,8 @@ class MessageTypeOut(Enum):
     STATE = "state"
     IDENTITY_ACK = "iseeu"
     PONG = "pong"
+    # sent as binary websocket frames; see encode_blob_frame
+    BLOB_UPDATE = "blobUpdate"
 
 
 # Legacy enum for backward compatibility
@@ -64,6 +96,8 @@ class StateUpdateMessage(BaseMessage):
     """State update message for publishing state changes."""
     type: str = MessageTypeIn.UPDATE_STATE.value
     data: Optional[Dict[str, Any]] = None
+    # optional trace context, see basic_bot.commons.tracing
+    trace: Optional[Dict[str, Any]] = None
 
 
 @dataclass
@@ -80,14 +114,127 @@ class GetStateMessage(BaseMessage):
     data: Optional[List[str]] = None
 
 
+@dataclass
+class SubscribeBlobsMessage(BaseMessage):
+    """Subscribe message for receiving blob keys as binary frames."""
+    type: str = MessageTypeIn.SUBSCRIBE_BLOBS.value
+    data: Optional[Union[List[str], Literal["*"]]] = None
+
+
+@dataclass
+class GetBlobMessage(BaseMessage):
+    """Get blob message for requesting the current blob of keys as binary frames."""
+    type: str = MessageTypeIn.GET_BLOB.value
+    data: Optional[List[str]] = None
+
+
+@dataclass
+class PingMessage(BaseMessage):
+    """Ping message; data may carry a `t0` timestamp for clock sync."""
+    type: str = MessageTypeIn.PING.value
+    data: Optional[Dict[str, Any]] = None
+
+
+@dataclass
+class Blob:
+    """
+    Binary data for a state key, for example a jpeg thumbnail or a depth map,
+    that is sent through central_hub as a binary websocket frame instead of
+    being base64 encoded into json.
+    """
+    data: bytes
+    content_type: str = "application/octet-stream"
+    # assigned by central_hub; increments with each update of the key
+    seq: int = 0
+
+    def ref(self) -> Dict[str, Any]:
+        """
+        The lightweight json reference stored in state and sent to subscribers
+        of the key that have not subscribed to receive the blob itself.
+        """
+        return {
+            "blob": True,
+            "content_type": self.content_type,
+            "size": len(self.data),
+            "seq": self.seq,
+        }
+
+
+# Binary frames are a 4 byte, network order, header length followed by the
+# utf-8 json header and then the raw bytes of the blob.
+BLOB_HEADER_LENGTH = struct.Struct("!I")
+
+
+def encode_blob_frame(header: Dict[str, Any], data: bytes) -> bytes:
+    """Encode a binary frame with a json header and raw data."""
+    header_bytes = json.dumps(header).encode("utf-8")
+    return b"".join([BLOB_HEADER_LENGTH.pack(len(header_bytes)), header_bytes, data])
+
+
+def is_blob_frame(frame: bytes) -> bool:
+    """
+    True if a binary frame starts with a blob header.  False for json text sent
+    in a binary frame, whose first bytes would be an impossibly long header.
+    """
+    if len(frame) <= BLOB_HEADER_LENGTH.size:
+        return False
+    (header_length,) = BLOB_HEADER_LENGTH.unpack_from(frame)
+    return (
+        0 < header_length <= len(frame) - BLOB_HEADER_LENGTH.size
+        and frame[BLOB_HEADER_LENGTH.size] == ord("{")
+    )
+
+
+def decode_blob_frame(frame: bytes) -> Tuple[Dict[str, Any], bytes]:
+    """
+    Decode a binary frame into its json header and raw data.  Raises ValueError
+    if the frame is malformed.
+    """
+    if len(frame) < BLOB_HEADER_LENGTH.size:
+        raise ValueError("binary frame too short")
+    (header_length,) = BLOB_HEADER_LENGTH.unpack_from(frame)
+    header_end = BLOB_HEADER_LENGTH.size + header_length
+    if header_end > len(frame):
+        raise ValueError("binary frame header length exceeds frame")
+    header = json.loads(frame[BLOB_HEADER_LENGTH.size:header_end])
+    if not isinstance(header, dict):
+        raise ValueError("binary frame header is not a json object")
+    return header, frame[header_end:]
+
+
+def blob_from_frame(frame: bytes) -> Tuple[str, Blob]:
+    """Decode a `blobUpdate` or `updateBlob` binary frame to its key and Blob."""
+    header, data = decode_blob_frame(frame)
+    blob = Blob(
+        data=data,
+        content_type=header.get("content_type") or Blob.content_type,
+        seq=int(header.get("seq", 0)),
+    )
+    return str(header.get("key")), blob
+
+
+def json_default(value: Any) -> Any:
+    """
+    `default` for json.dumps that encodes NumPy arrays and scalars, like the
+    values of keys with a schema (see basic_bot.commons.state_schema), as
+    lists and numbers.
+    """
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
 async def send_message(websocket: Any, message: Union[BaseMessage, Dict[str, Any]]) -> None:
     """Send a message to central_hub."""
     if isinstance(message, BaseMessage):
         message_dict = {"type": message.type, "data": message.data}
+        trace = getattr(message, "trace", None)
+        if trace is not None:
+            message_dict["trace"] = trace
     else:
         message_dict = message
 
-    json_message = json.dumps(message_dict)
+    json_message = json.dumps(message_dict, default=json_default)
     if c.BB_LOG_ALL_MESSAGES:
         log.info(f"sent {json_message} to {websocket.remote_address[1]}")
     await websocket.send(json_message)
@@ -124,9 +271,184 @@ async def send_get_state(websocket: Any, keys: Optional[List[str]] = None) -> No
     await send_message(websocket, message)
 
 
-async def send_update_state(websocket: Any, stateData: Dict[str, Any]) -> None:
+async def send_update_state(
+    websocket: Any,
+    stateData: Dict[str, Any],
+    trace: Optional[TraceContext] = None,
+    clock: Optional[ClockSync] = None,
+) -> None:
     """
     Send the `updateState` message type to central_hub with the key->value state data to update.
+
+    If `trace` is provided, it is stamped with "send" and sent with the message so
+    that central_hub and subscribers can add their hops.  See basic_bot.commons.tracing.
+    With a hub `clock`, the trace is stamped in hub time.
+
+    If an UpdateBatcher is enabled for the websocket, the update is merged into
+    its batch instead of being sent right away.
+    """
+    if trace is not None and clock is not None:
+        trace.clock = clock
+    batcher = _update_batchers.get(websocket)
+    if batcher is not None:
+        batcher.add(stateData, trace)
+        return
+
+    trace_dict = trace.stamp("send").to_dict() if trace is not None else None
+    message = StateUpdateMessage(data=stateData, trace=trace_dict)
+    await send_message(websocket, message)
+
+
+class UpdateBatcher:
+    """
+    Merges the `updateState` messages sent to a websocket into one message.
+
+    While enabled, `send_update_state` calls for the websocket add their key
+    values to a batch; a later value of a key replaces an earlier one.  The
+    batch is sent as one `updateState` message `window_ms` milliseconds after
+    the first update of the batch, or when `flush()` is called.  With no
+    window, the batch is only sent by `flush()`:
+
+    ```python
+    batcher = messages.UpdateBatcher(websocket)
+    await messages.send_update_state(websocket, {"motors": motors})
+    await messages.send_update_state(websocket, {"servo_angles": angles})
+    await batcher.flush()  # one frame with both keys
+    ```
+
+    If any of the merged updates has a trace, the last trace is sent with the
+    batch.  `close()` sends what is left and stops batching.  Must be used on
+    the event loop of the websocket.
+    """
+
+    def __init__(self, websocket: Any, window_ms: Optional[float] = None) -> None:
+        """
+        Args:
+
+        - websocket: the websocket to batch `send_update_state` calls of
+        - window_ms: milliseconds to wait for more updates after the first
+            update of a batch, or None to send only on `flush()`
+        """
+        # weak so that the batcher, the value of the websocket's entry in
+        # _update_batchers, does not keep the websocket key alive
+        self.websocket_ref = weakref.ref(websocket)
+        self.window_ms = window_ms
+        self.pending: Dict[str, Any] = {}
+        self.pending_trace: Optional[TraceContext] = None
+        self.flush_task: Optional["asyncio.Task[None]"] = None
+        self.updates = 0
+        self.frames = 0
+        _update_batchers[websocket] = self
+
+    def add(self, stateData: Dict[str, Any], trace: Optional[TraceContext] = None) -> None:
+        """Merge key values into the batch.  Does not block."""
+        self.pending.update(stateData)
+        self.updates += 1
+        if trace is not None:
+            self.pending_trace = trace
+        if self.window_ms is not None and self.flush_task is None:
+            self.flush_task = asyncio.get_running_loop().create_task(
+                self._flush_after_window(self.window_ms / 1000)
+            )
+
+    async def flush(self) -> None:
+        """Send the batch, if any, as one `updateState` message."""
+        if self.flush_task is not None and self.flush_task is not asyncio.current_task():
+            self.flush_task.cancel()
+        self.flush_task = None
+        if not self.pending:
+            return
+
+        data, trace = self.pending, self.pending_trace
+        self.pending, self.pending_trace = {}, None
+        websocket = self.websocket
+        if websocket is None:
+            return
+        self.frames += 1
+        trace_dict = trace.stamp("send").to_dict() if trace is not None else None
+        await send_message(websocket, StateUpdateMessage(data=data, trace=trace_dict))
+
+    async def close(self) -> None:
+        """Send the batch and stop batching updates for the websocket."""
+        websocket = self.websocket
+        if websocket is not None and _update_batchers.get(websocket) is self:
+            del _update_batchers[websocket]
+        await self.flush()
+
+    @property
+    def websocket(self) -> Any:
+        """The websocket, or None if it has been garbage collected."""
+        return self.websocket_ref()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "updates": self.updates,
+            "frames": self.frames,
+            "pending_keys": len(self.pending),
+        }
+
+    async def _flush_after_window(self, window: float) -> None:
+        await asyncio.sleep(window)
+        try:
+            await self.flush()
+        except Exception as e:
+            log.error(f"UpdateBatcher failed to send batch: {e}")
+
+
+# websocket => enabled UpdateBatcher; batchers only hold a weak reference to
+# their websocket, so entries go away with the websocket even if the batcher
+# was never closed
+_update_batchers: "weakref.WeakKeyDictionary[Any, UpdateBatcher]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+async def send_ping(websocket: Any, data: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Send the `ping` message type to central_hub.  If `data` has a `t0` timestamp,
+    central_hub replies with a `pong` that includes its receive and send times.
+    See basic_bot.commons.clock_sync.
+    """
+    message = PingMessage(data=data)
+    await send_message(websocket, message)
+
+
+async def send_blob(
+    websocket: Any,
+    key: str,
+    data: bytes,
+    content_type: str = "application/octet-stream",
+) -> None:
+    """
+    Send binary `data` for a state `key` to central_hub as a binary websocket frame.
+
+    central_hub stores the bytes as-is, forwards them as binary frames to clients
+    that subscribed to the key with `send_subscribe_blobs`, and sends a json
+    reference (see Blob.ref) to other subscribers of the key.
+
+    Note that websocket frames are limited to 1MiB by default.
+    """
+    header = {"type": MessageTypeIn.UPDATE_BLOB.value, "key": key, "content_type": content_type}
+    if c.BB_LOG_ALL_MESSAGES:
+        log.info(f"sent {len(data)} byte blob for {key} to {websocket.remote_address[1]}")
+    await websocket.send(encode_blob_frame(header, data))
+
+
+async def send_subscribe_blobs(
+    websocket: Any, keys: Union[List[str], Literal["*"]]
+) -> None:
+    """
+    Send the `subscribeBlobs` message type to central_hub to receive the blobs
+    of `keys` as binary `blobUpdate` frames instead of json references.
+    """
+    message = SubscribeBlobsMessage(data=keys)
+    await send_message(websocket, message)
+
+
+async def send_get_blob(websocket: Any, keys: List[str]) -> None:
+    """
+    Send the `getBlob` message type to central_hub, which replies with a binary
+    `blobUpdate` frame for each of the keys that has a blob.
     """
-    message = StateUpdateMessage(data=stateData)
+    message = GetBlobMessage(data=keys)
     await send_message(websocket, message)
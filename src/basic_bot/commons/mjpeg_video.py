@@ -1,14 +1,18 @@
+import itertools
 import threading
+import time
 
-from typing import Generator
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Generator, Optional, Tuple
 
 import cv2
-from flask import Flask, Response
+from flask import Flask, Response, request
 from flask_cors import CORS
 
 
 from basic_bot.commons import constants as c, log
-from basic_bot.commons.base_camera import BaseCamera
+from basic_bot.commons.base_camera import BaseCamera, CameraFrame
 
 # MJPEG video streaming runs on Flask becuase doing it with aiohttp
 # was causing issues with the audio streaming via WebRTC when more than
@@ -18,6 +22,10 @@ from basic_bot.commons.base_camera import BaseCamera
 flaskApp = Flask(__name__)
 CORS(flaskApp, supports_credentials=True)
 
+# most JpegProfiles that JpegCache keeps a jpeg for; the least recently used
+# profile is dropped when a client asks for another
+MAX_JPEG_PROFILES = 8
+
 
 class MjpegVideo:
     """
@@ -60,19 +68,168 @@ class MjpegVideo:
         flaskApp.run(host="0.0.0.0", port=port, threaded=True)
 
 
-def gen_rgb_video(camera: BaseCamera) -> Generator[bytes, None, None]:
-    """Video streaming generator function."""
-    while MjpegVideo.is_stopping is False:
-        frame = camera.get_frame()
+@dataclass(frozen=True)
+class JpegProfile:
+    """The quality and size of the jpegs sent to a client."""
+
+    # cv2.IMWRITE_JPEG_QUALITY, 0 - 100
+    quality: int = 95
+    # width to scale the frames down to keeping the aspect ratio, or None for
+    # the captured width.  Frames are never scaled up.
+    width: Optional[int] = None
+
+    @classmethod
+    def from_args(cls, args: Dict[str, str]) -> "JpegProfile":
+        """The profile selected by the `quality` and `width` query params."""
+        quality = _int_arg(args, "quality")
+        width = _int_arg(args, "width")
+        return cls(
+            quality=cls.quality if quality is None else min(max(quality, 0), 100),
+            width=width if width and 0 < width < c.BB_VISION_WIDTH else None,
+        )
+
 
-        jpeg = cv2.imencode(".jpg", frame)[1].tobytes()  # type: ignore
-        yield (b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + jpeg + b"\r\n")
+class JpegCache:
+    """
+    Encodes each camera frame at most once per JpegProfile, when a client
+    first asks for it, and shares the jpeg with all of the clients of the
+    profile.  Nothing is encoded while no one is watching, and frames that
+    no client asks for are never encoded.  Jpegs are kept for at most
+    `max_profiles` profiles.
+    """
+
+    def __init__(self, max_profiles: int = MAX_JPEG_PROFILES) -> None:
+        self.max_profiles = max_profiles
+        # (frame seq, jpeg) last encoded by profile, least recently used first
+        self.jpegs: "OrderedDict[JpegProfile, Tuple[int, bytes]]" = OrderedDict()
+        self.locks: Dict[JpegProfile, threading.Lock] = {}
+        self.lock = threading.Lock()
+        self.encodes = 0
+        self.hits = 0
+
+    def get(self, frame: CameraFrame, profile: JpegProfile) -> bytes:
+        """The jpeg of the frame for the profile, encoding it if needed."""
+        with self.lock:
+            profile_lock = self.locks.setdefault(profile, threading.Lock())
+
+        # clients of the same profile wait for one encode instead of each
+        # encoding the frame
+        with profile_lock:
+            with self.lock:
+                cached = self.jpegs.get(profile)
+                if cached is not None and cached[0] == frame.seq:
+                    self.jpegs.move_to_end(profile)
+                    self.hits += 1
+                    return cached[1]
+
+            # camera frames are numpy arrays despite the typing
+            image: Any = frame.image
+            if profile.width is not None and profile.width < image.shape[1]:
+                height = round(image.shape[0] * profile.width / image.shape[1])
+                image = cv2.resize(image, (profile.width, height))
+            jpeg = cv2.imencode(
+                ".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, profile.quality]
+            )[1].tobytes()
+
+            with self.lock:
+                self.jpegs[profile] = (frame.seq, jpeg)
+                self.jpegs.move_to_end(profile)
+                while len(self.jpegs) > self.max_profiles:
+                    evicted, _ = self.jpegs.popitem(last=False)
+                    self.locks.pop(evicted, None)
+                self.encodes += 1
+            return jpeg
+
+    def stats(self) -> Dict[str, int]:
+        return {"encodes": self.encodes, "hits": self.hits, "profiles": len(self.jpegs)}
+
+
+jpeg_cache = JpegCache()
+
+# numbers the frame consumers of the /video_feed clients
+client_ids = itertools.count(1)
+
+
+def gen_rgb_video(
+    camera: BaseCamera, profile: JpegProfile, max_fps: Optional[float] = None
+) -> Generator[bytes, None, None]:
+    """
+    Video streaming generator function.  Sends the newest frame, skipping
+    frames that the client was too slow for, at most `max_fps` times a second.
+    """
+    frames = camera.consumer(f"mjpeg_{next(client_ids)}")
+    min_interval = 1 / max_fps if max_fps else 0
+    last_sent = 0.0
+    try:
+        while MjpegVideo.is_stopping is False:
+            wait = last_sent + min_interval - time.time()
+            if wait > 0:
+                time.sleep(wait)
+
+            camera_frame = frames.next(timeout=1)
+            if camera_frame is None:
+                continue
+
+            jpeg = jpeg_cache.get(camera_frame, profile)
+            last_sent = time.time()
+            yield (b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + jpeg + b"\r\n")
+    finally:
+        camera.remove_consumer(frames)
 
 
 @flaskApp.route("/video_feed")
 def video_feed() -> Response:
-    """Video streaming route. Put this in the src attribute of an img tag."""
+    """
+    Video streaming route. Put this in the src attribute of an img tag.
+
+    Optional query params:
+    - quality: jpeg quality 0 - 100, default 95
+    - width: scale the frames down to this width keeping the aspect ratio
+    - max_fps: send at most this many frames per second
+    """
+    max_fps = _float_arg(request.args, "max_fps")
     return Response(
-        gen_rgb_video(MjpegVideo.camera),
+        gen_rgb_video(
+            MjpegVideo.camera,
+            JpegProfile.from_args(request.args),
+            max_fps if max_fps and max_fps > 0 else None,
+        ),
         mimetype="multipart/x-mixed-replace; boundary=frame",
     )
+
+
+@flaskApp.route("/snapshot.jpg")
+def snapshot() -> Response:
+    """
+    The most recent frame as a jpeg.  Takes the same quality and width query
+    params as /video_feed.  The ETag changes with each frame so clients can
+    poll with If-None-Match.
+    """
+    camera = MjpegVideo.camera
+    camera_frame = camera.latest() or camera.get_frame_after(0, timeout=1)
+    if camera_frame is None:
+        return Response("no camera frame available", status=503)
+
+    profile = JpegProfile.from_args(request.args)
+    etag = f"{camera_frame.seq}-{profile.quality}-{profile.width or 0}"
+    if etag in request.if_none_match:
+        return Response(status=304, headers={"ETag": f'"{etag}"'})
+
+    response = Response(jpeg_cache.get(camera_frame, profile), mimetype="image/jpeg")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _int_arg(args: Dict[str, str], name: str) -> Optional[int]:
+    try:
+        return int(args[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def _float_arg(args: Dict[str, str], name: str) -> Optional[float]:
+    try:
+        return float(args[name])
+    except (KeyError, ValueError):
+        return None
@@ -0,0 +1,115 @@
+"""
+Decides whether a frame has changed enough to be worth running object
+detection on.  Frames are downscaled, with each pixel the mean of a block of
+the frame, converted to grayscale and compared pixel by pixel to the previous
+frame and to the last frame that was detected.
+
+```python
+from basic_bot.commons.motion_detector import MotionDetector
+
+motion = MotionDetector()
+for frame in frames:
+    if motion.update(frame.image):
+        objects = detector.get_prediction(frame.image)
+```
+
+Comparing to the previous frame finds things that are moving.  Comparing to
+the last frame detected finds slow changes, like lighting or something that
+crept into view, that are too small between two frames.  A detection is also
+forced every `max_interval` seconds so that the objects published do not go
+stale.
+"""
+
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from basic_bot.commons import constants as c
+
+# size of the downscaled frames compared
+SMALL_SIZE = (32, 24)
+# a downscaled pixel has changed if its gray level differs by more than this
+PIXEL_THRESHOLD = 16
+
+
+class MotionDetector:
+    """Frame change detection to gate object detection.  See module doc."""
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        max_interval: Optional[float] = None,
+        small_size: Tuple[int, int] = SMALL_SIZE,
+    ) -> None:
+        """
+        Args:
+
+        - threshold: fraction of downscaled pixels that must change;
+            default BB_MOTION_THRESHOLD
+        - max_interval: seconds between forced detections;
+            default BB_MOTION_MAX_INTERVAL
+        - small_size: (width, height) of the downscaled frames
+        """
+        self.threshold = c.BB_MOTION_THRESHOLD if threshold is None else threshold
+        self.max_interval = (
+            c.BB_MOTION_MAX_INTERVAL if max_interval is None else max_interval
+        )
+        self.small_size = small_size
+
+        self.previous: Optional[np.ndarray] = None
+        # downscaled frame of the last detection
+        self.reference: Optional[np.ndarray] = None
+        self.last_detect_at = 0.0
+        # true if the last frame changed from the one before it
+        self.is_moving = False
+        # fraction of pixels changed from the previous frame
+        self.changed = 0.0
+        self.frames = 0
+        self.detections = 0
+
+    def update(self, image: Any, now: Optional[float] = None) -> bool:
+        """Return True if objects should be detected in the image."""
+        now = time.time() if now is None else now
+        small = self.downscale(image)
+        self.frames += 1
+
+        if self.previous is None:
+            self.changed = 1.0
+        else:
+            self.changed = self.changed_fraction(small, self.previous)
+        self.previous = small
+        self.is_moving = self.changed > self.threshold
+
+        detect = (
+            self.is_moving
+            or self.reference is None
+            or now - self.last_detect_at >= self.max_interval
+            or self.changed_fraction(small, self.reference) > self.threshold
+        )
+        if detect:
+            self.reference = small
+            self.last_detect_at = now
+            self.detections += 1
+        return detect
+
+    def downscale(self, image: Any) -> np.ndarray:
+        """A small grayscale copy of a BGR or grayscale image."""
+        small = cv2.resize(image, self.small_size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def changed_fraction(self, a: np.ndarray, b: np.ndarray) -> float:
+        """Fraction of the pixels of two downscaled frames that differ."""
+        return np.count_nonzero(cv2.absdiff(a, b) > PIXEL_THRESHOLD) / a.size
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "is_moving": self.is_moving,
+            "changed": self.changed,
+            "frames": self.frames,
+            "detections": self.detections,
+            "skipped": self.frames - self.detections,
+        }
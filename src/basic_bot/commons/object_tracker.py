@@ -0,0 +1,212 @@
+"""
+Gives detected objects an identity that persists across frames and predicts
+where they are between detections.
+
+Detections are matched to tracks by the overlap (intersection over union) of
+their bounding box with the box the track is predicted to be at.  Each track
+has a constant velocity that is updated, along with its box, by an alpha-beta
+filter, which smooths the jitter of the detector's boxes.
+
+```python
+from basic_bot.commons.object_tracker import ObjectTracker
+
+tracker = ObjectTracker()
+# when the detector has objects for a frame
+objects = tracker.update(detector.get_prediction(frame.image), frame.timestamp)
+# for frames between detections
+objects = tracker.predict(frame.timestamp)
+# for frames that are not detected because nothing in them has moved
+tracker.confirm(frame.timestamp)
+```
+
+The objects returned have the fields of the detected objects plus:
+
+- track_id: int, the same for an object in every frame it is tracked
+- velocity: [vx, vy] of the center of the bounding box in pixels per second
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from basic_bot.commons import constants as c
+
+# weight of the detected box versus the predicted box
+ALPHA = 0.7
+# weight of the velocity implied by the detected box versus the track's velocity
+BETA = 0.3
+
+
+@dataclass
+class Track:
+    track_id: int
+    box: np.ndarray
+    # of each of x1, y1, x2, y2 in pixels per second
+    velocity: np.ndarray
+    # the detected object, less its box
+    detected: Dict[str, Any]
+    updated_at: float
+    hits: int = 1
+
+    def predicted_box(self, timestamp: float) -> np.ndarray:
+        return self.box + self.velocity * max(0.0, timestamp - self.updated_at)
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Intersection over union of each [x1, y1, x2, y2] box in a with each in b."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.divide(
+        intersection, union, out=np.zeros_like(intersection), where=union > 0
+    )
+
+
+class ObjectTracker:
+    """Tracks detected objects across frames.  See module doc."""
+
+    def __init__(
+        self,
+        iou_threshold: Optional[float] = None,
+        max_age: Optional[float] = None,
+    ) -> None:
+        """
+        Args:
+
+        - iou_threshold: minimum overlap of a detection with a track's
+            predicted box to be the same object; default BB_TRACKING_IOU_THRESHOLD
+        - max_age: seconds that a track is kept, and predicted, without a
+            matching detection; default BB_TRACKING_MAX_AGE
+        """
+        self.iou_threshold = (
+            c.BB_TRACKING_IOU_THRESHOLD if iou_threshold is None else iou_threshold
+        )
+        self.max_age = c.BB_TRACKING_MAX_AGE if max_age is None else max_age
+        self.tracks: List[Track] = []
+        self.next_track_id = 1
+        # timestamp of the frame of the last update()
+        self.last_update_at = 0.0
+        self.lock = threading.Lock()
+
+    def update(
+        self, objects: List[Dict[str, Any]], timestamp: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Match the objects detected in the frame captured at `timestamp` to
+        tracks and return the tracked objects.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            self.last_update_at = timestamp
+            self.tracks = [
+                t for t in self.tracks if timestamp - t.updated_at <= self.max_age
+            ]
+            boxes = np.array(
+                [o["bounding_box"] for o in objects], dtype=np.float64
+            ).reshape(-1, 4)
+            matches = self._match(boxes, objects, timestamp)
+
+            tracked = []
+            for index, obj in enumerate(objects):
+                detected = {k: v for k, v in obj.items() if k != "bounding_box"}
+                track = matches.get(index)
+                if track is None:
+                    track = Track(
+                        self.next_track_id,
+                        boxes[index],
+                        np.zeros(4),
+                        detected,
+                        timestamp,
+                    )
+                    self.next_track_id += 1
+                    self.tracks.append(track)
+                else:
+                    self._correct(track, boxes[index], timestamp)
+                    track.detected = detected
+                tracked.append(self._tracked_object(track, track.box))
+            return tracked
+
+    def predict(self, timestamp: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Return the tracked objects with their boxes predicted at `timestamp`."""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            return [
+                self._tracked_object(track, track.predicted_box(timestamp))
+                for track in self.tracks
+                if timestamp - track.updated_at <= self.max_age
+            ]
+
+    def confirm(self, timestamp: Optional[float] = None) -> None:
+        """
+        Keep the tracks alive, as not moving, without a detection.  Call for a
+        frame that is known to be unchanged since the last detection, for
+        example when a motion gate skips it, so that objects that are still in
+        view are not dropped after `max_age`.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            for track in self.tracks:
+                if 0 <= timestamp - track.updated_at <= self.max_age:
+                    track.velocity = np.zeros(4)
+                    track.updated_at = timestamp
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracks": len(self.tracks),
+            "next_track_id": self.next_track_id,
+            "last_update_at": self.last_update_at,
+        }
+
+    def _match(
+        self, boxes: np.ndarray, objects: List[Dict[str, Any]], timestamp: float
+    ) -> Dict[int, Track]:
+        """Greedily match detections, by index, to tracks of the same class."""
+        if not self.tracks or not len(boxes):
+            return {}
+        predicted = np.array([t.predicted_box(timestamp) for t in self.tracks])
+        iou = iou_matrix(predicted, boxes)
+        track_classes = [t.detected.get("classification") for t in self.tracks]
+        object_classes = [o.get("classification") for o in objects]
+        same_class = np.array(track_classes, dtype=object)[:, None] == np.array(
+            object_classes, dtype=object
+        )
+        iou[~same_class] = 0
+
+        matches: Dict[int, Track] = {}
+        matched_tracks = set()
+        for flat_index in np.argsort(-iou, axis=None):
+            t, d = (int(i) for i in np.unravel_index(flat_index, iou.shape))
+            if iou[t, d] < self.iou_threshold:
+                break
+            if d in matches or t in matched_tracks:
+                continue
+            matches[d] = self.tracks[t]
+            matched_tracks.add(t)
+        return matches
+
+    def _correct(self, track: Track, box: np.ndarray, timestamp: float) -> None:
+        dt = timestamp - track.updated_at
+        predicted = track.predicted_box(timestamp)
+        residual = box - predicted
+        track.box = predicted + ALPHA * residual
+        if dt > 0:
+            track.velocity = track.velocity + BETA * residual / dt
+        track.updated_at = timestamp
+        track.hits += 1
+
+    def _tracked_object(self, track: Track, box: np.ndarray) -> Dict[str, Any]:
+        vx1, vy1, vx2, vy2 = track.velocity.tolist()
+        return {
+            **track.detected,
+            "bounding_box": box.tolist(),
+            "track_id": track.track_id,
+            "velocity": [(vx1 + vx2) / 2, (vy1 + vy2) / 2],
+        }
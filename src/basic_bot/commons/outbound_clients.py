@@ -9,6 +9,7 @@ from websockets.client import WebSocketClientProtocol
 
 from basic_bot.commons import log, constants as c
 from basic_bot.commons.config_file import read_config_file
+from basic_bot.commons.reconnect_policy import ReconnectPolicy
 
 from typing import Optional, Callable, Any, Dict, Union
 
@@ -18,7 +19,8 @@ class OutboundClients:
     This class manages outbound websocket connections to external hub clients
     that cannot directly inbound connect to the central_hub websocket.
 
-    It features automatic reconnection on connection loss.
+    It features automatic reconnection on connection loss with exponential
+    backoff and jitter (see basic_bot.commons.reconnect_policy).
     """
 
     def __init__(
@@ -72,17 +74,22 @@ class OutboundClients:
             identity (str): The identity string to send upon connection.
             token (Optional[str]): An optional shared secret token for authentication.
         """
+        reconnect_policy = ReconnectPolicy(name)
         while not self.is_stopping:
             try:
                 log.info(f"Connecting to outbound client {name} at {uri}")
                 async with websockets.client.connect(uri) as websocket:  # type: ignore
+                    reconnect_policy.reset()
                     self.connections[name] = websocket
                     await self._send_identity(websocket, identity, token)
                     await self._listen(websocket, name)
             except Exception as e:
                 log.error(f"Connection to {name} failed: {e}")
-                log.info(f"Reconnecting to {name} in 5 seconds...")
-                await asyncio.sleep(5)
+            finally:
+                self.connections.pop(name, None)
+
+            if not self.is_stopping:
+                await reconnect_policy.wait()
 
     async def _send_identity(
         self, websocket, identity: str, token: Optional[str]
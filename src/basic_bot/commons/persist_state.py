@@ -74,8 +74,13 @@ class PersistState:
 
             with open(self.file_path, "r") as f:
                 persisted_state = json.load(f)
-                for key in self.persisted_state_keys:
-                    if key in persisted_state:
-                        self.hub_state.state[key] = persisted_state[key]
+                self.hub_state.update(
+                    {
+                        key: persisted_state[key]
+                        for key in self.persisted_state_keys
+                        if key in persisted_state
+                    },
+                    touch=False,
+                )
         except (IOError, json.JSONDecodeError) as e:
             log.error(f"Failed to initialize persisted state: {e}")
@@ -0,0 +1,186 @@
+"""
+Runs a sequence of stages, each on its own thread, connected by small bounded
+queues so that the stages work on different items at the same time.  While
+one frame is being inferred, the next frame can be preprocessed and the
+objects of the previous frame published.
+
+```python
+from basic_bot.commons.pipeline import Pipeline
+
+pipeline = Pipeline(
+    [
+        ("capture", lambda _: frames.next(timeout=1)),
+        ("preprocess", detector.preprocess),
+        ("infer", detector.infer),
+        ("publish", publish),
+    ]
+)
+pipeline.start()
+...
+pipeline.stop()
+```
+
+Use `pipeline.run()` instead of `start()` to run the first stage on the calling
+thread until `stop()` is called.
+
+The first stage is called with None and produces the items.  It should block,
+for example waiting for the next camera frame, until it has an item; when it
+returns None the stage yields briefly before it is called again.  Each stage
+after it is called with the item returned by the stage before it.  A stage that
+returns None drops the item.  When the queue to a stage is full, the oldest
+item in the queue is dropped so that stages always work on the freshest item
+rather than falling behind.
+"""
+
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from basic_bot.commons import log
+
+# number of recent durations averaged by stats()
+DURATION_WINDOW = 30
+# seconds the first stage waits after producing nothing
+IDLE_WAIT = 0.005
+
+
+class PipelineStage:
+    """One stage of a Pipeline and its timing stats."""
+
+    def __init__(
+        self, name: str, fn: Callable[[Any], Any], queue_size: int = 1
+    ) -> None:
+        self.name = name
+        self.fn = fn
+        # items waiting for this stage; unused by the first stage
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self.thread: Optional[threading.Thread] = None
+        self.count = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.errors = 0
+        self.durations: Deque[float] = deque(maxlen=DURATION_WINDOW)
+        self.max_duration = 0.0
+
+    def put(self, item: Any) -> None:
+        """Queue an item for the stage, dropping the oldest if full."""
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def record(self, duration: float) -> None:
+        self.count += 1
+        self.durations.append(duration)
+        self.max_duration = max(self.max_duration, duration)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg_duration": (
+                sum(self.durations) / len(self.durations) if self.durations else 0.0
+            ),
+            "last_duration": self.durations[-1] if self.durations else 0.0,
+            "max_duration": self.max_duration,
+            "dropped": self.dropped,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "queued": self.queue.qsize(),
+        }
+
+
+class Pipeline:
+    """Threads running stages connected by queues.  See module doc."""
+
+    def __init__(
+        self,
+        stages: List[Tuple[str, Callable[[Any], Any]]],
+        queue_size: int = 1,
+    ) -> None:
+        """
+        Args:
+
+        - stages: (name, function) of each stage in order
+        - queue_size: max items waiting for each stage
+        """
+        self.stages = [PipelineStage(name, fn, queue_size) for name, fn in stages]
+        self.is_stopping = False
+
+    def start(self) -> None:
+        """Start a thread for each stage."""
+        self._start_threads(0)
+
+    def run(self) -> None:
+        """
+        Start threads for the stages after the first and run the first stage on
+        the calling thread until stop() is called.
+        """
+        self._start_threads(1)
+        self._run_stage(0)
+
+    def _start_threads(self, first_index: int) -> None:
+        for index, stage in enumerate(self.stages):
+            if index < first_index:
+                continue
+            stage.thread = threading.Thread(
+                target=self._run_stage,
+                args=(index,),
+                name=f"pipeline_{stage.name}",
+                daemon=True,
+            )
+            stage.thread.start()
+
+    def stop(self, timeout: float = 2) -> None:
+        """Stop the stages, waiting up to `timeout` seconds for each to finish."""
+        self.is_stopping = True
+        for stage in self.stages[1:]:
+            # wake the stage if it is waiting on its queue
+            stage.put(None)
+        for stage in self.stages:
+            if stage.thread and stage.thread is not threading.current_thread():
+                stage.thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """Timing and queue stats of each stage by stage name."""
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def _run_stage(self, index: int) -> None:
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while not self.is_stopping:
+            item = None
+            if index > 0:
+                item = stage.queue.get()
+                if item is None:
+                    continue
+
+            started_at = time.time()
+            try:
+                result = stage.fn(item)
+            except Exception:
+                traceback.print_exc()
+                log.error(f"pipeline: stage {stage.name} failed")
+                stage.errors += 1
+                # don't spin on a stage that fails every time
+                time.sleep(0.1 if index > 0 else 1)
+                continue
+            stage.record(time.time() - started_at)
+
+            if result is None and index == 0:
+                # don't spin on a first stage that doesn't block
+                time.sleep(IDLE_WAIT)
+            if next_stage is None:
+                continue
+            if result is None:
+                stage.skipped += 1
+            else:
+                next_stage.put(result)
@@ -1,16 +1,20 @@
 import time
 import threading
-import asyncio
-import websockets
-import websockets.client
 import traceback
 
+from dataclasses import dataclass
 from typing import Any, List, Dict, Optional
-from websockets.client import WebSocketClientProtocol
 
 
-from basic_bot.commons import constants, messages, log
+from basic_bot.commons import constants as c, log, tracing
+from basic_bot.commons.base_camera import CameraFrame, FrameConsumer
+from basic_bot.commons.detection_pool import DetectionPool
 from basic_bot.commons.fps_stats import FpsStats
+from basic_bot.commons.motion_detector import MotionDetector
+from basic_bot.commons.object_tracker import ObjectTracker
+from basic_bot.commons.pipeline import Pipeline
+from basic_bot.commons.shared_hub_client import SharedHubClient, get_shared_hub_client
+from basic_bot.commons.state_publisher import StatePublisher
 
 # TODO: decide whether to optionally use pytorch or tflite
 #   Maybe do another performance test and update
@@ -20,9 +24,24 @@ See [issue #1](https://github.com/littlebee/scatbot-edge-ai-shootout/issues/1)
 about support for pytorch
 """
 
-from .tflite_detect import TFLiteDetect
+from .tflite_detect import TFLiteDetect, detections_to_dicts
 
-detector = TFLiteDetect()
+# with BB_RECOGNITION_WORKERS, each worker process loads its own detector
+detector: Optional[TFLiteDetect] = (
+    TFLiteDetect() if c.BB_RECOGNITION_WORKERS <= 0 else None
+)
+
+
+@dataclass
+class _Detection:
+    """A frame on its way through the recognition pipeline."""
+
+    camera_frame: CameraFrame
+    started_at: float
+    input_data: Any = None
+    outputs: Any = None
+    # DETECTION_DTYPE array; converted to dictionaries when published
+    detections: Any = None
 
 
 class RecognitionProvider:
@@ -30,10 +49,28 @@ class RecognitionProvider:
     This singleton class detects objects in frames it gets from the camera
     object passed to the constructor.
 
-    It uses the TFLiteDetect class to detect objects in the frames.
+    It uses the TFLiteDetect class to detect objects in the frames.  Capture,
+    preprocessing, inference, postprocessing and publishing each run on their
+    own thread (see basic_bot.commons.pipeline) so that the next frame is
+    preprocessed and the last frame's objects are published while a frame is
+    being inferred.  The time spent in each stage is in `stats()["stages"]`.
+
+    When BB_RECOGNITION_WORKERS is greater than zero, detection is done by that
+    many worker processes (see basic_bot.commons.detection_pool) and the most
+    recent frame is given to each worker as it becomes idle.
+
+    With BB_MOTION_GATE, frames that have not changed are not detected (see
+    basic_bot.commons.motion_detector) and whether the scene is changing is
+    published as the `motion` key.
 
-    It sends the detected objects to the central hub via a websocket connection
-    using the `recognition` key
+    With BB_OBJECT_TRACKING, the objects detected are given a `track_id` and
+    `velocity` (see basic_bot.commons.object_tracker) and the predicted boxes
+    of the tracked objects are published for each camera frame.
+
+    It sends the detected objects to the central hub using the `recognition` key
+    via the process shared hub connection (see basic_bot.commons.shared_hub_client).
+    If the process has not created the shared connection, it is created with the
+    identity "recognition".
 
     To use, simply instantiate it:
 
@@ -50,23 +87,52 @@ class RecognitionProvider:
         None  # background thread that reads frames from camera
     )
     camera: Any = None
+    frames: Optional[FrameConsumer] = None
     last_objects_seen: List[Dict[str, Any]] = []
     fps_stats: FpsStats = FpsStats()
     last_frame_duration: float = 0
     last_dimensions: Dict[str, Any] = {}
     total_objects_detected: int = 0
-    previous_objects: List[dict[str, Any]] = []
+    publisher: Optional[StatePublisher] = None
     is_stopping: bool = False
+    hub: Optional[SharedHubClient] = None
+    pool: Optional[DetectionPool] = None
+    pipeline: Optional[Pipeline] = None
+    motion: Optional[MotionDetector] = (
+        MotionDetector() if c.BB_MOTION_GATE else None
+    )
+    tracker: Optional[ObjectTracker] = (
+        ObjectTracker() if c.BB_OBJECT_TRACKING else None
+    )
+    tracking_thread: Optional[threading.Thread] = None
+    # trace of the last detection, published with the next tracked objects
+    tracked_trace: Optional[tracing.TraceContext] = None
+    tracked_trace_lock: threading.Lock = threading.Lock()
+    # sequence number of the frame of the last objects published
+    last_published_seq: int = 0
+    stale_results: int = 0
 
     next_objects_event: threading.Event = threading.Event()
     pause_event: threading.Event = threading.Event()
 
-    def __init__(self, camera: Any) -> None:
+    def __init__(self, camera: Any, hub: Optional[SharedHubClient] = None) -> None:
         """Constructor"""
         RecognitionProvider.camera = camera
+        RecognitionProvider.frames = camera.consumer("recognition")
+        if RecognitionProvider.hub is None:
+            RecognitionProvider.hub = hub or get_shared_hub_client("recognition")
+            RecognitionProvider.hub.start()
+            # only publish when the objects seen change
+            RecognitionProvider.publisher = StatePublisher(RecognitionProvider.hub.publish)
+            RecognitionProvider.hub.add_publisher(RecognitionProvider.publisher)
         if RecognitionProvider.thread is None:
             RecognitionProvider.thread = threading.Thread(target=self._thread)
             RecognitionProvider.thread.start()
+        if RecognitionProvider.tracker and RecognitionProvider.tracking_thread is None:
+            RecognitionProvider.tracking_thread = threading.Thread(
+                target=self._tracking_thread, args=(camera.consumer("tracking"),)
+            )
+            RecognitionProvider.tracking_thread.start()
 
         self.resume()
 
@@ -93,6 +159,8 @@ class RecognitionProvider:
         log.info("Recognition provider stopping")
         RecognitionProvider.is_stopping = True
         self.resume()  # resume in case paused
+        if RecognitionProvider.pipeline:
+            RecognitionProvider.pipeline.stop()
 
     @classmethod
     def stats(cls) -> Dict[str, Any]:
@@ -102,17 +170,145 @@ class RecognitionProvider:
             "fps": cls.fps_stats.stats(),
             "total_objects_detected": cls.total_objects_detected,
             "last_frame_duration": cls.last_frame_duration,
+            "frames": cls.frames.stats() if cls.frames else None,
+            "hub_heartbeat": cls.hub.monitor.heartbeat.stats() if cls.hub else None,
+            "publisher": cls.publisher.stats() if cls.publisher else None,
+            "stages": cls.pipeline.stats() if cls.pipeline else None,
+            "detection_pool": cls.pool.stats() if cls.pool else None,
+            "motion": cls.motion.stats() if cls.motion else None,
+            "tracker": cls.tracker.stats() if cls.tracker else None,
+            "stale_results": cls.stale_results,
         }
 
     @classmethod
-    async def process_next_frame(cls, websocket: WebSocketClientProtocol) -> None:
-        frame = cls.camera.get_frame()
+    def create_pipeline(cls) -> Pipeline:
+        """The stages that detect and publish the objects in each frame."""
+        assert detector
+        stages = [
+            ("capture", cls._capture),
+            ("preprocess", cls._preprocess),
+            ("infer", cls._infer),
+            ("postprocess", cls._postprocess),
+            ("publish", cls._publish),
+        ]
+        if cls.motion:
+            stages.insert(1, ("motion", cls._motion))
+        return Pipeline(stages)
+
+    @classmethod
+    def motion_gate(cls, camera_frame: CameraFrame) -> bool:
+        """
+        True if objects should be detected in the frame.  Always true
+        without BB_MOTION_GATE.
+        """
+        if cls.motion is None:
+            return True
+        detect = cls.motion.update(camera_frame.image, camera_frame.timestamp)
+        if not detect and cls.tracker is not None:
+            # nothing has moved since the last detection
+            cls.tracker.confirm(camera_frame.timestamp)
+        if cls.publisher is not None:
+            cls.publisher.publish({"motion": cls.motion.is_moving})
+        return detect
+
+    @classmethod
+    def _capture(cls, _: Any) -> Optional[_Detection]:
+        if not cls.pause_event.is_set():
+            log.info("recognition waiting on pause event")
+            cls.pause_event.wait()
+            log.info("recognition resumed")
+            return None
+
+        assert cls.frames
+        camera_frame = cls.frames.next(timeout=1)
+        if camera_frame is None:
+            return None
+        return _Detection(camera_frame, time.time())
+
+    @classmethod
+    def _motion(cls, detection: _Detection) -> Optional[_Detection]:
+        return detection if cls.motion_gate(detection.camera_frame) else None
+
+    @classmethod
+    def _preprocess(cls, detection: _Detection) -> _Detection:
+        assert detector
+        detection.input_data = detector.preprocess(detection.camera_frame.image)
+        return detection
+
+    @classmethod
+    def _infer(cls, detection: _Detection) -> _Detection:
+        assert detector
+        detection.outputs = detector.infer(detection.input_data)
+        detection.input_data = None
+        return detection
 
-        t1 = time.time()
-        new_objects = detector.get_prediction(frame)
-        cls.last_frame_duration = time.time() - t1
+    @classmethod
+    def _postprocess(cls, detection: _Detection) -> _Detection:
+        assert detector
+        image: Any = detection.camera_frame.image
+        detection.detections = detector.postprocess_array(
+            detection.outputs, image.shape
+        )
+        detection.outputs = None
+        return detection
+
+    @classmethod
+    def _publish(cls, detection: _Detection) -> None:
+        image: Any = detection.camera_frame.image
+        cls.objects_detected(
+            detections_to_dicts(detection.detections),
+            image.shape,
+            detection.started_at,
+            time.time() - detection.started_at,
+            detection.camera_frame.timestamp,
+        )
+
+    @classmethod
+    def process_with_pool(cls) -> None:
+        """
+        Give the newest frame to an idle worker of the detection pool and
+        publish the objects detected by workers that have finished.
+        """
+        assert cls.frames and cls.pool
+        if cls.pool.idle_workers() > 0:
+            camera_frame = cls.frames.next(timeout=0.1)
+            if camera_frame is not None and cls.motion_gate(camera_frame):
+                cls.pool.submit(camera_frame)
+
+        for result in cls.pool.get_results(timeout=0.01):
+            # a worker given an older frame finished after one given a newer frame
+            if result.seq <= cls.last_published_seq:
+                cls.stale_results += 1
+                continue
+            cls.last_published_seq = result.seq
+            cls.objects_detected(
+                result.objects,
+                result.shape,
+                time.time() - result.duration,
+                result.duration,
+                result.timestamp,
+            )
+
+    @classmethod
+    def objects_detected(
+        cls,
+        new_objects: List[Dict[str, Any]],
+        shape: Any,
+        started_at: float,
+        duration: float,
+        captured_at: Optional[float] = None,
+    ) -> None:
+        cls.last_frame_duration = duration
+        if cls.tracker:
+            new_objects = cls.tracker.update(new_objects, captured_at or started_at)
+        trace = None
+        if tracing.enabled():
+            clock = cls.hub.monitor.clock if cls.hub else None
+            trace = tracing.new_trace(
+                "recognition", origin_ts=started_at, clock=clock
+            ).stamp("detected")
         cls.last_objects_seen = new_objects
-        cls.last_dimensions = frame.shape
+        cls.last_dimensions = shape
 
         cls.fps_stats.increment()
 
@@ -120,48 +316,60 @@ class RecognitionProvider:
         cls.next_objects_event.set()  # send signal to clients
         cls.total_objects_detected += num_objects
 
-        if new_objects != cls.previous_objects:
-            cls.previous_objects = new_objects
-            try:
-                await messages.send_update_state(
-                    websocket,
-                    {
-                        "recognition": new_objects,
-                    },
-                )
-            except websockets.exceptions.ConnectionClosedError:
-                log.info("recognition: websocket connection closed on send")
+        # with tracking, the tracking thread publishes the objects, moved to
+        # where they are predicted to be, and the trace with the next camera frame
+        if cls.tracker is not None:
+            with cls.tracked_trace_lock:
+                cls.tracked_trace = trace
+        elif cls.publisher is not None:
+            cls.publisher.publish({"recognition": new_objects}, trace=trace)
 
     @classmethod
-    async def provide_state(cls) -> None:
+    def _tracking_thread(cls, frames: FrameConsumer) -> None:
+        """
+        Publish the predicted boxes of tracked objects for each camera frame.
+        This is the only publisher of `recognition` when tracking, so that the
+        objects published never go back in time to the capture time of a
+        detection that finished after newer frames were published.
+        """
+        assert cls.tracker
         while not cls.is_stopping:
-            try:
-                log.info(
-                    f"recognition connecting to hub central at {constants.BB_HUB_URI}"
-                )
-                async with websockets.client.connect(constants.BB_HUB_URI) as websocket:
-                    await messages.send_identity(websocket, "recognition")
-                    while not cls.is_stopping:
-                        if not cls.pause_event.is_set():
-                            log.info("recognition waiting on pause event")
-                            cls.pause_event.wait()
-                            log.info("recognition resumed")
-
-                        await cls.process_next_frame(websocket)
-                        await asyncio.sleep(0)
-            except:
-                if not cls.is_stopping:
-                    traceback.print_exc()
-                    log.error("recognition: websocket connection fail")
-
-            log.info("recognition thread: central_hub socket disconnected.")
-            if not cls.is_stopping:
-                log.info("Recognition reconnecting to central_hub in 5 sec...")
-                time.sleep(5)
-
-        log.info("recognition thread exiting")
+            camera_frame = frames.next(timeout=1)
+            if camera_frame is None or not cls.pause_event.is_set():
+                continue
+            objects = cls.tracker.predict(camera_frame.timestamp)
+            with cls.tracked_trace_lock:
+                trace, cls.tracked_trace = cls.tracked_trace, None
+            if cls.publisher is not None:
+                cls.publisher.publish({"recognition": objects}, trace=trace)
+        cls.camera.remove_consumer(frames)
 
     @classmethod
     def _thread(cls) -> None:
         log.info("Starting recognition thread.")
-        asyncio.run(cls.provide_state())
+        if c.BB_RECOGNITION_WORKERS > 0:
+            log.info(f"starting {c.BB_RECOGNITION_WORKERS} detection workers")
+            cls.pool = DetectionPool()
+            cls.pool.start()
+        else:
+            cls.pipeline = cls.create_pipeline()
+            if not cls.is_stopping:
+                cls.pipeline.run()
+
+        while cls.pool and not cls.is_stopping:
+            if not cls.pause_event.is_set():
+                log.info("recognition waiting on pause event")
+                cls.pause_event.wait()
+                log.info("recognition resumed")
+                continue
+
+            try:
+                cls.process_with_pool()
+            except Exception:
+                traceback.print_exc()
+                log.error("recognition: failed to process frame")
+                time.sleep(1)
+
+        if cls.pool:
+            cls.pool.stop()
+        log.info("recognition thread exiting")
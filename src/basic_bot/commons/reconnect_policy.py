@@ -0,0 +1,99 @@
+"""
+Exponential backoff with jitter for clients reconnecting to central_hub, or to
+any other websocket server.
+
+When central_hub restarts, every service on the robot loses its connection at the
+same moment.  Reconnecting on a fixed delay has them all reconnect, and request
+the full state, at the same moment again.  ReconnectPolicy waits a random time up
+to BB_RECONNECT_FIRST_DELAY before the first attempt, so recovery is quick and
+spread out, then doubles the wait from BB_RECONNECT_BASE_DELAY with each failed
+attempt up to BB_RECONNECT_MAX_DELAY.
+
+Usage:
+
+```python
+policy = ReconnectPolicy()
+while not is_stopping:
+    try:
+        async with websockets.client.connect(c.BB_HUB_URI) as websocket:
+            policy.reset()
+            ...
+    except Exception:
+        traceback.print_exc()
+    await policy.wait()
+```
+
+Use `policy.wait_sync()` in threads that don't run an event loop.
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Dict, Optional
+
+from basic_bot.commons import constants as c, log
+
+
+class ReconnectPolicy:
+    """Computes and waits the delay before each attempt to reconnect."""
+
+    def __init__(
+        self,
+        name: str = "central_hub",
+        first_delay: Optional[float] = None,
+        base_delay: Optional[float] = None,
+        max_delay: Optional[float] = None,
+        jitter: float = 0.5,
+    ) -> None:
+        """
+        Args:
+
+        - name: what is being reconnected to, for log messages
+        - first_delay: the most to wait before the first attempt;
+            defaults to BB_RECONNECT_FIRST_DELAY
+        - base_delay: the wait before the second attempt;
+            defaults to BB_RECONNECT_BASE_DELAY
+        - max_delay: the longest wait; defaults to BB_RECONNECT_MAX_DELAY
+        - jitter: fraction of the wait, after the first attempt, that is random
+        """
+        self.name = name
+        self.first_delay = c.BB_RECONNECT_FIRST_DELAY if first_delay is None else first_delay
+        self.base_delay = c.BB_RECONNECT_BASE_DELAY if base_delay is None else base_delay
+        self.max_delay = c.BB_RECONNECT_MAX_DELAY if max_delay is None else max_delay
+        self.jitter = jitter
+        # failed attempts since the last reset()
+        self.attempts = 0
+        self.total_reconnects = 0
+
+    def reset(self) -> None:
+        """Call when connected.  The next wait will be a fast first retry."""
+        if self.attempts > 0:
+            self.total_reconnects += 1
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        """Returns the delay before the next attempt and counts the attempt."""
+        attempt = self.attempts
+        self.attempts += 1
+        if attempt == 0:
+            return random.uniform(0, self.first_delay)
+
+        delay = min(self.base_delay * 2 ** (attempt - 1), self.max_delay)
+        return delay * random.uniform(1 - self.jitter, 1)
+
+    async def wait(self) -> float:
+        """Wait, without blocking the event loop, before the next attempt."""
+        delay = self.next_delay()
+        log.info(f"reconnecting to {self.name} in {delay:.2f} sec...")
+        await asyncio.sleep(delay)
+        return delay
+
+    def wait_sync(self) -> float:
+        """Wait, blocking the calling thread, before the next attempt."""
+        delay = self.next_delay()
+        log.info(f"reconnecting to {self.name} in {delay:.2f} sec...")
+        time.sleep(delay)
+        return delay
+
+    def stats(self) -> Dict[str, Any]:
+        return {"attempts": self.attempts, "total_reconnects": self.total_reconnects}
@@ -0,0 +1,167 @@
+"""
+A process wide connection to central_hub shared by all of the components of a
+service.
+
+Each HubStateMonitor has its own websocket, thread and event loop, and does its
+own `getState` on connect.  When a service is made up of several components that
+each talk to central_hub, like the vision service and its RecognitionProvider,
+they can instead register with the one SharedHubClient of the process:
+
+```python
+from basic_bot.commons.shared_hub_client import get_shared_hub_client
+
+hub = get_shared_hub_client("vision")
+hub.register(["throttles"], on_state_update=my_callback)
+hub.start()
+...
+hub.publish({"recognition": objects})
+```
+
+Subscriptions of all registered components are merged into one subscription.
+Each state update is dispatched to the components that registered for any of
+its keys, with only the data of those keys.  The identity of the connection is
+the identity passed to the first call of get_shared_hub_client.
+"""
+
+import concurrent.futures
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Literal, Optional, Union
+
+from websockets.client import WebSocketClientProtocol
+
+from basic_bot.commons import log
+from basic_bot.commons.hub_state import HubState
+from basic_bot.commons.hub_state_monitor import HubStateMonitor
+from basic_bot.commons.state_publisher import StatePublisher
+from basic_bot.commons.tracing import TraceContext
+
+StateUpdateCallback = Callable[[WebSocketClientProtocol, str, Dict[str, Any]], None]
+ConnectCallback = Callable[[WebSocketClientProtocol], None]
+
+
+@dataclass
+class HubConsumer:
+    """A component registered with the SharedHubClient."""
+
+    keys: Union[List[str], Literal["*"]]
+    on_state_update: Optional[StateUpdateCallback] = None
+    on_connect: Optional[ConnectCallback] = None
+    blob_keys: List[str] = field(default_factory=list)
+
+    def select(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the data of the keys this consumer registered for."""
+        if self.keys == "*":
+            return data
+        return {
+            key: value
+            for key, value in data.items()
+            if key in self.keys or key in self.blob_keys
+        }
+
+
+class SharedHubClient:
+    """One HubStateMonitor connection multiplexed for many consumers."""
+
+    def __init__(self, identity: str, hub_state: Optional[HubState] = None) -> None:
+        self.identity = identity
+        self.hub_state = hub_state or HubState({})
+        self.consumers: List[HubConsumer] = []
+        self.lock = threading.Lock()
+        self.monitor = HubStateMonitor(
+            self.hub_state,
+            identity,
+            [],
+            on_connect=self._on_connect,
+            on_state_update=self._on_state_update,
+        )
+        self.is_started = False
+
+    @property
+    def connected_socket(self) -> Optional[WebSocketClientProtocol]:
+        return self.monitor.connected_socket
+
+    def register(
+        self,
+        keys: Union[List[str], Literal["*"]],
+        on_state_update: Optional[StateUpdateCallback] = None,
+        on_connect: Optional[ConnectCallback] = None,
+        blob_keys: Optional[List[str]] = None,
+    ) -> HubConsumer:
+        """
+        Register a component that wants state updates for `keys`.  Components that
+        only publish can register with an empty list of keys or not at all.
+        """
+        consumer = HubConsumer(keys, on_state_update, on_connect, blob_keys or [])
+        with self.lock:
+            self.consumers = self.consumers + [consumer]
+        self.monitor.add_subscriptions(keys, blob_keys)
+        return consumer
+
+    def unregister(self, consumer: HubConsumer) -> None:
+        """
+        Stop dispatching to a consumer.  The hub subscription is kept since other
+        consumers may share the keys.
+        """
+        with self.lock:
+            self.consumers = [c for c in self.consumers if c is not consumer]
+
+    def start(self) -> None:
+        """Start the connection.  Safe to call more than once."""
+        with self.lock:
+            if self.is_started:
+                return
+            self.is_started = True
+        self.monitor.start()
+
+    def stop(self) -> None:
+        self.monitor.stop()
+
+    def publish(
+        self, key_values: Dict[str, Any], trace: Optional[TraceContext] = None
+    ) -> concurrent.futures.Future:
+        """
+        Send an `updateState` message from any thread.  See HubStateMonitor.publish.
+        """
+        return self.monitor.publish(key_values, trace=trace)
+
+    def add_publisher(self, publisher: StatePublisher) -> None:
+        """Reset the publisher on each connect.  See HubStateMonitor.add_publisher."""
+        self.monitor.add_publisher(publisher)
+
+    def _on_connect(self, websocket: WebSocketClientProtocol) -> None:
+        for consumer in self.consumers:
+            if consumer.on_connect:
+                consumer.on_connect(websocket)
+
+    def _on_state_update(
+        self, websocket: WebSocketClientProtocol, msg_type: str, msg_data: Dict[str, Any]
+    ) -> None:
+        for consumer in self.consumers:
+            if not consumer.on_state_update:
+                continue
+            data = consumer.select(msg_data)
+            if len(data) > 0:
+                consumer.on_state_update(websocket, msg_type, data)
+
+
+_shared_client: Optional[SharedHubClient] = None
+_shared_client_lock = threading.Lock()
+
+
+def get_shared_hub_client(identity: Optional[str] = None) -> SharedHubClient:
+    """
+    Return the SharedHubClient of this process, creating it on first call.
+    The identity of the first call is used for the connection.
+    """
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            if identity is None:
+                raise ValueError("identity is required to create the shared hub client")
+            _shared_client = SharedHubClient(identity)
+        elif identity is not None and identity != _shared_client.identity:
+            log.info(
+                f"shared_hub_client: {identity} is sharing the connection of {_shared_client.identity}"
+            )
+        return _shared_client
@@ -0,0 +1,281 @@
+"""
+Client side "only send if changed" for state keys, with optional per key rate
+limiting and numeric deadbands.
+
+```python
+from basic_bot.commons.state_publisher import StatePublisher
+
+publisher = StatePublisher(hub_monitor.publish)
+publisher.configure("servo_actual_angles", max_rate=10, deadband=0.5)
+
+# called as often as the service likes
+publisher.publish({"servo_actual_angles": angles})
+```
+
+For each key:
+
+- a value equal to the last value sent is not sent.  With a `deadband`, every
+  number in the value, including numbers nested in dictionaries and lists, must
+  differ by more than the deadband from the last value sent to be a change.
+- with a `max_rate` (publishes per second) a change that comes sooner than
+  `1 / max_rate` seconds after the last publish of the key is held.  If
+  `trailing` is true (the default), the last held value is sent once the
+  interval has passed so that subscribers always see the final value.
+
+Values of all keys passed to one publish() call that are sent together are sent
+as one `updateState` message.  The `publish` function passed to the constructor
+is called with a dictionary of key values and must be safe to call from a
+timer thread, like HubStateMonitor.publish.  To use with a websocket owned by an
+asyncio loop, pass the `loop` and the trailing edge flushes are scheduled on it.
+
+After reconnecting to central_hub, `reset()` so that the next value of each key
+is sent.  HubStateMonitor does this for the publishers added to it:
+
+```python
+hub_monitor.add_publisher(publisher)
+```
+
+The last value sent is kept by reference; publish new objects rather than
+changing a published value in place.
+"""
+
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from basic_bot.commons.tracing import TraceContext
+
+
+@dataclass
+class KeyPolicy:
+    """How a key is published.  See module doc."""
+
+    max_rate: Optional[float] = None
+    deadband: float = 0.0
+    trailing: bool = True
+
+    @property
+    def min_interval(self) -> float:
+        return 1 / self.max_rate if self.max_rate else 0.0
+
+
+def within_deadband(a: Any, b: Any, deadband: float = 0.0) -> bool:
+    """
+    True if `a` and `b` are the same value allowing numbers, at any depth of
+    dictionaries and lists, to differ by up to `deadband`.
+    """
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        a, b = np.asarray(a), np.asarray(b)
+        if a.shape != b.shape:
+            return False
+        if a.dtype.kind in "biuf" and b.dtype.kind in "biuf":
+            return bool(np.allclose(a, b, rtol=0, atol=deadband))
+        return bool(np.array_equal(a, b))
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a == b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return abs(a - b) <= deadband
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(
+            within_deadband(a[key], b[key], deadband) for key in a
+        )
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(
+            within_deadband(x, y, deadband) for x, y in zip(a, b)
+        )
+    return bool(a == b)
+
+
+class StatePublisher:
+    """Filters and rate limits state updates before passing them to `publish`."""
+
+    def __init__(
+        self,
+        publish: Callable[..., Any],
+        default_policy: Optional[KeyPolicy] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> None:
+        """
+        Args:
+
+        - publish: function called with the key values to send
+        - default_policy: policy of keys that have not been configured; by
+            default keys are sent whenever they change
+        - loop: optional event loop to schedule trailing edge flushes on
+        """
+        self._publish = publish
+        self.default_policy = default_policy or KeyPolicy()
+        self.loop = loop
+        self.policies: Dict[str, KeyPolicy] = {}
+        self.lock = threading.Lock()
+
+        self.last_sent: Dict[str, Any] = {}
+        self.last_sent_at: Dict[str, float] = {}
+        # values held by the rate limit, waiting for the trailing edge
+        self.pending: Dict[str, Any] = {}
+        self.timer: Optional[threading.Timer] = None
+        # the timer when flushes are scheduled on the loop
+        self.timer_handle: Optional[asyncio.TimerHandle] = None
+        self.flush_at: Optional[float] = None
+
+        self.sent_count = 0
+        self.unchanged_count = 0
+        self.rate_limited_count = 0
+
+    def configure(
+        self,
+        key: str,
+        max_rate: Optional[float] = None,
+        deadband: float = 0.0,
+        trailing: bool = True,
+    ) -> None:
+        """Set the policy of a key."""
+        self.policies[key] = KeyPolicy(max_rate, deadband, trailing)
+
+    def policy(self, key: str) -> KeyPolicy:
+        return self.policies.get(key, self.default_policy)
+
+    def publish(
+        self,
+        key_values: Dict[str, Any],
+        force: bool = False,
+        trace: Optional[TraceContext] = None,
+    ) -> Dict[str, Any]:
+        """
+        Send the keys that have changed and are not rate limited.  With
+        `force`, all keys are sent.  Returns the key values sent.
+
+        `trace` is passed on to the publish function if any keys are sent
+        right away.  Values sent by the trailing edge flush have no trace.
+        """
+        now = time.monotonic()
+        to_send: Dict[str, Any] = {}
+        with self.lock:
+            for key, value in key_values.items():
+                policy = self.policy(key)
+                if not force and key in self.last_sent:
+                    if within_deadband(value, self.last_sent[key], policy.deadband):
+                        # back to, or still at, what subscribers have
+                        self.pending.pop(key, None)
+                        self.unchanged_count += 1
+                        continue
+                    next_allowed = self.last_sent_at[key] + policy.min_interval
+                    if now < next_allowed:
+                        self.rate_limited_count += 1
+                        if policy.trailing:
+                            self.pending[key] = value
+                            self._schedule_flush(next_allowed - now)
+                        continue
+
+                self.pending.pop(key, None)
+                to_send[key] = value
+                self._mark_sent(key, value, now)
+
+        if to_send:
+            if trace is not None:
+                self._publish(to_send, trace=trace)
+            else:
+                self._publish(to_send)
+        return to_send
+
+    def flush(self) -> Dict[str, Any]:
+        """Send all values held by rate limits now.  Returns the key values sent."""
+        now = time.monotonic()
+        with self.lock:
+            to_send = self.pending
+            self.pending = {}
+            for key, value in to_send.items():
+                self._mark_sent(key, value, now)
+        if to_send:
+            self._publish(to_send)
+        return to_send
+
+    def reset(self) -> None:
+        """
+        Forget what was sent so that the next publish of each key is sent.  Call
+        after reconnecting to central_hub.
+        """
+        with self.lock:
+            self.last_sent = {}
+            self.last_sent_at = {}
+
+    def stop(self) -> None:
+        """Cancel the trailing edge flush, if any.  Held values are not sent."""
+        with self.lock:
+            self.pending = {}
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+            if self.timer_handle and self.loop:
+                try:
+                    self.loop.call_soon_threadsafe(self.timer_handle.cancel)
+                except RuntimeError:
+                    pass  # loop closed
+                self.timer_handle = None
+            self.flush_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sent": self.sent_count,
+            "unchanged": self.unchanged_count,
+            "rate_limited": self.rate_limited_count,
+            "pending": list(self.pending.keys()),
+        }
+
+    def _mark_sent(self, key: str, value: Any, now: float) -> None:
+        self.last_sent[key] = value
+        self.last_sent_at[key] = now
+        self.sent_count += 1
+
+    def _schedule_flush(self, delay: float) -> None:
+        # called with the lock held
+        flush_at = time.monotonic() + delay
+        if self.flush_at is not None and self.flush_at <= flush_at:
+            return
+        self.flush_at = flush_at
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._call_later, flush_at)
+        else:
+            if self.timer:
+                self.timer.cancel()
+            self.timer = threading.Timer(delay, self._on_timer)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _call_later(self, flush_at: float) -> None:
+        # called on the loop
+        assert self.loop
+        with self.lock:
+            if self.flush_at != flush_at:
+                return  # stopped, or rescheduled, since
+            if self.timer_handle:
+                self.timer_handle.cancel()
+            self.timer_handle = self.loop.call_later(
+                max(0.0, flush_at - time.monotonic()), self._on_timer
+            )
+
+    def _on_timer(self) -> None:
+        now = time.monotonic()
+        to_send: Dict[str, Any] = {}
+        next_delays: List[float] = []
+        with self.lock:
+            self.timer = None
+            self.timer_handle = None
+            self.flush_at = None
+            for key, value in list(self.pending.items()):
+                next_allowed = self.last_sent_at.get(key, 0) + self.policy(key).min_interval
+                if now >= next_allowed:
+                    to_send[key] = value
+                    del self.pending[key]
+                    self._mark_sent(key, value, now)
+                else:
+                    next_delays.append(next_allowed - now)
+            if next_delays:
+                self._schedule_flush(min(next_delays))
+
+        if to_send:
+            self._publish(to_send)
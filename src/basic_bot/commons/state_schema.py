@@ -0,0 +1,94 @@
+"""
+Optional schemas for state keys whose values are numeric vectors or arrays,
+like distance sensor ranges or bounding boxes.
+
+HubState stores the values of a key with a schema as a read only NumPy array
+of the schema's dtype.  The shape is validated once, when the value is
+received, instead of by each reader, and readers get the stored array itself
+instead of a list that has to be converted on every update:
+
+```python
+from basic_bot.commons.hub_state import HubState
+from basic_bot.commons.state_schema import ArraySchema
+
+hub_state = HubState({}, schemas={"lidar_ranges": ArraySchema("float32", (None,))})
+hub_state.update({"lidar_ranges": [1.5, 1.25, 0.5]})
+ranges = hub_state.state["lidar_ranges"]  # np.ndarray, dtype float32
+closest = ranges.min()
+```
+
+Schemas for central_hub are declared in basic_bot.yml:
+
+```yaml
+state_schemas:
+  lidar_ranges:
+    dtype: float32
+    shape: [null]  # one dimension of any length
+  target_box:
+    dtype: float64
+    shape: [4]
+```
+
+On the wire the values are still json lists.  Use `messages.json_default` as the
+`default` of json.dumps to encode arrays; `send_update_state` and HubState do
+this already.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+
+class SchemaError(ValueError):
+    """Raised when a value does not match the schema of its key."""
+
+
+@dataclass(frozen=True)
+class ArraySchema:
+    """
+    The dtype and shape of the values of a state key.  Dimensions of None in
+    the shape may be of any length.
+    """
+
+    dtype: str = "float64"
+    shape: Tuple[Optional[int], ...] = (None,)
+
+    def coerce(self, key: str, value: Any) -> np.ndarray:
+        """
+        Returns `value` as a read only array of the schema's dtype, or raises
+        SchemaError if it can't be converted or its shape doesn't match.  Arrays
+        that already have the dtype are not copied.
+        """
+        try:
+            array = np.asarray(value, dtype=self.dtype)
+        except (TypeError, ValueError) as e:
+            raise SchemaError(f"{key}: {e}")
+
+        if array.ndim != len(self.shape) or any(
+            expected is not None and actual != expected
+            for actual, expected in zip(array.shape, self.shape)
+        ):
+            raise SchemaError(
+                f"{key}: expected shape {self.shape}, received {array.shape}"
+            )
+
+        if array is value:
+            # don't change the flags of the caller's array
+            array = array.view()
+        array.flags.writeable = False
+        return array
+
+
+def schemas_from_config(config: Dict[str, Any]) -> Dict[str, ArraySchema]:
+    """
+    Returns the ArraySchemas of the `state_schemas` property of basic_bot.yml,
+    or of a dictionary of the same form.
+    """
+    return {
+        key: ArraySchema(
+            dtype=schema.get("dtype", "float64"),
+            shape=tuple(schema.get("shape", [None])),
+        )
+        for key, schema in config.items()
+    }
@@ -0,0 +1,101 @@
+"""
+A hub client for synchronous code, like servo threads and OpenCV loops, that
+never blocks on the network.
+
+The connection is owned by a background thread (see HubStateMonitor) which
+keeps a local copy of the subscribed keys.  Reads come from that copy and
+publishes are handed to the background thread:
+
+```python
+from basic_bot.commons.hub_state import HubState
+from basic_bot.commons.sync_hub_client import SyncHubClient
+
+hub = SyncHubClient(HubState({}), "my_control_loop", ["throttles"])
+hub.start()
+
+while running:
+    # latest value received, without waiting
+    throttles = hub.get("throttles", {"left": 0, "right": 0})
+    ...
+    hub.publish({"motors": motors})
+
+# or block until central_hub sends a new value
+throttles = hub.wait_for_update("throttles", timeout=1)
+```
+
+`get()`, `publish()` and `wait_for_update()` may be called from any thread.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from basic_bot.commons.hub_state_monitor import HubStateMonitor
+
+
+class SyncHubClient(HubStateMonitor):
+    """HubStateMonitor with thread-safe get() and wait_for_update()."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """Takes the same arguments as HubStateMonitor."""
+        super().__init__(*args, **kwargs)
+        # hub_state.version when each key was last received
+        self.key_versions: Dict[str, int] = {}
+        self.condition = threading.Condition()
+
+    def stop(self) -> None:
+        """Stop the background thread.  Threads in wait_for_update() return None."""
+        super().stop()
+        with self.condition:
+            self.condition.notify_all()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        The latest value received for a key or path selector, or `default` if
+        none has been received.  Does not block.
+        """
+        return self.hub_state.get([key]).get(key, default)
+
+    def get_version(self, key: str) -> int:
+        """
+        The hub_state version when `key` was last received, or 0 if it has not
+        been received.  Can be passed as `since` to wait_for_update().
+        """
+        with self.condition:
+            return self.key_versions.get(key, 0)
+
+    def wait_for_update(
+        self, key: str, timeout: Optional[float] = None, since: Optional[int] = None
+    ) -> Any:
+        """
+        Block until a value of `key` is received and return it.
+
+        Args:
+
+        - key: state key or path selector; must be subscribed
+        - timeout: seconds to wait; raises TimeoutError when exceeded
+        - since: a version from get_version(); returns immediately if the key
+            was received after that version.  Defaults to the current version
+            so that only values received after the call are returned.
+
+        Returns None if the client is stopped while waiting.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            if since is None:
+                since = self.key_versions.get(key, 0)
+            while self.key_versions.get(key, 0) <= since:
+                if self.should_exit:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"no update of {key} within {timeout} sec")
+                self.condition.wait(remaining)
+        return self.get(key)
+
+    def on_state_applied(self, msg_data: Dict[str, Any]) -> None:
+        version = self.hub_state.version
+        with self.condition:
+            for key in msg_data:
+                self.key_versions[key] = version
+            self.condition.notify_all()
@@ -9,6 +9,87 @@ from basic_bot.commons import constants as c, log
 from basic_bot.commons.coco_lables import coco_lables as labels
 
 
+# preallocated preprocess() outputs that are reused in turn.  The recognition
+# pipeline may have one frame being preprocessed, one queued and one being
+# copied to the interpreter, so there must be more than three.
+SCRATCH_BUFFERS = 4
+
+# one detected object; see detections_to_dicts() for the published form
+DETECTION_DTYPE = np.dtype(
+    [
+        # x1, y1, x2, y2 in pixels of the image
+        ("bounding_box", np.float32, (4,)),
+        ("class_id", np.int32),
+        ("confidence", np.float32),
+    ]
+)
+
+
+def detections_from_outputs(
+    outputs: List[Any],
+    shape: Any,
+    threshold: Optional[float] = None,
+    class_ids: Optional[Any] = None,
+    batch_index: int = 0,
+) -> np.ndarray:
+    """
+    Return the detections in the boxes, classes, scores and count output by an
+    SSD style model as a structured array of DETECTION_DTYPE.
+
+    Args:
+
+    - outputs: the output tensors; boxes are [top, left, bottom, right] 0 - 1
+    - shape: the shape of the image the detections are scaled to
+    - threshold: minimum confidence; default BB_OBJECT_DETECTION_THRESHOLD
+    - class_ids: if not None, only detections of these class ids are returned
+    - batch_index: which image of a batch
+    """
+    if threshold is None:
+        threshold = c.BB_OBJECT_DETECTION_THRESHOLD
+    boxes, classes, scores, counts = outputs
+    count = int(np.ravel(counts)[batch_index])
+    scores = scores[batch_index, :count]
+    classes = classes[batch_index, :count].astype(np.int32)
+
+    keep = scores > threshold
+    if class_ids is not None:
+        keep &= np.isin(classes, class_ids)
+
+    height, width = shape[:2]
+    # [top, left, bottom, right] -> [x1, y1, x2, y2]
+    xyxy = boxes[batch_index, :count][keep][:, [1, 0, 3, 2]]
+    detections = np.empty(int(keep.sum()), dtype=DETECTION_DTYPE)
+    detections["bounding_box"] = xyxy * np.array(
+        [width, height, width, height], dtype=np.float32
+    )
+    detections["class_id"] = classes[keep]
+    detections["confidence"] = scores[keep]
+    return detections
+
+
+def detections_to_dicts(detections: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    The published form of a DETECTION_DTYPE array.  Each detected object is a
+    dictionary with the following:
+
+    - bounding_box: [x1, y1, x2, y2]
+    - classification: string
+    - confidence: float (0-1)
+    """
+    return [
+        {
+            "bounding_box": box,
+            "classification": labels[class_id],
+            "confidence": confidence,
+        }
+        for box, class_id, confidence in zip(
+            detections["bounding_box"].tolist(),
+            detections["class_id"].tolist(),
+            detections["confidence"].tolist(),
+        )
+    ]
+
+
 class TFLiteDetect:
     """
     This class provides object detection using Tensor Flow Lite.
@@ -16,7 +97,10 @@ class TFLiteDetect:
 
     # args are used for testing
     def __init__(
-        self, model: Optional[str] = None, use_coral_tpu: Optional[bool] = None
+        self,
+        model: Optional[str] = None,
+        use_coral_tpu: Optional[bool] = None,
+        classes: Optional[List[str]] = None,
     ) -> None:
         """
         Constructor
@@ -25,7 +109,15 @@ class TFLiteDetect:
 
         - model: the path to the tflite model file
         - use_coral_tpu: whether to use the Coral TPU for inference
+        - classes: if not None, only objects with these classifications
+            are detected
         """
+        self.class_ids = (
+            None
+            if classes is None
+            else np.array([i for i, label in enumerate(labels) if label in classes])
+        )
+
         # Initialize the object detection model
         if use_coral_tpu is None:
             use_coral_tpu = c.BB_ENABLE_CORAL_TPU
@@ -56,6 +148,19 @@ class TFLiteDetect:
         self.floating_model = False
         if self.input_details[0]["dtype"] == np.float32:
             self.floating_model = True
+        # images per invoke(); 1 for most detection models
+        self.batch_size = max(1, int(self.input_details[0]["shape"][0]))
+
+        self.input_index = self.input_details[0]["index"]
+        input_shape = (1, self.height, self.width, 3)
+        # resized frames, and normalized frames for float models, are written to
+        # these instead of allocating new arrays for each frame
+        self.resized = np.empty(input_shape[1:], dtype=np.uint8)
+        self.scratch = [
+            np.empty(input_shape, dtype=self.input_details[0]["dtype"])
+            for _ in range(SCRATCH_BUFFERS)
+        ]
+        self.next_scratch = 0
 
     def get_prediction(self, img: Any) -> List[Dict[str, Any]]:
         """
@@ -68,37 +173,106 @@ class TFLiteDetect:
         - confidence: float (0-1)
 
         """
-        initial_h, initial_w, channels = img.shape
-        frame = cv2.resize(img, (self.width, self.height))
+        # preprocess straight into the interpreter's input tensor.  No
+        # reference to its memory may be held when the interpreter is invoked.
+        input_tensor = self.interpreter.tensor(self.input_index)()
+        self.preprocess(img, out=input_tensor)
+        del input_tensor
+        return self.postprocess(self.infer(None, copy=False), img.shape)
 
-        input_data = np.expand_dims(frame, axis=0)
-        if self.floating_model:
-            input_data = (np.float32(input_data) - 127.5) / 127.5  # type: ignore
-        self.interpreter.set_tensor(self.input_details[0]["index"], input_data)
-
-        self.interpreter.invoke()
-        detected_boxes = self.interpreter.get_tensor(self.output_details[0]["index"])
-        detected_classes = self.interpreter.get_tensor(self.output_details[1]["index"])
-        detected_scores = self.interpreter.get_tensor(self.output_details[2]["index"])
-        num_boxes = self.interpreter.get_tensor(self.output_details[3]["index"])
+    def get_predictions(self, imgs: List[Any]) -> List[List[Dict[str, Any]]]:
+        """
+        Return the detected objects, as described in get_prediction(), for
+        each of a list of images.  Models with a batch dimension are invoked
+        once per batch of images.
+        """
+        return [detections_to_dicts(d) for d in self.get_detection_arrays(imgs)]
 
+    def get_detection_arrays(self, imgs: List[Any]) -> List[np.ndarray]:
+        """Like get_predictions() but returns DETECTION_DTYPE arrays."""
         results = []
-        for i in range(int(num_boxes)):
-            top, left, bottom, right = detected_boxes[0][i]
-            classId = int(detected_classes[0][i])
-            score = float(detected_scores[0][i])
-            if score > c.BB_OBJECT_DETECTION_THRESHOLD:
-                xmin = left * initial_w
-                ymin = top * initial_h
-                xmax = right * initial_w
-                ymax = bottom * initial_h
-                box = [float(xmin), float(ymin), float(xmax), float(ymax)]
-                class_name = labels[classId]
-                results.append(
-                    {
-                        "bounding_box": box,
-                        "classification": class_name,
-                        "confidence": score,
-                    }
-                )
+        for start in range(0, len(imgs), self.batch_size):
+            batch = imgs[start : start + self.batch_size]
+            input_tensor = self.interpreter.tensor(self.input_index)()
+            for index, img in enumerate(batch):
+                self.preprocess(img, out=input_tensor[index : index + 1])
+            # a short last batch is padded with whatever was there before
+            del input_tensor
+
+            outputs = self.infer(None, copy=False)
+            for index, img in enumerate(batch):
+                results.append(self.postprocess_array(outputs, img.shape, index))
+            del outputs
         return results
+
+    def preprocess(self, img: Any, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Resize and normalize an image array to the input of the model.
+
+        The result is written to `out`, a (1, height, width, 3) array of the
+        model's input dtype, or to the next of SCRATCH_BUFFERS preallocated
+        arrays that is reused after SCRATCH_BUFFERS more calls.
+        """
+        # cv2.resize() silently allocates a new array, leaving `out` unwritten,
+        # unless the image resizes to exactly the shape and dtype of `out`
+        if img.ndim != 3 or img.shape[2] != 3 or img.dtype != np.uint8:
+            raise ValueError(
+                f"expected a uint8 BGR image, got {img.dtype} image of {img.shape}"
+            )
+        if out is None:
+            out = self.scratch[self.next_scratch]
+            self.next_scratch = (self.next_scratch + 1) % SCRATCH_BUFFERS
+        elif out.shape[1:] != (self.height, self.width, 3):
+            raise ValueError(f"preprocess output shape {out.shape} is not the input")
+
+        if not self.floating_model:
+            cv2.resize(img, (self.width, self.height), dst=out[0])
+            return out
+
+        cv2.resize(img, (self.width, self.height), dst=self.resized)
+        # (pixel - 127.5) / 127.5 in place, without temporary arrays
+        out[0] = self.resized
+        out *= 1 / 127.5
+        out -= 1.0
+        return out
+
+    def infer(self, input_data: Optional[np.ndarray], copy: bool = True) -> List[Any]:
+        """
+        Run the model on the output of preprocess() and return the boxes,
+        classes, scores and number of detections output by the model.
+
+        With input_data None, the model is run on what is already in its input
+        tensor.  With copy False, the outputs are views of the interpreter's
+        memory that are only valid until the next call and must not be held
+        when it is called.
+        """
+        if input_data is not None:
+            self.interpreter.set_tensor(self.input_index, input_data)
+        self.interpreter.invoke()
+        if copy:
+            return [
+                self.interpreter.get_tensor(self.output_details[i]["index"])
+                for i in range(4)
+            ]
+        return [
+            self.interpreter.tensor(self.output_details[i]["index"])()
+            for i in range(4)
+        ]
+
+    def postprocess(self, outputs: List[Any], shape: Any) -> List[Dict[str, Any]]:
+        """
+        Return the detected objects, as described in get_prediction(), in the
+        outputs of infer() for an image of the given shape.
+        """
+        return detections_to_dicts(self.postprocess_array(outputs, shape))
+
+    def postprocess_array(
+        self, outputs: List[Any], shape: Any, batch_index: int = 0
+    ) -> np.ndarray:
+        """
+        Return the detected objects in the outputs of infer() as a
+        DETECTION_DTYPE array.  See detections_from_outputs().
+        """
+        return detections_from_outputs(
+            outputs, shape, class_ids=self.class_ids, batch_index=batch_index
+        )
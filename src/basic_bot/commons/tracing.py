@@ -0,0 +1,275 @@
+"""
+Cross-service latency tracing for state updates relayed by central_hub.
+
+A trace context is an ID plus a list of `[hop, timestamp]` stamps that rides
+along with an `updateState` message as the optional top level `trace` property:
+
+```json
+{
+    "type": "updateState",
+    "data": {"recognition": [...]},
+    "trace": {
+        "id": "4f0c...",
+        "stamps": [["recognition.origin", 1712345678.123], ["recognition.send", 1712345678.131]]
+    }
+}
+```
+
+central_hub stamps `central_hub.recv` and `central_hub.relay` and forwards the trace
+with the `stateUpdate` sent to subscribers.  HubStateMonitor stamps `<identity>.deliver`
+when the message arrives and `<identity>.callback_done` after on_state_update returns,
+then hands the trace to the process local collector.
+
+Usage:
+
+```python
+from basic_bot.commons import messages, tracing
+
+trace = tracing.new_trace("my_service")
+await messages.send_update_state(websocket, {"foo": "bar"}, trace=trace)
+```
+
+Stamps are in hub time when the trace has a `clock` (see basic_bot.commons.clock_sync)
+so that the hops of a trace that crosses hosts are measured on one clock.  Pass the
+`ClockSync` of the process's HubStateMonitor, `monitor.clock`, to `new_trace` and
+`send_update_state`; HubStateMonitor does this for the traces it sends and receives.
+
+To continue a trace from inside a HubStateMonitor on_state_update callback, so that
+a chain like camera frame → recognition → behavior → servo can be measured end to
+end, pass `tracing.current_trace()` as the trace of the update you send.
+
+Spans are only written when `BB_TRACE_FILE` is set.  The file is written in the
+Chrome trace event "JSON Array Format" and can be opened with chrome://tracing or
+https://ui.perfetto.dev.  All services may share the same trace file.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from basic_bot.commons import constants as c, log
+from basic_bot.commons.clock_sync import ClockSync
+
+
+@dataclass
+class TraceContext:
+    """Trace ID and the hop stamps collected so far."""
+
+    id: str
+    stamps: List[List[Any]] = field(default_factory=list)
+    # identity of whoever currently holds the trace; used to prefix stamps
+    holder: str = ""
+    # the holder's hub clock estimate; not sent with the trace
+    clock: Optional[ClockSync] = field(default=None, repr=False, compare=False)
+
+    @property
+    def origin_ts(self) -> Optional[float]:
+        """The timestamp of the first stamp in the trace."""
+        return self.stamps[0][1] if self.stamps else None
+
+    def stamp(self, hop: str, ts: Optional[float] = None) -> "TraceContext":
+        """
+        Append a `<holder>.<hop>` stamp.  `ts` defaults to now, in hub time if
+        the trace has a clock.
+        """
+        label = f"{self.holder}.{hop}" if self.holder else hop
+        if ts is None:
+            ts = self.clock.hub_time() if self.clock else time.time()
+        self.stamps.append([label, ts])
+        return self
+
+    def hold(
+        self,
+        identity: str,
+        hop: Optional[str] = None,
+        clock: Optional[ClockSync] = None,
+    ) -> "TraceContext":
+        """
+        Take over the trace as `identity`, with the hub `clock` of `identity`
+        if any, optionally stamping `hop`.
+        """
+        self.holder = identity
+        self.clock = clock
+        if hop:
+            self.stamp(hop)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "stamps": self.stamps}
+
+    @classmethod
+    def from_dict(cls, data: Any) -> Optional["TraceContext"]:
+        """Returns None if data is not a valid trace dictionary."""
+        if not isinstance(data, dict) or "id" not in data:
+            return None
+        stamps = data.get("stamps") or []
+        return cls(id=str(data["id"]), stamps=[list(s) for s in stamps])
+
+
+def new_trace(
+    origin: str,
+    origin_ts: Optional[float] = None,
+    clock: Optional[ClockSync] = None,
+) -> TraceContext:
+    """
+    Start a new trace held by `origin`.  `origin_ts` can be used to backdate the
+    start of the trace, for example to the time a camera frame was captured, and
+    is in local time.  With a hub `clock`, the trace is stamped in hub time.
+    """
+    trace = TraceContext(id=uuid.uuid4().hex, holder=origin, clock=clock)
+    if origin_ts is not None and clock is not None:
+        origin_ts = clock.to_hub_time(origin_ts)
+    trace.stamp("origin", origin_ts)
+    return trace
+
+
+def from_message(message: Dict[str, Any]) -> Optional[TraceContext]:
+    """Return the trace context of a parsed hub message or None."""
+    return TraceContext.from_dict(message.get("trace"))
+
+
+_current_trace: contextvars.ContextVar[Optional[TraceContext]] = (
+    contextvars.ContextVar("bb_current_trace", default=None)
+)
+
+
+def current_trace() -> Optional[TraceContext]:
+    """
+    Returns the trace of the message being delivered to the current
+    on_state_update callback, or None.
+    """
+    return _current_trace.get()
+
+
+def set_current_trace(trace: Optional[TraceContext]) -> contextvars.Token:
+    """Used by HubStateMonitor around callbacks.  Returns a token for reset."""
+    return _current_trace.set(trace)
+
+
+def reset_current_trace(token: contextvars.Token) -> None:
+    _current_trace.reset(token)
+
+
+class TraceCollector:
+    """
+    Converts completed traces to Chrome trace "complete" (ph=X) events, one per
+    hop, and appends them to a trace file.
+
+    Each process appends to the same file.  The first writer creates the file
+    and writes the opening `[`; the closing `]` is optional in this format.
+    """
+
+    def __init__(self, file_path: str, process_name: str = "") -> None:
+        self.file_path = file_path
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.process_named = False
+        self.process_name = process_name or f"pid {self.pid}"
+        self.traces_recorded = 0
+
+    def spans(self, trace: TraceContext, consumer: str) -> List[Dict[str, Any]]:
+        """Returns one chrome trace event for each hop in the trace."""
+        events = []
+        stamps = trace.stamps
+        for (prev_label, prev_ts), (label, ts) in zip(stamps, stamps[1:]):
+            events.append(
+                {
+                    "name": label,
+                    "cat": "bb_trace",
+                    "ph": "X",
+                    # chrome trace timestamps are in microseconds
+                    "ts": prev_ts * 1e6,
+                    "dur": max(ts - prev_ts, 0) * 1e6,
+                    "pid": self.pid,
+                    "tid": threading.get_ident(),
+                    "args": {"trace_id": trace.id, "from": prev_label, "consumer": consumer},
+                }
+            )
+        if stamps:
+            events.append(
+                {
+                    "name": f"{consumer} total",
+                    "cat": "bb_trace",
+                    "ph": "X",
+                    "ts": stamps[0][1] * 1e6,
+                    "dur": max(stamps[-1][1] - stamps[0][1], 0) * 1e6,
+                    "pid": self.pid,
+                    "tid": 0,
+                    "args": {"trace_id": trace.id, "hops": len(stamps) - 1},
+                }
+            )
+        return events
+
+    def record(self, trace: TraceContext, consumer: str) -> None:
+        """Write the spans for a completed trace to the trace file."""
+        events = self.spans(trace, consumer)
+        if not self.process_named:
+            self.process_named = True
+            events.insert(
+                0,
+                {
+                    "name": "process_name",
+                    "ph": "M",
+                    "pid": self.pid,
+                    "args": {"name": self.process_name},
+                },
+            )
+        lines = "".join(json.dumps(event) + ",\n" for event in events)
+        try:
+            with self.lock:
+                self._ensure_header()
+                with open(self.file_path, "a") as f:
+                    f.write(lines)
+            self.traces_recorded += 1
+        except IOError as e:
+            log.error(f"tracing: failed to write {self.file_path}: {e}")
+
+    def _ensure_header(self) -> None:
+        try:
+            fd = os.open(self.file_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return
+        with os.fdopen(fd, "w") as f:
+            f.write("[\n")
+
+
+_collector: Optional[TraceCollector] = None
+
+
+def enabled() -> bool:
+    """True if BB_TRACE_FILE is set."""
+    return bool(c.BB_TRACE_FILE)
+
+
+def get_collector(process_name: str = "") -> Optional[TraceCollector]:
+    """Return the process wide collector or None if tracing is disabled."""
+    global _collector
+    if not enabled():
+        return None
+    if _collector is None:
+        _collector = TraceCollector(c.BB_TRACE_FILE, process_name)
+    return _collector
+
+
+def record(trace: TraceContext, consumer: str) -> None:
+    """Hand a completed trace to the process collector if tracing is enabled."""
+    collector = get_collector(consumer)
+    if collector:
+        collector.record(trace, consumer)
+
+
+def load_trace_file(file_path: str) -> List[Dict[str, Any]]:
+    """Read back the events written by TraceCollector. Useful for tests."""
+    with open(file_path, "r") as f:
+        text = f.read().strip()
+    if text.endswith(","):
+        text = text[:-1]
+    if not text.endswith("]"):
+        text += "]"
+    events: List[Dict[str, Any]] = json.loads(text)
+    return events
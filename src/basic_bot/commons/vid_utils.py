@@ -48,13 +48,18 @@ def record_video(camera: Camera, duration: float) -> str:
     )
     first_frame = None
 
+    # read every frame, in order, as long as the writer keeps up
+    frames = camera.consumer("record_video", newest=False)
     tstart = time.time()
     log.info(f"Recording {duration} seconds of video to {video_filename}")
     while True:
         if time.time() - tstart > duration:
             break
-        frame = camera.get_frame()
-        writer.write(frame)
+        camera_frame = frames.next(timeout=1)
+        if camera_frame is None:
+            continue
+        frame = camera_frame.image
+        writer.write(frame)  # type: ignore[arg-type]
         if first_frame is None:
             first_frame = frame
 
@@ -3,58 +3,95 @@ import json
 import platform
 import subprocess
 import time
-from typing import Any, Optional
+from typing import Any, Dict, Optional, Set, Tuple
+import cv2
 import numpy as np
 import uuid
 
 from aiohttp import web
 from aiortc import RTCPeerConnection, RTCSessionDescription, RTCIceCandidate
 from aiortc.contrib.media import MediaRelay, MediaPlayer
-from aiortc.mediastreams import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
 from av import VideoFrame
 from fractions import Fraction
 
 from basic_bot.commons import log, constants as c
 from basic_bot.commons.base_camera import BaseCamera
 
+# fractions of the captured size that clients may ask for; the size asked for
+# is rounded up to one of these, so there are never more shared video tracks
+VIDEO_SCALES = (1.0, 0.75, 0.5, 0.25)
+
 
 class CameraStreamTrack(MediaStreamTrack):
+    """
+    Video track of the camera frames.  recv() awaits the next frame without
+    blocking the event loop, so it is paced by the camera, and frame times
+    (pts) are the capture times of the frames.
+
+    WebrtcPeers shares one track per size among all peers via a MediaRelay,
+    so each frame is converted to a VideoFrame once however many peers watch.
+    """
+
     kind = "video"
 
-    def __init__(self, camera: BaseCamera):
+    def __init__(self, camera: BaseCamera, size: Optional[Tuple[int, int]] = None):
+        """
+        Args:
+
+        - camera: the camera to stream
+        - size: (width, height) to resize the frames to, or None for the size
+            captured
+        """
         super().__init__()
         self.camera = camera
+        self.size = size
+        name = "webrtc" if size is None else f"webrtc_{size[0]}x{size[1]}"
+        self.frames = camera.consumer(name)
         self.start_time: Optional[float] = None
 
     async def recv(self) -> VideoFrame:
-        # Initialize start time on first frame
-        if self.start_time is None:
-            self.start_time = time.time()
+        if self.readyState != "live":
+            raise MediaStreamError
 
-        frame_data = self.camera.get_frame()
-        if frame_data is None:
+        camera_frame = await self.frames.next_async(timeout=1)
+        if camera_frame is None:
             # Create a default black frame if no frame is available
-            frame_array = np.zeros((480, 640, 3), dtype=np.uint8)
+            width, height = self.size or (c.BB_VISION_WIDTH, c.BB_VISION_HEIGHT)
+            frame_array: np.ndarray = np.zeros((height, width, 3), dtype=np.uint8)
+            captured_at = time.time()
         else:
             # The frame from camera is actually a numpy array despite the typing
-            frame_array = frame_data  # type: ignore
+            frame_array = camera_frame.image  # type: ignore
+            captured_at = camera_frame.timestamp
+            if self.size is not None and frame_array.shape[1::-1] != self.size:
+                frame_array = cv2.resize(frame_array, self.size)
+
+        # Initialize start time on first frame
+        if self.start_time is None:
+            self.start_time = captured_at
 
         video_frame = VideoFrame.from_ndarray(frame_array, format="bgr24")
 
-        # Set PTS based on elapsed time for proper timing
-        elapsed_time = time.time() - self.start_time
-        video_frame.pts = int(elapsed_time * 90000)  # 90kHz timebase
+        # PTS from the capture time for proper timing
+        video_frame.pts = int((captured_at - self.start_time) * 90000)  # 90kHz timebase
         video_frame.time_base = Fraction(1, 90000)
-
-        await asyncio.sleep(1 / 30)  # Target 30 fps
         return video_frame
 
+    def stop(self) -> None:
+        super().stop()
+        self.camera.remove_consumer(self.frames)
+
 
 class WebrtcPeers:
     def __init__(self, camera: BaseCamera):
         self.pcs: dict[str, RTCPeerConnection] = dict()
         self.relay = MediaRelay()
         self.camera = camera
+        # one shared video source track by frame size (None for the captured
+        # size) and the client_ids of the peers watching it
+        self.video_sources: Dict[Optional[Tuple[int, int]], CameraStreamTrack] = {}
+        self.video_watchers: Dict[Optional[Tuple[int, int]], Set[str]] = {}
         # Audio streaming variables
         self.microphone: Optional[MediaPlayer] = None
         self.arecord_process: Optional[subprocess.Popen] = None
@@ -156,6 +193,11 @@ class WebrtcPeers:
         await asyncio.gather(*promises)
         self.pcs.clear()
 
+        for source in self.video_sources.values():
+            source.stop()
+        self.video_sources.clear()
+        self.video_watchers.clear()
+
         # cleanup audio resources
         self._cleanup_audio()
         log.debug("Closed all webrtc peer connections and cleaned up audio")
@@ -183,10 +225,12 @@ class WebrtcPeers:
             log.info(f"Connection state is {pc.connectionState}")
             if pc.connectionState == "failed":
                 await pc.close()
+            if pc.connectionState in ["failed", "closed"]:
                 self.pcs.pop(client_id, None)
+                self._unsubscribe_video(client_id)
 
-        # Add video track
-        pc.addTrack(CameraStreamTrack(self.camera))
+        # Add video track, shared with the other peers watching the same size
+        pc.addTrack(self._subscribe_video(client_id, self._video_size(params)))
 
         # Add audio track
         audio_track = self._initialize_audio()
@@ -214,6 +258,50 @@ class WebrtcPeers:
             ),
         )
 
+    def _video_size(self, params: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+        """
+        The smallest of VIDEO_SCALES of the captured size that is at least the
+        optional `width` and `height` of the offer, or None for the captured size.
+        """
+        try:
+            width, height = int(params["width"]), int(params["height"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if width <= 0 or height <= 0:
+            return None
+        for scale in sorted(VIDEO_SCALES):
+            # even, as the video encoders require
+            size = (
+                int(c.BB_VISION_WIDTH * scale) // 2 * 2,
+                int(c.BB_VISION_HEIGHT * scale) // 2 * 2,
+            )
+            if size[0] >= width and size[1] >= height:
+                return None if scale >= 1 else size
+        return None
+
+    def _subscribe_video(
+        self, client_id: str, size: Optional[Tuple[int, int]]
+    ) -> MediaStreamTrack:
+        source = self.video_sources.get(size)
+        if source is None:
+            log.info(f"Starting shared webrtc video track, size={size}")
+            source = self.video_sources[size] = CameraStreamTrack(self.camera, size)
+            self.video_watchers[size] = set()
+        self.video_watchers[size].add(client_id)
+        # unbuffered; a peer that falls behind gets the latest frame
+        return self.relay.subscribe(source, buffered=False)
+
+    def _unsubscribe_video(self, client_id: str) -> None:
+        for size, watchers in list(self.video_watchers.items()):
+            if client_id not in watchers:
+                continue
+            watchers.discard(client_id)
+            if not watchers:
+                # ends the relay's reading of the source
+                log.info(f"Stopping shared webrtc video track, size={size}")
+                self.video_sources.pop(size).stop()
+                del self.video_watchers[size]
+
     async def respond_to_ice_candidate(self, request: web.Request) -> web.Response:
         params = await request.json()
         client_id = params.get("client_id")
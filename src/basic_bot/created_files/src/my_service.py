@@ -8,8 +8,7 @@ sleeps for a while prints the current local state and then sleeps for a while.
 import asyncio
 from basic_bot.commons import log
 from basic_bot.commons.hub_state import HubState
-from basic_bot.commons.hub_state_monitor import HubStateMonitor
-import basic_bot.commons.messages as bb_message
+from basic_bot.commons.async_hub_state_monitor import AsyncHubStateMonitor
 
 
 # HubState is a class that manages the process local copy of the state.
@@ -17,11 +16,15 @@ import basic_bot.commons.messages as bb_message
 # of HubState.
 hub_state = HubState({"worthless_counter": -999, "worthless_counter_interval": 1.0})
 
-# HubStateMonitor will open a websocket connection to the central hub
-# and start a thread to listen for state changes.  The monitor will call,
-# on the callback function with the new state before applying the changes to
-# the local state.
-hub_monitor = HubStateMonitor(
+# AsyncHubStateMonitor will open a websocket connection to the central hub
+# and listen for state changes on the same asyncio event loop as main() below.
+# The monitor will call the callback function with the new state before
+# applying the changes to the local state.
+#
+# If your service is not asyncio based, use
+# basic_bot.commons.hub_state_monitor.HubStateMonitor instead, which
+# runs in its own thread.
+hub_monitor = AsyncHubStateMonitor(
     hub_state,
     # identity of the service
     "my_service",
@@ -34,38 +37,42 @@ hub_monitor = HubStateMonitor(
         f"on_message_recv: {msg_type=}, {msg_data=}"
     ),
 )
-hub_monitor.start()
 
-# If you are creating a service that only consumes state changes and does not
-# read any external sensors or data,  You can remove the remaining code
-# in this file and replace it with
-#
-# ```python
-#   hub_monitor.thread.join()
-# ```
-#
-# For an example of such a service, see the daphbot_service at:
-# https://github.com/littlebee/daphbot-due/blob/aa7ed90d60df33009c5bd252c31fa0fb25076fad/src/daphbot_service.py
+
+async def log_interval_changes() -> None:
+    """
+    If you are creating a service that only consumes state changes, you
+    can replace main() below with watchers like this one.
+    """
+    async for interval in hub_monitor.watch("worthless_counter_interval"):
+        log.info(f"worthless_counter_interval changed to {interval}")
 
 
 async def main() -> None:
     log.info("in my_service:main()")
+    hub_monitor.start()
+    # keep a reference to the task; the event loop only keeps a weak one
+    interval_task = asyncio.create_task(log_interval_changes())
+
     i = 0
-    while True:
-        """
-        Replace this with your service logic that sends state
-        updates to the central hub from external data or inputs
-        like that from motors or sensors
-        """
-        i += 1
-        log.info(f"maybe sending state update {hub_monitor.connected_socket}")
-        if hub_monitor.connected_socket:
-            await bb_message.send_update_state(
-                hub_monitor.connected_socket, {"worthless_counter": i}
-            )
-        interval = hub_state.state.get("worthless_counter_interval", 1.0)
-        await asyncio.sleep(interval)
-        log.info(f"my_service state: {hub_state.state}")
+    try:
+        while True:
+            """
+            Replace this with your service logic that sends state
+            updates to the central hub from external data or inputs
+            like that from motors or sensors
+            """
+            i += 1
+            hub_monitor.publish({"worthless_counter": i})
+            interval = hub_state.state.get("worthless_counter_interval", 1.0)
+            await asyncio.sleep(interval)
+            log.info(f"my_service state: {hub_state.state}")
+    finally:
+        interval_task.cancel()
+        try:
+            await interval_task
+        except asyncio.CancelledError:
+            pass
 
 
 log.info("starting my_service via asyncio")
@@ -19,6 +19,27 @@ Central hub is also the publisher of several state keys:
     "subsystem_stats": {}
 }
 ```
+
+`subsystem_stats` has an entry for each identified service.  Services that send
+heartbeat pings (see basic_bot.commons.hub_heartbeat) also get round trip and
+event loop lag stats:
+```json
+{
+    "subsystem_stats": {
+        "vision": {
+            "online": 1,
+            "rtt_ms": 0.41,
+            "jitter_ms": 0.05,
+            "loop_lag_ms": 182.3,
+            "lagging": true
+        }
+    }
+}
+```
+`lagging` is true when the service reports an event loop lag, or its heartbeat
+is overdue, by more than `BB_HUB_LAG_THRESHOLD` seconds.
+The stats are sent to subscribers when a service starts or stops lagging, and
+otherwise at most once every `BB_HUB_HEARTBEAT_INTERVAL` seconds.
 ## Messages
 
 All data sent over the websocket to and from central_hub is in json and has the format:
@@ -44,6 +65,14 @@ Causes `central-hub` to send the requested state via message type = "state" to t
 
 `data` is optional, if specified, should be array of key names to retrieve. If omitted, all keys (complete state) is sent.
 
+Key names may also be path selectors into the value of a key, like
+`servo_actual_angles.pan`, `subsystem_stats.vision.online` or `recognition.0.label`
+where integer segments index arrays.  The value selected by a path is sent with the
+path as its key:
+```json
+{"type": "state", "data": {"subsystem_stats.vision.online": 1}}
+```
+
 
 ### identity
 
@@ -71,6 +100,13 @@ example json:
 
 Causes `central-hub` to add the client socket to the subscribers for each of the state keys provided. Client will start receiving "stateUpdate" messages when those keys are changed. The client may also send `"data": "*"` which will subscribe it to all keys like the web UI does.
 
+Path selectors (see getState) may also be subscribed.  A path subscriber only
+receives the selected sub-value, keyed by the path, and only when it changes:
+```json
+{"type": "stateUpdate", "data": {"servo_actual_angles.pan": 92.5}}
+```
+If the path no longer exists after an update, the value sent is `null`.
+
 ### updateState
 
 example json:
@@ -96,19 +132,76 @@ once, but most subsystems only ever update one top level key.
 The data received must be the **full data for that key**. `central-hub`
 will replace that top level key with the data received.
 
+Keys may have a schema, declared under `state_schemas` in basic_bot.yml (see
+basic_bot.commons.state_schema).  An `updateState` with a value that does not
+match the dtype and shape of its key's schema is logged and dropped; none of
+its keys are updated or sent to subscribers.
+
+### ping
+
+example json:
+
+```json
+{
+  "type": "ping",
+  "data": {"t0": 1712345678.100}
+}
+```
+
+Causes `central-hub` to send a "pong" message back to the client socket.  `data`
+is optional.  If it has a `t0` timestamp, the pong data has `t0` and the hub's
+receive (`t1`) and send (`t2`) times which clients use to estimate the offset of
+their clock from the hub clock.  See basic_bot.commons.clock_sync.
+
+### Binary blobs
+
+Binary data, like an image thumbnail or a depth map, can be sent without the
+overhead of base64 encoding it into json by sending a binary websocket frame.
+The frame is a 4 byte, network order, length of a json header, the utf-8 json
+header and then the raw bytes.  See `basic_bot.commons.messages.send_blob`.
+
+The header of a blob sent to `central-hub` is:
+```json
+{"type": "updateBlob", "key": "detection_crop", "content_type": "image/jpeg"}
+```
+
+`central-hub` stores the bytes as-is.  Clients that sent a `subscribeBlobs` message
+with the key (or "*") receive a binary frame with the header:
+```json
+{"type": "blobUpdate", "key": "detection_crop", "content_type": "image/jpeg", "size": 1234, "seq": 7}
+```
+
+Other subscribers of the key get a `stateUpdate` with a lightweight reference
+as the value of the key:
+```json
+{"detection_crop": {"blob": true, "content_type": "image/jpeg", "size": 1234, "seq": 7}}
+```
+
+A `getBlob` message with data of an array of keys causes `central-hub` to send
+a `blobUpdate` binary frame for each of the keys that has a blob.
+
+An `updateState` message may also carry an optional `trace` property.  See
+basic_bot.commons.tracing.  `central-hub` stamps the time it received and relayed
+the message and forwards the trace to subscribers with the `stateUpdate`.
 
 
 """
+import copy
 import json
 import asyncio
+import time
 import websockets
 import traceback
 from typing import Any, Dict, List, Optional, Union
 
 from websockets.server import WebSocketServerProtocol
 
-from basic_bot.commons import constants, log
-from basic_bot.commons.hub_state import HubState
+from basic_bot.commons import constants, log, messages
+from basic_bot.commons.config_file import read_config_file
+from basic_bot.commons.hub_state import HubState, MISSING, is_path, path_root, resolve_path
+from basic_bot.commons.state_schema import SchemaError, schemas_from_config
+from basic_bot.commons.tracing import TraceContext
+import basic_bot.commons.tracing as tracing
 from basic_bot.commons.outbound_clients import OutboundClients
 
 
@@ -135,9 +228,30 @@ subscribers: Dict[str, set[WebSocketServerProtocol]] = dict()
 # a set of websockets that subscribed to all keys using "*"
 star_subscribers: set[WebSocketServerProtocol] = set()
 
+# a dictionary of sets of sockets by path selector (ex: "subsystem_stats.vision.online")
+# that are only notified when the value at the path changes; see handle_state_subscribe
+path_subscribers: Dict[str, set[WebSocketServerProtocol]] = dict()
+
+# a copy of the last value sent to path subscribers by path
+path_values: Dict[str, Any] = dict()
+
+# a dictionary of sets of sockets by key that want to receive blobs
+# for the key as binary frames; see handle_blob_subscribe
+blob_subscribers: Dict[str, set[WebSocketServerProtocol]] = dict()
+
+# a set of websockets that subscribed to blobs of all keys using "*"
+star_blob_subscribers: set[WebSocketServerProtocol] = set()
+
 # a dictionary of websocket to subsystem name; see handle_identity
 identities: Dict[WebSocketServerProtocol, str] = dict()
 
+# a dictionary of websocket to the receive time and interval of the last
+# heartbeat ping from that socket; see handle_ping
+heartbeats: Dict[WebSocketServerProtocol, Dict[str, float]] = dict()
+
+# time.time() that subsystem_stats was last sent to subscribers for a heartbeat
+last_heartbeat_stats_sent_at = 0.0
+
 
 def iseeu_message(websocket: WebSocketServerProtocol) -> str:
     return json.dumps(
@@ -151,11 +265,18 @@ def iseeu_message(websocket: WebSocketServerProtocol) -> str:
     )
 
 
-async def send_message(websocket: WebSocketServerProtocol, message: str) -> None:
-    if constants.BB_LOG_ALL_MESSAGES and message != '{"type": "pong"}':
-        log.info(
-            f"sending {message} to {websocket.remote_address[0]}:{websocket.remote_address[1]}"
-        )
+async def send_message(
+    websocket: WebSocketServerProtocol, message: Union[str, bytes]
+) -> None:
+    if constants.BB_LOG_ALL_MESSAGES:
+        if isinstance(message, bytes):
+            log.info(
+                f"sending {len(message)} byte binary frame to {websocket.remote_address[0]}:{websocket.remote_address[1]}"
+            )
+        elif not message.startswith('{"type": "pong"'):
+            log.info(
+                f"sending {message} to {websocket.remote_address[0]}:{websocket.remote_address[1]}"
+            )
     if websocket:
         await websocket.send(message)
     elif connected_sockets:  # asyncio.wait doesn't accept an empty list
@@ -168,39 +289,38 @@ async def send_message(websocket: WebSocketServerProtocol, message: str) -> None
         await asyncio.wait([websocket.send(message) for websocket in connected_sockets])
 
 
-async def send_state_update_to_subscribers(message_data: Dict[str, Any]) -> None:
-    subscribed_sockets: set[WebSocketServerProtocol] = set()
-    for key in message_data:
-        # really need to keep this tight as possible,  don't log here
-        # unless needed to debug
-        # log.info(f"subscribed sockets for {key}: {subscribers[key]}")
-        for sub_socket in subscribers.get(key) or []:
-            subscribed_sockets.add(sub_socket)
-
-        for sub_socket in star_subscribers:
-            subscribed_sockets.add(sub_socket)
-
-    if len(subscribed_sockets) == 0:
-        log.info(
-            f"send_state_update_to_subscribers: no subscribers for {message_data.keys()}"
-        )
-
-    relay_message = json.dumps(
-        {
-            "type": "stateUpdate",
-            # note that we send the message as received to any subscribers
-            # of **any** keys in the message. So if a subsystem sends updates
-            # for two keys and a client is subscribed to one of the keys, it
-            # will get both keys in the stateUpdate message.
-            "data": message_data,
-        }
-    )
-
-    # Send to local subscribers
+def changed_paths(
+    message_data: Dict[str, Any],
+) -> Dict[WebSocketServerProtocol, Dict[str, Any]]:
+    """
+    Returns the path subscriber updates, by socket, for the subscribed paths
+    into the keys of message_data whose values have changed.
+    """
+    updates: Dict[WebSocketServerProtocol, Dict[str, Any]] = {}
+    for path, sockets in path_subscribers.items():
+        root = path_root(path)
+        if root not in message_data or not sockets:
+            continue
+        segments = path.split(".")[1:]
+        value = resolve_path(message_data[root], segments, MISSING)
+        if value is MISSING:
+            value = None
+        if path in path_values and path_values[path] == value:
+            continue
+        # copied because some values, like subsystem_stats, are updated in place
+        path_values[path] = copy.deepcopy(value)
+        for socket in sockets:
+            updates.setdefault(socket, {})[path] = value
+    return updates
+
+
+async def send_to_sockets(
+    sockets: set[WebSocketServerProtocol], message: Union[str, bytes]
+) -> None:
     sockets_to_close: set[WebSocketServerProtocol] = set()
-    for socket in subscribed_sockets:
+    for socket in sockets:
         try:
-            await send_message(socket, relay_message)
+            await send_message(socket, message)
         except websockets.exceptions.ConnectionClosedOK:
             # if the exception is a websockets.exceptions.ConnectionClosedOK
             # then the client has disconnected and we can remove it from the
@@ -219,6 +339,57 @@ async def send_state_update_to_subscribers(message_data: Dict[str, Any]) -> None
         await unregister(socket)
         await socket.close()
 
+
+async def send_state_update_to_subscribers(
+    message_data: Dict[str, Any],
+    trace: Optional[TraceContext] = None,
+    exclude: Optional[set[WebSocketServerProtocol]] = None,
+) -> None:
+    subscribed_sockets: set[WebSocketServerProtocol] = set()
+    for key in message_data:
+        # really need to keep this tight as possible,  don't log here
+        # unless needed to debug
+        # log.info(f"subscribed sockets for {key}: {subscribers[key]}")
+        for sub_socket in subscribers.get(key) or []:
+            subscribed_sockets.add(sub_socket)
+
+        for sub_socket in star_subscribers:
+            subscribed_sockets.add(sub_socket)
+
+    if exclude:
+        subscribed_sockets -= exclude
+
+    path_updates = changed_paths(message_data)
+    if exclude:
+        for socket in exclude:
+            path_updates.pop(socket, None)
+
+    if len(subscribed_sockets) == 0 and len(path_updates) == 0:
+        log.info(
+            f"send_state_update_to_subscribers: no subscribers for {message_data.keys()}"
+        )
+
+    relay: Dict[str, Any] = {
+        "type": "stateUpdate",
+        # note that we send the message as received to any subscribers
+        # of **any** keys in the message. So if a subsystem sends updates
+        # for two keys and a client is subscribed to one of the keys, it
+        # will get both keys in the stateUpdate message.
+        "data": message_data,
+    }
+    if trace is not None:
+        relay["trace"] = trace.stamp("relay").to_dict()
+    relay_message = json.dumps(relay)
+
+    # Send to local subscribers
+    await send_to_sockets(subscribed_sockets, relay_message)
+
+    for socket, socket_data in path_updates.items():
+        path_relay: Dict[str, Any] = {"type": "stateUpdate", "data": socket_data}
+        if "trace" in relay:
+            path_relay["trace"] = relay["trace"]
+        await send_to_sockets({socket}, json.dumps(path_relay))
+
     # Also forward to outbound clients if configured
     if outbound_clients:
         await outbound_clients.broadcast(relay_message)
@@ -239,17 +410,37 @@ async def notify_iseeu(websocket: WebSocketServerProtocol) -> None:
     await send_message(websocket, iseeu_message(websocket))
 
 
-async def update_online_status(subsystem_name: str, status: int) -> None:
-    if subsystem_name in hub_state.state["subsystem_stats"]:
-        hub_state.state["subsystem_stats"][subsystem_name]["online"] = status
-    else:
-        hub_state.state["subsystem_stats"][subsystem_name] = {"online": status}
+def update_subsystem_stats(subsystem_name: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Merge stats into the `subsystem_stats` entry of a subsystem.  HubState is
+    copy-on-write so the dictionaries are replaced, not modified.  Returns the
+    new `subsystem_stats`.
+    """
+    subsystem_stats = hub_state.state["subsystem_stats"]
+    entry = {**subsystem_stats.get(subsystem_name, {"online": 1}), **stats}
+    subsystem_stats = {**subsystem_stats, subsystem_name: entry}
+    hub_state.update({"subsystem_stats": subsystem_stats}, touch=False)
+    return subsystem_stats
 
-    await send_state_update_to_subscribers(
-        {"subsystem_stats": hub_state.state["subsystem_stats"]}
+
+def count_state_update() -> None:
+    hub_stats = hub_state.state["hub_stats"]
+    hub_state.update(
+        {
+            "hub_stats": {
+                **hub_stats,
+                "state_updates_recv": hub_stats["state_updates_recv"] + 1,
+            }
+        },
+        touch=False,
     )
 
 
+async def update_online_status(subsystem_name: str, status: int) -> None:
+    subsystem_stats = update_subsystem_stats(subsystem_name, {"online": status})
+    await send_state_update_to_subscribers({"subsystem_stats": subsystem_stats})
+
+
 async def register(websocket: WebSocketServerProtocol) -> None:
     log.info(
         f"got new connection from {websocket.remote_address[0]}:{websocket.remote_address[1]}:"
@@ -262,11 +453,17 @@ async def unregister(websocket: WebSocketServerProtocol) -> None:
         f"lost connection {websocket.remote_address[0]}:{websocket.remote_address[1]}"
     )
     try:
-        connected_sockets.remove(websocket)
-        star_subscribers.remove(websocket)
+        connected_sockets.discard(websocket)
+        star_subscribers.discard(websocket)
+        star_blob_subscribers.discard(websocket)
+        heartbeats.pop(websocket, None)
 
         for key in subscribers:
-            subscribers[key].remove(websocket)
+            subscribers[key].discard(websocket)
+        for path in list(path_subscribers):
+            remove_path_subscriber(websocket, path)
+        for key in blob_subscribers:
+            blob_subscribers[key].discard(websocket)
         subsystem_name = identities.pop(websocket, None)
         if subsystem_name:
             await update_online_status(subsystem_name, 0)
@@ -280,13 +477,71 @@ async def handle_state_request(
     await notify_state(websocket, keysRequested)
 
 
-async def handle_state_update(message_data: Dict[str, Any]) -> None:
+async def handle_state_update(
+    message_data: Dict[str, Any], trace: Optional[TraceContext] = None
+) -> None:
     log.debug(f"handle_state_update: {message_data}")
 
-    hub_state.update_state_from_message_data(message_data)
-    hub_state.state["hub_stats"]["state_updates_recv"] += 1
+    try:
+        hub_state.update_state_from_message_data(message_data)
+    except SchemaError as e:
+        log.error(f"handle_state_update: dropped update that failed schema: {e}")
+        return
+    count_state_update()
+
+    await send_state_update_to_subscribers(message_data, trace)
+
+
+def blob_update_frame(key: str, blob: messages.Blob) -> bytes:
+    header = {"type": "blobUpdate", "key": key, **blob.ref()}
+    return messages.encode_blob_frame(header, blob.data)
+
+
+async def handle_blob_update(frame: bytes) -> None:
+    try:
+        header, data = messages.decode_blob_frame(frame)
+    except ValueError as e:
+        log.error(f"error parsing binary frame: {e}")
+        return
+    key = header.get("key")
+    if header.get("type") != "updateBlob" or not isinstance(key, str):
+        log.error(f"received unsupported binary frame: {header}")
+        return
+
+    previous = hub_state.get_blob(key)
+    blob = messages.Blob(
+        data=data,
+        content_type=header.get("content_type") or messages.Blob.content_type,
+        seq=previous.seq + 1 if previous else 1,
+    )
+    ref = hub_state.update_blob(key, blob)
+    count_state_update()
+
+    binary_sockets = blob_subscribers.get(key, set()) | star_blob_subscribers
+    if binary_sockets:
+        await send_to_sockets(binary_sockets, blob_update_frame(key, blob))
 
-    await send_state_update_to_subscribers(message_data)
+    await send_state_update_to_subscribers({key: ref}, exclude=binary_sockets)
+
+
+async def handle_blob_request(
+    websocket: WebSocketServerProtocol, keys_requested: Optional[List[str]] = None
+) -> None:
+    for key in keys_requested or list(hub_state.blobs.keys()):
+        blob = hub_state.get_blob(key)
+        if blob is not None:
+            await send_message(websocket, blob_update_frame(key, blob))
+
+
+async def handle_blob_subscribe(
+    websocket: WebSocketServerProtocol, keys: Union[List[str], str]
+) -> None:
+    if keys == "*" or (len(keys) == 1 and keys[0] == "*"):
+        star_blob_subscribers.add(websocket)
+        return
+
+    for key in keys:
+        blob_subscribers.setdefault(key, set()).add(websocket)
 
 
 async def handle_state_subscribe(
@@ -299,6 +554,18 @@ async def handle_state_subscribe(
         return
 
     for key in subscription_keys:
+        if is_path(key):
+            log.info(
+                f"subscribing {websocket.remote_address[0]}:{websocket.remote_address[1]} to path {key}"
+            )
+            value = hub_state.get_path(key)
+            # compared to json values in changed_paths, so no NumPy arrays
+            path_values[key] = (
+                value.tolist() if hasattr(value, "tolist") else copy.deepcopy(value)
+            )
+            path_subscribers.setdefault(key, set()).add(websocket)
+            continue
+
         socket_set: Optional[set[WebSocketServerProtocol]] = None
         if key in subscribers:
             socket_set = subscribers[key]
@@ -317,13 +584,26 @@ async def handle_state_unsubscribe(
 ) -> None:
     subscription_keys: List[str] = []
     if len(data) == 1 and data[0] == "*":
-        subscription_keys = list(subscribers.keys())
+        subscription_keys = list(subscribers.keys()) + list(path_subscribers.keys())
     else:
         subscription_keys = data
 
     for key in subscription_keys:
         if key in subscribers:
-            subscribers[key].remove(websocket)
+            subscribers[key].discard(websocket)
+        if key in path_subscribers:
+            remove_path_subscriber(websocket, key)
+
+
+def remove_path_subscriber(websocket: WebSocketServerProtocol, path: str) -> None:
+    """Unsubscribe a socket from a path and forget the path if it has no subscribers."""
+    sockets = path_subscribers.get(path)
+    if sockets is None:
+        return
+    sockets.discard(websocket)
+    if not sockets:
+        del path_subscribers[path]
+        path_values.pop(path, None)
 
 
 async def handle_identity(
@@ -335,8 +615,89 @@ async def handle_identity(
     await notify_iseeu(websocket)
 
 
-async def handle_ping(websocket: WebSocketServerProtocol) -> None:
-    await send_message(websocket, json.dumps({"type": "pong"}))
+def _ms(seconds: Any) -> Optional[float]:
+    return None if seconds is None else round(float(seconds) * 1000, 3)
+
+
+async def update_heartbeat_stats(
+    websocket: WebSocketServerProtocol, data: Dict[str, Any], recv_ts: float
+) -> None:
+    subsystem_name = identities.get(websocket)
+    if not subsystem_name or "interval" not in data:
+        return
+
+    interval = float(data["interval"])
+    # a blocked event loop on the client also shows up as a late heartbeat
+    last_heartbeat = heartbeats.get(websocket)
+    heartbeat_lag = 0.0
+    if last_heartbeat:
+        heartbeat_lag = max(recv_ts - last_heartbeat["recv_ts"] - interval, 0)
+    heartbeats[websocket] = {"recv_ts": recv_ts, "interval": interval}
+
+    loop_lag = max(float(data.get("loop_lag", 0)), heartbeat_lag)
+    lagging = loop_lag > constants.BB_HUB_LAG_THRESHOLD
+    was_lagging = hub_state.state["subsystem_stats"].get(subsystem_name, {}).get(
+        "lagging"
+    )
+    subsystem_stats = update_subsystem_stats(
+        subsystem_name,
+        {
+            "rtt_ms": _ms(data.get("rtt")),
+            "jitter_ms": _ms(data.get("jitter")),
+            "loop_lag_ms": _ms(loop_lag),
+            "lagging": lagging,
+        },
+    )
+
+    # every client pings, so only send the stats of all of them once per
+    # interval unless a service starts or stops lagging
+    global last_heartbeat_stats_sent_at
+    if (
+        lagging == was_lagging
+        and recv_ts - last_heartbeat_stats_sent_at < constants.BB_HUB_HEARTBEAT_INTERVAL
+    ):
+        return
+    last_heartbeat_stats_sent_at = recv_ts
+    await send_state_update_to_subscribers({"subsystem_stats": subsystem_stats})
+
+
+async def check_overdue_heartbeats() -> None:
+    """
+    Flag services whose heartbeat is overdue.  A service with a blocked event
+    loop can't send pings, so waiting for the next ping to arrive is not enough.
+    """
+    while True:
+        await asyncio.sleep(constants.BB_HUB_HEARTBEAT_INTERVAL)
+        now = time.time()
+        for websocket, heartbeat in list(heartbeats.items()):
+            overdue = now - heartbeat["recv_ts"] - heartbeat["interval"]
+            subsystem_name = identities.get(websocket)
+            if not subsystem_name or overdue <= constants.BB_HUB_LAG_THRESHOLD:
+                continue
+            stats = hub_state.state["subsystem_stats"].get(subsystem_name)
+            if stats is None or stats.get("lagging"):
+                continue
+            log.info(f"{subsystem_name} heartbeat is overdue by {overdue:.3f}s")
+            subsystem_stats = update_subsystem_stats(
+                subsystem_name, {"loop_lag_ms": _ms(overdue), "lagging": True}
+            )
+            await send_state_update_to_subscribers({"subsystem_stats": subsystem_stats})
+
+
+async def handle_ping(
+    websocket: WebSocketServerProtocol, data: Any = None, recv_ts: Optional[float] = None
+) -> None:
+    recv_ts = recv_ts or time.time()
+    if isinstance(data, dict) and "t0" in data:
+        pong_data = {
+            "t0": data["t0"],
+            "t1": recv_ts,
+            "t2": time.time(),
+        }
+        await send_message(websocket, json.dumps({"type": "pong", "data": pong_data}))
+        await update_heartbeat_stats(websocket, data, recv_ts)
+    else:
+        await send_message(websocket, json.dumps({"type": "pong"}))
 
 
 async def handle_message(
@@ -349,6 +710,12 @@ async def handle_message(
         websocket: The websocket connection that sent the message.
         message: The raw message (string or bytes) to process.
     """
+    recv_ts = time.time()
+    # json may also be sent in binary frames
+    if isinstance(message, bytes) and messages.is_blob_frame(message):
+        await handle_blob_update(message)
+        return
+
     try:
         jsonData = json.loads(message)
         messageType = jsonData.get("type")
@@ -365,18 +732,27 @@ async def handle_message(
         await handle_state_request(websocket, messageData)
     # {type: "updateState" data: { new state }}
     elif messageType == "updateState":
-        await handle_state_update(messageData)
+        trace = tracing.from_message(jsonData)
+        if trace is not None:
+            trace.hold("central_hub").stamp("recv", recv_ts)
+        await handle_state_update(messageData, trace)
     # {type: "subscribeState", data: [state_keys] or "*"
     elif messageType == "subscribeState":
         await handle_state_subscribe(websocket, messageData)
     # {type: "unsubscribeState", data: [state_keys] or "*"
     elif messageType == "unsubscribeState":
         await handle_state_unsubscribe(websocket, messageData)
+    # {type: "subscribeBlobs", data: [state_keys] or "*"
+    elif messageType == "subscribeBlobs":
+        await handle_blob_subscribe(websocket, messageData)
+    # {type: "getBlob", data: [state_keys] or omitted}
+    elif messageType == "getBlob":
+        await handle_blob_request(websocket, messageData)
     # {type: "identity", data: "subsystem_name"}
     elif messageType == "identity":
         await handle_identity(websocket, messageData)
     elif messageType == "ping":
-        await handle_ping(websocket)
+        await handle_ping(websocket, messageData, recv_ts)
     else:
         log.error(f"received unsupported message: {messageType}")
 
@@ -411,6 +787,11 @@ async def main() -> None:
 
     log.info(f"Starting server on port {constants.BB_HUB_PORT}")
 
+    state_schemas = read_config_file(constants.BB_CONFIG_FILE).get("state_schemas")
+    if state_schemas:
+        log.info(f"Using state schemas for {list(state_schemas.keys())}")
+        hub_state.set_schemas(schemas_from_config(state_schemas))
+
     # Initialize and start outbound client connections if configured
     outbound_clients = OutboundClients(on_message_received=handle_message)
     if outbound_clients.outbound_clients:
@@ -422,6 +803,8 @@ async def main() -> None:
         log.info("No outbound clients configured")
         outbound_clients = None
 
+    asyncio.create_task(check_overdue_heartbeats())
+
     # TODO : figure out why the type error below
     async with websockets.serve(handle_connect, port=constants.BB_HUB_PORT):  # type: ignore
         await asyncio.Future()  # run forever
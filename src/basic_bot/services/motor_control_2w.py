@@ -26,7 +26,6 @@
     ```
 """
 
-import time
 import json
 import asyncio
 import traceback
@@ -35,6 +34,8 @@ from websockets.client import WebSocketClientProtocol
 import websockets.client
 
 from basic_bot.commons import constants as c, messages, log
+from basic_bot.commons.hub_heartbeat import HubHeartbeat
+from basic_bot.commons.reconnect_policy import ReconnectPolicy
 
 try:
     from adafruit_motorkit import MotorKit  # type: ignore
@@ -71,43 +72,53 @@ async def send_motor_state(websocket: WebSocketClientProtocol) -> None:
 
 
 async def provide_state() -> None:
+    reconnect_policy = ReconnectPolicy()
     while True:
         try:
             log.info(f"connecting to {c.BB_HUB_URI}")
             async with websockets.client.connect(c.BB_HUB_URI) as websocket:
+                reconnect_policy.reset()
                 # reset motors incase of restart due to crash
                 left_motor.throttle = 0
                 right_motor.throttle = 0
 
                 await messages.send_identity(websocket, "motor_control_2w")
                 await messages.send_subscribe(websocket, ["throttles"])
-                async for message in websocket:
-                    if c.BB_LOG_ALL_MESSAGES:  # log all messages except pongs
-                        log.info(f"received from central hub: {str(message)}")
-
-                    data = json.loads(message)
-                    message_data = data.get("data")
-                    if "throttles" in message_data:
-                        left_throttle = min(
-                            max(message_data["throttles"]["left"], -1), 1
-                        )
-                        right_throttle = min(
-                            max(message_data["throttles"]["right"], -1), 1
-                        )
-                        log.info(
-                            f"setting throttles ({left_throttle}, {right_throttle})"
-                        )
-                        left_motor.throttle = left_throttle
-                        right_motor.throttle = right_throttle
-                        await send_motor_state(websocket)
-
+                heartbeat = HubHeartbeat()
+                heartbeat_task = asyncio.create_task(heartbeat.run(websocket))
+                try:
+                    async for message in websocket:
+                        data = json.loads(message)
+                        if data.get("type") == "pong":
+                            heartbeat.handle_pong(data.get("data"))
+                            continue
+
+                        if c.BB_LOG_ALL_MESSAGES:  # log all messages except pongs
+                            log.info(f"received from central hub: {str(message)}")
+
+                        message_data = data.get("data")
+                        if message_data and "throttles" in message_data:
+                            left_throttle = min(
+                                max(message_data["throttles"]["left"], -1), 1
+                            )
+                            right_throttle = min(
+                                max(message_data["throttles"]["right"], -1), 1
+                            )
+                            log.info(
+                                f"setting throttles ({left_throttle}, {right_throttle})"
+                            )
+                            left_motor.throttle = left_throttle
+                            right_motor.throttle = right_throttle
+                            await send_motor_state(websocket)
+                finally:
+                    heartbeat_task.cancel()
                 await asyncio.sleep(0.05)
 
         except:
             traceback.print_exc()
 
-        print("socket disconnected.  Reconnecting in 5 sec.BB_..")
-        time.sleep(5)
+        log.info("central_hub socket disconnected.")
+        await reconnect_policy.wait()
 
 
 def main() -> None:
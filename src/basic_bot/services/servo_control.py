@@ -74,7 +74,7 @@
 """
 
 import asyncio
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from basic_bot.commons import log, messages
 from websockets.client import WebSocketClientProtocol
@@ -82,6 +82,7 @@ from basic_bot.commons.servo_pca9685 import Servo
 from basic_bot.commons.servo_config import read_servo_config
 from basic_bot.commons.hub_state import HubState
 from basic_bot.commons.hub_state_monitor import HubStateMonitor
+from basic_bot.commons.state_publisher import StatePublisher
 
 ANGLE_UPDATE_FREQUENCY = 0.1  # seconds = 10Hz
 
@@ -127,37 +128,30 @@ async def send_servo_config(websocket: WebSocketClientProtocol) -> None:
     )
 
 
-last_servo_angles: dict[str, Any] = {}
+update_angles_task: Optional[asyncio.Task] = None
 
 
-async def send_servo_angles(websocket: WebSocketClientProtocol, force: bool = False) -> None:
-    global last_servo_angles
-
+def send_servo_angles(force: bool = False) -> None:
     angles = {name: servo.current_angle for name, servo in servos_by_name.items()}
-    if not force and angles == last_servo_angles:
-        return
-
-    last_servo_angles = angles
-    await messages.send_update_state(
-        websocket,
-        {"servo_actual_angles": angles},
-    )
+    angles_publisher.publish({"servo_actual_angles": angles}, force=force)
 
 
-async def update_servo_angles(websocket: WebSocketClientProtocol) -> None:
+async def update_servo_angles() -> None:
     while True:
-        await send_servo_angles(websocket)
+        send_servo_angles()
         await asyncio.sleep(ANGLE_UPDATE_FREQUENCY)
 
 
 def handle_connect(websocket: WebSocketClientProtocol) -> None:
+    global update_angles_task
     # if we disconnect and reconnect we need to resend the current state
     log.info("connected to central hub")
     asyncio.create_task(send_servo_config(websocket))
     # need to force send the current angles to the central hub on reconnect
     # in case it was restarted and lost the state
-    asyncio.create_task(send_servo_angles(websocket, force=True))
-    asyncio.create_task(update_servo_angles(websocket))
+    send_servo_angles(force=True)
+    if update_angles_task is None:
+        update_angles_task = asyncio.create_task(update_servo_angles())
 
 
 def handle_state_update(_websocket: WebSocketClientProtocol, _msg_type: str, msg_data: Dict[str, Any]) -> None:
@@ -181,4 +175,7 @@ hub_monitor = HubStateMonitor(
     on_state_update=handle_state_update,
     on_connect=handle_connect,
 )
+# only sends servo_actual_angles when they change
+angles_publisher = StatePublisher(hub_monitor.publish)
+hub_monitor.add_publisher(angles_publisher)
 hub_monitor.start()
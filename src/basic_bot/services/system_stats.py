@@ -29,11 +29,12 @@ import asyncio
 import json
 import psutil
 import socket
-import time
 import traceback
 import websockets
 
 from basic_bot.commons import constants as c, messages
+from basic_bot.commons.hub_heartbeat import HubHeartbeat
+from basic_bot.commons.reconnect_policy import ReconnectPolicy
 
 
 def get_update_message() -> str:
@@ -65,20 +66,31 @@ def get_update_message() -> str:
 
 
 async def provide_state() -> None:
+    reconnect_policy = ReconnectPolicy()
     while True:
         try:
             print(f"connecting to {c.BB_HUB_URI}")
             async with websockets.connect(c.BB_HUB_URI) as websocket:  # type: ignore
+                reconnect_policy.reset()
                 await messages.send_identity(websocket, "system_stats")
-                while True:
-                    message = get_update_message()
-                    await websocket.send(message)
-                    await asyncio.sleep(c.BB_SYSTEM_STATS_SAMPLE_INTERVAL)
+                heartbeat = HubHeartbeat()
+                heartbeat_tasks = [
+                    asyncio.create_task(heartbeat.run(websocket)),
+                    asyncio.create_task(heartbeat.consume(websocket)),
+                ]
+                try:
+                    while True:
+                        message = get_update_message()
+                        await websocket.send(message)
+                        await asyncio.sleep(c.BB_SYSTEM_STATS_SAMPLE_INTERVAL)
+                finally:
+                    for task in heartbeat_tasks:
+                        task.cancel()
         except:
             traceback.print_exc()
 
-        print("socket disconnected.  Reconnecting in 5 sec...")
-        time.sleep(5)
+        print("socket disconnected.")
+        await reconnect_policy.wait()
 
 
 def start_provider() -> None:
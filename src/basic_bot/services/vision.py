@@ -15,6 +15,17 @@ location, you can do something like:
 <img src="http://localhost:5001/video_feed" />
 ```
 
+Each frame is encoded once, when the first client asks for it, and shared with
+all clients.  Optional query params select the jpeg `quality` (0 - 100),
+scale the frames to a `width`, and limit the frames sent to `max_fps`:
+```html
+<img src="http://localhost:5001/video_feed?quality=70&width=320&max_fps=10" />
+```
+
+The most recent frame is available as a single jpeg, with the same `quality`
+and `width` params, from http://<ip>:<port>/snapshot.jpg.  Its ETag changes
+with each frame.
+
 ## WebRTC video supported
 
 The vision service when running will respond to WebRTC offers a allow
@@ -24,6 +35,12 @@ It should not be neccessary to use both MJPEG and WebRTC streaming and
 WebRTC video should be preferred for its lower latency and less overhead
 needed to encode jpg frames for MJPEG streaming.
 
+All viewers share one video track, so the cost of converting each camera
+frame does not grow with the number of viewers.  An offer may include
+`"width"` and `"height"` to receive smaller frames.  The size is rounded up to
+3/4, 1/2 or 1/4 of the captured size, and viewers of the same size share a
+track.
+
 See, [webrtc_test_client.js](https://github.com/littlebee/basic_bot/blob/0808450a5d220feaa1efdfcb0738216af89f0f75/src/basic_bot/public/webrtc_test_client.js)
 and associated .html for example of how to use WebRTC stream from browser.
 
@@ -51,6 +68,16 @@ recognition can be done:
 The [x1, y1, x2, y2] bounding box above is actually sent as
 the numeric values of the bounding box in the image.
 
+Set BB_MOTION_GATE to only run object detection when the scene changes, and
+at least every BB_MOTION_MAX_INTERVAL seconds.  Whether the scene is changing
+is then also sent as `"motion": true` or `"motion": false`.
+
+Set BB_OBJECT_TRACKING to give each object a `"track_id"`, that stays the same
+while the object is tracked, and a `"velocity": [vx, vy]` of the center of its
+bounding box in pixels per second.  Between detections, `recognition` is then
+sent for every camera frame with the bounding boxes moved to where the tracked
+objects are predicted to be.
+
 ## Video Recording
 
 To use the video recording feature, you must have the `ffmpeg` command
@@ -84,7 +111,6 @@ https://blog.miguelgrinberg.com/post/flask-video-streaming-revisited
 
 Thank you, @adeept and @miguelgrinberg!
 """
-import asyncio
 import importlib
 import logging
 import os
@@ -93,13 +119,14 @@ import sys
 import threading
 import time
 import traceback
+from typing import Any
 
 from aiohttp import web
 from aiohttp.web_request import Request
 from aiohttp.web_response import Response, StreamResponse
 import aiohttp_cors
 
-from basic_bot.commons import constants as c, log, messages, vid_utils
+from basic_bot.commons import constants as c, log, vid_utils
 from basic_bot.commons.web_utils_aiohttp import (
     json_response,
     respond_ok,
@@ -107,11 +134,13 @@ from basic_bot.commons.web_utils_aiohttp import (
     AccessLogger,
 )
 
-from basic_bot.commons.hub_state import HubState
-from basic_bot.commons.hub_state_monitor import HubStateMonitor
+from basic_bot.commons.shared_hub_client import (
+    SharedHubClient,
+    get_shared_hub_client,
+)
 from basic_bot.commons.base_camera import BaseCamera
 from basic_bot.commons.webrtc_server import WebrtcPeers
-from basic_bot.commons.mjpeg_video import MjpegVideo
+from basic_bot.commons.mjpeg_video import MjpegVideo, jpeg_cache
 
 if c.BB_DISABLE_RECOGNITION_PROVIDER:
     log.info("Recognition provider is disabled (BB_DISABLE_RECOGNITION_PROVIDER)")
@@ -129,33 +158,15 @@ logging.getLogger().addHandler(logging.StreamHandler(sys.stdout))
 
 is_stopping = False
 
-# TODO : maybe using HubStateMonitor as just a means of publishing
-# state updates (without any actual monitoring) should be composed
-# into a separate class, like maybe HubStatePublisher.
-hub = HubStateMonitor(HubState({}), "vision", [])
-hub.start()
-
-# when running tests, assume we are headless and use the
-# mock camera which provides random images that should
-# be half with pet in image and half without pet in image
-if c.BB_ENV == "test":
-    camera_lib = "basic_bot.test_helpers.camera_mock"
-else:
-    camera_lib = c.BB_CAMERA_MODULE
-
-log.info(f"loading camera module: {camera_lib}")
-camera_module = importlib.import_module(camera_lib)
-camera = camera_module.Camera()
-
-log.info("Initializing webrtc offers server")
-webrtc_peers = WebrtcPeers(camera)
-
-log.info("Initializing MJPEG streaming")
-mjpeg_video = MjpegVideo(camera)
-mjpeg_video.start()
-
-if not c.BB_DISABLE_RECOGNITION_PROVIDER:
-    recognition = RecognitionProvider(camera)
+# These are created by main() rather than on import.  The detection worker
+# processes of BB_RECOGNITION_WORKERS import this module again as __mp_main__
+# and must not open the camera or connect to central_hub.
+hub: SharedHubClient
+# the Camera of BB_CAMERA_MODULE
+camera: Any
+webrtc_peers: WebrtcPeers
+mjpeg_video: MjpegVideo
+recognition: "RecognitionProvider"
 
 script_directory = os.path.abspath(os.path.dirname(__file__))
 public_directory = os.path.abspath(os.path.join(script_directory, "../public"))
@@ -168,10 +179,6 @@ def dump_thread_stacks() -> None:
         traceback.print_stack(frame)
 
 
-# listen for signal USR1 to dump thread stacks to log
-signal.signal(signal.SIGUSR1, lambda _signum, _frame: dump_thread_stacks())
-
-
 # @app.route("/stats")
 async def send_stats(_request: Request) -> Response:
     """Return the FPS and other stats of the vision service."""
@@ -179,6 +186,8 @@ async def send_stats(_request: Request) -> Response:
         200,
         {
             "capture": BaseCamera.stats(),
+            "frame_consumers": BaseCamera.consumer_stats(),
+            "mjpeg": jpeg_cache.stats(),
             "recognition": (
                 "disabled"
                 if c.BB_DISABLE_RECOGNITION_PROVIDER
@@ -229,11 +238,7 @@ async def record_video(request: Request) -> Response:
 
 def record_video_thread(duration: float) -> None:
     try:
-        asyncio.run(
-            messages.send_update_state(
-                hub.connected_socket, {"vision": {"recording": True}}
-            )
-        )
+        hub.publish({"vision": {"recording": True}})
         if c.BB_LEGACY_RECORD_VIDEO:
             vid_utils.record_video(camera, duration)
         else:
@@ -244,11 +249,7 @@ def record_video_thread(duration: float) -> None:
 
     finally:
         if not is_stopping:
-            asyncio.run(
-                messages.send_update_state(
-                    hub.connected_socket, {"vision": {"recording": False}}
-                )
-            )
+            hub.publish({"vision": {"recording": False}})
 
 
 # @app.route("/recorded_video")
@@ -291,15 +292,36 @@ async def get_webrtc_test_client(_request: Request) -> Response:
     )
 
 
+# @app.route("/offer")
+async def offer(request: Request) -> Response:
+    """Respond to a WebRTC offer; see WebrtcPeers.respond_to_offer."""
+    return await webrtc_peers.respond_to_offer(request)
+
+
+# @app.route("/ice_candidate")
+async def ice_candidate(request: Request) -> Response:
+    return await webrtc_peers.respond_to_ice_candidate(request)
+
+
 async def video_feed(request: Request) -> StreamResponse:
     """
     MJPEG video streaming route.  This is used as the `src` attribute
     of an html <img> tag.
     """
+    raise web.HTTPFound(mjpeg_url(request))
+
+
+async def snapshot(request: Request) -> StreamResponse:
+    """The most recent frame as a jpeg; see mjpeg_video.snapshot."""
+    raise web.HTTPFound(mjpeg_url(request))
+
+
+def mjpeg_url(request: Request) -> str:
+    """The url of the request on the MJPEG server, with the query params."""
     host_name = request.host.split(":")[0]
-    video_feed_url = f"http://{host_name}:{c.BB_MJPEG_VIDEO_PORT}/video_feed"
-    log.info(f"redirecting to mjpeg video feed to {video_feed_url}")
-    raise web.HTTPFound(video_feed_url)
+    url = f"http://{host_name}:{c.BB_MJPEG_VIDEO_PORT}{request.path_qs}"
+    log.info(f"redirecting to mjpeg server {url}")
+    return url
 
 
 async def on_shutdown(_app: web.Application) -> None:
@@ -315,7 +337,42 @@ async def on_shutdown(_app: web.Application) -> None:
     hub.stop()
 
 
+def start_services() -> None:
+    """Connect to central_hub and start the camera, streaming and recognition."""
+    global hub, camera, webrtc_peers, mjpeg_video, recognition
+
+    # one connection to central_hub is shared by vision and the recognition provider
+    hub = get_shared_hub_client("vision")
+    hub.start()
+
+    # when running tests, assume we are headless and use the
+    # mock camera which provides random images that should
+    # be half with pet in image and half without pet in image
+    if c.BB_ENV == "test":
+        camera_lib = "basic_bot.test_helpers.camera_mock"
+    else:
+        camera_lib = c.BB_CAMERA_MODULE
+
+    log.info(f"loading camera module: {camera_lib}")
+    camera_module = importlib.import_module(camera_lib)
+    camera = camera_module.Camera()
+
+    log.info("Initializing webrtc offers server")
+    webrtc_peers = WebrtcPeers(camera)
+
+    log.info("Initializing MJPEG streaming")
+    mjpeg_video = MjpegVideo(camera)
+    mjpeg_video.start()
+
+    if not c.BB_DISABLE_RECOGNITION_PROVIDER:
+        recognition = RecognitionProvider(camera)
+
+
 def main() -> None:
+    # listen for signal USR1 to dump thread stacks to log
+    signal.signal(signal.SIGUSR1, lambda _signum, _frame: dump_thread_stacks())
+    start_services()
+
     app = web.Application()
     app.on_shutdown.append(on_shutdown)
 
@@ -327,10 +384,11 @@ def main() -> None:
     app.router.add_get("/recorded_video", recorded_video)
     app.router.add_get("/recorded_video/{filename}", get_recorded_video_file)
     # these are for handling WebRTC video handshake
-    app.router.add_post("/offer", webrtc_peers.respond_to_offer)
-    app.router.add_post("/ice_candidate", webrtc_peers.respond_to_ice_candidate)
+    app.router.add_post("/offer", offer)
+    app.router.add_post("/ice_candidate", ice_candidate)
     # this is for MJPEG video streaming
     app.router.add_get("/video_feed", video_feed)
+    app.router.add_get("/snapshot.jpg", snapshot)
 
     # for testing only
     app.router.add_get("/", get_webrtc_test_page)
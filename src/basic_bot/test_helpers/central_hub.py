@@ -1,7 +1,8 @@
 import json
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 
 import basic_bot.commons.constants as c
+from basic_bot.commons import messages
 import basic_bot.test_helpers.constants as tc
 
 
@@ -61,6 +62,32 @@ def send_subscribe(ws: WebSocket, namesList: List[str]) -> None:
     send(ws, {"type": "subscribeState", "data": namesList})
 
 
+def send_blob(
+    ws: WebSocket,
+    key: str,
+    data: bytes,
+    content_type: str = "application/octet-stream",
+) -> None:
+    """send binary data for a state key to central hub as a binary frame"""
+    header = {"type": "updateBlob", "key": key, "content_type": content_type}
+    ws.send_binary(messages.encode_blob_frame(header, data))
+
+
+def send_subscribe_blobs(ws: WebSocket, namesList: List[str]) -> None:
+    send(ws, {"type": "subscribeBlobs", "data": namesList})
+
+
+def send_get_blob(ws: WebSocket, namesList: List[str]) -> None:
+    send(ws, {"type": "getBlob", "data": namesList})
+
+
+def recv_blob(ws: WebSocket) -> Tuple[Dict[str, Any], bytes]:
+    """receive a binary frame and return its json header and data"""
+    frame = ws.recv()
+    assert isinstance(frame, bytes), f"expected binary frame, got {frame}"
+    return messages.decode_blob_frame(frame)
+
+
 def recv(ws: WebSocket) -> Dict[str, Any]:
     message_str = ws.recv()
     message: Dict[str, Any] = json.loads(message_str)
@@ -0,0 +1,30 @@
+"""
+A detector for testing basic_bot.commons.detection_pool without a model.
+"""
+
+import os
+import time
+from typing import Any, Dict, List
+
+# a frame filled with this value makes the worker process exit
+CRASH_VALUE = 13
+# a frame filled with this value makes the worker hang
+HANG_VALUE = 17
+
+
+class Detector:
+    """Detects one object with the frame's size and mean value as confidence."""
+
+    def get_prediction(self, img: Any) -> List[Dict[str, Any]]:
+        if img.size > 0 and (img == CRASH_VALUE).all():
+            os._exit(1)
+        if img.size > 0 and (img == HANG_VALUE).all():
+            time.sleep(3600)
+        height, width = img.shape[:2]
+        return [
+            {
+                "bounding_box": [0.0, 0.0, float(width), float(height)],
+                "classification": "mock",
+                "confidence": float(img.mean()) / 255,
+            }
+        ]
@@ -0,0 +1,57 @@
+import asyncio
+
+import basic_bot.test_helpers.central_hub as hub
+import basic_bot.test_helpers.start_stop as sst
+from basic_bot.commons.async_hub_state_monitor import AsyncHubStateMonitor
+from basic_bot.commons.hub_state import HubState
+
+
+def setup_module():
+    sst.start_service("central_hub", "python -m basic_bot.services.central_hub")
+
+
+def teardown_module():
+    sst.stop_service("central_hub")
+
+
+class TestAsyncHubStateMonitor:
+    def test_watch_and_wait_for(self):
+        async def run_test():
+            monitor = AsyncHubStateMonitor(
+                HubState({}), "TestAsyncHubStateMonitor-monitor", []
+            )
+            monitor.start()
+            ws_client = hub.connect("TestAsyncHubStateMonitor-client")
+            try:
+                received = []
+
+                async def watch_foo():
+                    async for value in monitor.watch("async_foo", latest_only=False):
+                        received.append(value)
+                        if value == 3:
+                            return
+
+                watch_task = asyncio.create_task(watch_foo())
+                # watch() subscribes to the key on the monitor's connection
+                await asyncio.sleep(0.2)
+
+                for i in range(1, 4):
+                    hub.send_update_state(ws_client, {"async_foo": i})
+                await asyncio.wait_for(watch_task, 1)
+                assert received == [1, 2, 3]
+
+                # the current value satisfies the predicate
+                assert await monitor.wait_for("async_foo", lambda v: v == 3, 1) == 3
+
+                waiter = asyncio.create_task(
+                    monitor.wait_for("async_foo", lambda v: v > 10, 1)
+                )
+                await asyncio.sleep(0.1)
+                hub.send_update_state(ws_client, {"async_foo": 11})
+                assert await waiter == 11
+                assert monitor.watchers["async_foo"] == set()
+            finally:
+                ws_client.close()
+                await monitor.close()
+
+        asyncio.run(run_test())
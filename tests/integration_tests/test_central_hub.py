@@ -1,3 +1,6 @@
+import json
+import time
+
 import basic_bot.test_helpers.central_hub as hub
 import basic_bot.test_helpers.start_stop as sst
 
@@ -40,6 +43,15 @@ class TestCentralHub:
         assert updated_state["data"]["set_angles"] == TEST_ANGLES_1
         ws.close()
 
+    def test_json_in_binary_frame(self):
+        ws = hub.connect()
+        message = {"type": "updateState", "data": {"set_angles": TEST_ANGLES_2}}
+        ws.send_binary(json.dumps(message).encode("utf-8"))
+
+        hub.send_get_state(ws, ["set_angles"])
+        assert hub.recv(ws)["data"]["set_angles"] == TEST_ANGLES_2
+        ws.close()
+
     def test_get_partial_state(self):
         ws = hub.connect()
 
@@ -122,3 +134,162 @@ class TestCentralHub:
 
         ws1.close()
         ws2.close()
+
+    def test_trace_relay(self):
+        ws1 = hub.connect("test_trace_client_1")
+        hub.send_subscribe(ws1, ["traced_key"])
+
+        ws2 = hub.connect("test_trace_client_2")
+        hub.send(
+            ws2,
+            {
+                "type": "updateState",
+                "data": {"traced_key": 1},
+                "trace": {"id": "test-trace", "stamps": [["test.send", 1.0]]},
+            },
+        )
+
+        message = hub.recv(ws1)
+        assert message["type"] == "stateUpdate"
+        assert message["trace"]["id"] == "test-trace"
+        hops = [stamp[0] for stamp in message["trace"]["stamps"]]
+        assert hops == ["test.send", "central_hub.recv", "central_hub.relay"]
+
+        ws1.close()
+        ws2.close()
+
+    def test_ping_pong(self):
+        ws = hub.connect()
+
+        hub.send(ws, {"type": "ping"})
+        assert hub.recv(ws) == {"type": "pong"}
+
+        t0 = time.time()
+        hub.send(ws, {"type": "ping", "data": {"t0": t0}})
+        response = hub.recv(ws)
+        t3 = time.time()
+
+        assert response["type"] == "pong"
+        assert response["data"]["t0"] == t0
+        # same host, same clock
+        assert t0 <= response["data"]["t1"] <= response["data"]["t2"] <= t3
+        ws.close()
+
+    def test_heartbeat_stats(self):
+        ws = hub.connect("test_heartbeat_client")
+        hub.send_subscribe(ws, ["subsystem_stats"])
+
+        heartbeat = {"t0": time.time(), "interval": 2.0, "rtt": 0.0005, "jitter": 0.0001}
+        hub.send(ws, {"type": "ping", "data": {**heartbeat, "loop_lag": 0.001}})
+        assert hub.recv(ws)["type"] == "pong"
+        message = hub.recv(ws)
+        stats = message["data"]["subsystem_stats"]["test_heartbeat_client"]
+        assert stats["online"] == 1
+        assert stats["rtt_ms"] == 0.5
+        assert stats["jitter_ms"] == 0.1
+        assert stats["lagging"] is False
+
+        # event loop lag over BB_HUB_LAG_THRESHOLD flags the service as lagging
+        hub.send(ws, {"type": "ping", "data": {**heartbeat, "loop_lag": 0.5}})
+        assert hub.recv(ws)["type"] == "pong"
+        message = hub.recv(ws)
+        stats = message["data"]["subsystem_stats"]["test_heartbeat_client"]
+        assert stats["loop_lag_ms"] == 500
+        assert stats["lagging"] is True
+
+        # still lagging; the stats are kept but not sent again this interval
+        hub.send(ws, {"type": "ping", "data": {**heartbeat, "loop_lag": 0.6}})
+        assert hub.recv(ws)["type"] == "pong"
+        assert hub.has_received_data(ws) is None
+        hub.send_get_state(ws, ["subsystem_stats"])
+        message = hub.recv(ws)
+        stats = message["data"]["subsystem_stats"]["test_heartbeat_client"]
+        assert stats["loop_lag_ms"] == 600
+
+        ws.close()
+
+    def test_blob_update(self):
+        ws_binary = hub.connect("test_blob_binary_client")
+        hub.send_subscribe_blobs(ws_binary, ["thumbnail"])
+
+        ws_json = hub.connect("test_blob_json_client")
+        hub.send_subscribe(ws_json, ["thumbnail"])
+
+        ws_sender = hub.connect("test_blob_sender")
+        data = bytes(range(256)) * 4
+        hub.send_blob(ws_sender, "thumbnail", data, "image/jpeg")
+
+        # blob subscribers get the raw bytes
+        header, received = hub.recv_blob(ws_binary)
+        assert header["type"] == "blobUpdate"
+        assert header["key"] == "thumbnail"
+        assert header["content_type"] == "image/jpeg"
+        assert header["size"] == len(data)
+        assert received == data
+        assert not hub.has_received_data(ws_binary)
+
+        # other subscribers get a json reference
+        message = hub.recv(ws_json)
+        assert message["type"] == "stateUpdate"
+        assert message["data"]["thumbnail"] == {
+            "blob": True,
+            "content_type": "image/jpeg",
+            "size": len(data),
+            "seq": header["seq"],
+        }
+
+        # the last blob can be requested
+        hub.send_get_blob(ws_sender, ["thumbnail", "not_a_blob"])
+        header2, received = hub.recv_blob(ws_sender)
+        assert header2["seq"] == header["seq"]
+        assert received == data
+        assert not hub.has_received_data(ws_sender)
+
+        ws_binary.close()
+        ws_json.close()
+        ws_sender.close()
+
+    def test_path_selectors(self):
+        ws1 = hub.connect("test_path_client_1")
+        ws2 = hub.connect("test_path_client_2")
+        hub.send_update_state(ws2, {"path_angles": {"pan": 90, "tilt": 45}})
+
+        hub.send_get_state(ws1, ["path_angles.pan", "path_angles.roll"])
+        message = hub.recv(ws1)
+        assert message == {"type": "state", "data": {"path_angles.pan": 90}}
+
+        hub.send_subscribe(ws1, ["path_angles.pan"])
+
+        # no change to the subscribed path, no update
+        hub.send_update_state(ws2, {"path_angles": {"pan": 90, "tilt": 10}})
+        assert not hub.has_received_data(ws1)
+
+        hub.send_update_state(ws2, {"path_angles": {"pan": 100, "tilt": 10}})
+        message = hub.recv(ws1)
+        assert message == {"type": "stateUpdate", "data": {"path_angles.pan": 100}}
+
+        ws1.close()
+        ws2.close()
+
+    def test_state_schemas(self):
+        # test_schema_box has a schema in basic_bot.yml
+        ws1 = hub.connect("test_schema_client_1")
+        ws2 = hub.connect("test_schema_client_2")
+        hub.send_subscribe(ws1, ["test_schema_box", "test_schema_box.2"])
+
+        hub.send_update_state(ws2, {"test_schema_box": [1, 2, 3, 4]})
+        message = hub.recv(ws1)
+        assert message["data"] == {"test_schema_box": [1, 2, 3, 4]}
+        message = hub.recv(ws1)
+        assert message["data"] == {"test_schema_box.2": 3}
+
+        # wrong shape is dropped
+        hub.send_update_state(ws2, {"test_schema_box": [1, 2, 3]})
+        assert not hub.has_received_data(ws1)
+
+        hub.send_get_state(ws1, ["test_schema_box"])
+        message = hub.recv(ws1)
+        assert message == {"type": "state", "data": {"test_schema_box": [1.0, 2.0, 3.0, 4.0]}}
+
+        ws1.close()
+        ws2.close()
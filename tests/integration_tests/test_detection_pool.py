@@ -0,0 +1,111 @@
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from basic_bot.commons.base_camera import CameraFrame
+from basic_bot.commons.detection_pool import DetectionPool
+from basic_bot.test_helpers.detector_mock import CRASH_VALUE, HANG_VALUE
+
+DETECTOR = "basic_bot.test_helpers.detector_mock.Detector"
+
+
+def make_frame(seq: int, value: int) -> CameraFrame:
+    return CameraFrame(seq, time.time(), np.full((48, 64, 3), value, dtype=np.uint8))
+
+
+def wait_for_results(pool: DetectionPool, count: int, timeout: float = 10) -> list:
+    results: list = []
+    deadline = time.time() + timeout
+    while len(results) < count and time.time() < deadline:
+        results += pool.get_results(timeout=0.1)
+    return results
+
+
+class TestDetectionPool:
+    def test_detects_in_workers(self):
+        pool = DetectionPool(2, detector=DETECTOR, slot_size=48 * 64 * 3)
+        pool.start()
+        try:
+            frames = [make_frame(1, 51), make_frame(2, 102)]
+            assert pool.submit(frames[0])
+            assert pool.submit(frames[1])
+            # both workers are busy
+            assert not pool.submit(make_frame(3, 0))
+
+            results = sorted(wait_for_results(pool, 2), key=lambda r: r.seq)
+            assert [r.seq for r in results] == [1, 2]
+            assert results[0].objects[0]["confidence"] == 0.2
+            assert results[1].objects[0]["bounding_box"] == [0.0, 0.0, 64.0, 48.0]
+            assert {r.worker for r in results} == {0, 1}
+            assert [r.timestamp for r in results] == [f.timestamp for f in frames]
+
+            # too large for the slots
+            big = CameraFrame(4, time.time(), np.zeros((480, 640, 3), dtype=np.uint8))
+            assert not pool.submit(big)
+        finally:
+            pool.stop()
+
+    def test_restarts_crashed_worker(self):
+        pool = DetectionPool(1, detector=DETECTOR, slot_size=48 * 64 * 3)
+        pool.start()
+        try:
+            assert pool.submit(make_frame(1, CRASH_VALUE))
+            pool.workers[0].process.join(10)
+
+            assert pool.get_results(timeout=0.1) == []
+            assert pool.stats()["workers"][0]["restarts"] == 1
+
+            assert pool.submit(make_frame(2, 51))
+            results = wait_for_results(pool, 1)
+            assert [r.seq for r in results] == [2]
+        finally:
+            pool.stop()
+
+    def test_submit_to_worker_that_just_died(self):
+        pool = DetectionPool(1, detector=DETECTOR, slot_size=48 * 64 * 3)
+        pool.start()
+        restart_dead_workers = pool._restart_dead_workers
+        try:
+            # the worker dies after the check for dead workers in submit()
+            pool._restart_dead_workers = lambda: None  # type: ignore
+            pool.workers[0].process.terminate()
+            pool.workers[0].process.join(10)
+
+            assert not pool.submit(make_frame(1, 51))
+            assert pool.workers[0].busy_seq is None
+
+            pool._restart_dead_workers = restart_dead_workers  # type: ignore
+            assert pool.submit(make_frame(2, 51))
+            assert [r.seq for r in wait_for_results(pool, 1)] == [2]
+        finally:
+            pool.stop()
+
+    def test_restarts_hung_worker(self):
+        pool = DetectionPool(1, detector=DETECTOR, slot_size=48 * 64 * 3, timeout=0.5)
+        pool.start()
+        try:
+            assert pool.submit(make_frame(1, HANG_VALUE))
+            assert wait_for_results(pool, 1, timeout=1) == []
+            assert pool.stats()["workers"][0]["restarts"] == 1
+            assert pool.workers[0].busy_seq is None
+
+            assert pool.submit(make_frame(2, 51))
+            assert [r.seq for r in wait_for_results(pool, 1)] == [2]
+        finally:
+            pool.stop()
+
+    def test_vision_import_starts_nothing(self):
+        # spawned workers import the vision service again as __mp_main__
+        script = (
+            "import threading\n"
+            "import basic_bot.services.vision as vision\n"
+            "from basic_bot.commons import shared_hub_client\n"
+            "assert shared_hub_client._shared_client is None\n"
+            "assert not hasattr(vision, 'camera')\n"
+            "assert threading.active_count() == 1, threading.enumerate()\n"
+        )
+        env = {**os.environ, "BB_ENV": "test", "BB_RECOGNITION_WORKERS": "1"}
+        subprocess.run([sys.executable, "-c", script], env=env, check=True, timeout=60)
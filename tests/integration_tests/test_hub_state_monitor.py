@@ -1,3 +1,4 @@
+import asyncio
 import time
 import threading
 from unittest.mock import Mock
@@ -6,6 +7,10 @@ import basic_bot.test_helpers.central_hub as hub
 import basic_bot.test_helpers.start_stop as sst
 from basic_bot.commons.hub_state_monitor import HubStateMonitor
 from basic_bot.commons.hub_state import HubState
+from basic_bot.commons import tracing
+from basic_bot.commons.callback_dispatcher import CallbackDispatcher
+from basic_bot.commons.state_publisher import StatePublisher
+from basic_bot.commons.state_schema import ArraySchema
 
 
 def setup_module():
@@ -168,3 +173,239 @@ class TestHubStateMonitor:
 
         finally:
             monitor.stop()
+
+    def test_trace_delivered_to_callback(self):
+        connected = threading.Event()
+        received = threading.Event()
+        traces = []
+
+        def on_state_update(_ws, msg_type, _data):
+            if msg_type == "stateUpdate":
+                trace = tracing.current_trace()
+                traces.append((trace.id, [stamp[0] for stamp in trace.stamps]))
+                received.set()
+
+        monitor = HubStateMonitor(
+            hub_state=HubState({"traced_foo": 0}),
+            identity="TestHubStateMonitor-trace_monitor",
+            subscribed_keys=["traced_foo"],
+            on_state_update=on_state_update,
+            on_connect=lambda _: connected.set(),
+        )
+        monitor.start()
+        try:
+            connected.wait()
+            ws_client = hub.connect("TestHubStateMonitor-trace_client")
+            trace = tracing.new_trace("test_client").stamp("send")
+            hub.send(
+                ws_client,
+                {
+                    "type": "updateState",
+                    "data": {"traced_foo": 1},
+                    "trace": trace.to_dict(),
+                },
+            )
+            assert received.wait(1)
+            trace_id, hops = traces[0]
+            assert trace_id == trace.id
+            assert hops == [
+                "test_client.origin",
+                "test_client.send",
+                "central_hub.recv",
+                "central_hub.relay",
+                "TestHubStateMonitor-trace_monitor.deliver",
+            ]
+            # callback is done when the trace is no longer current
+            assert tracing.current_trace() is None
+            ws_client.close()
+        finally:
+            monitor.stop()
+
+    def test_clock_sync(self):
+        monitor = HubStateMonitor(
+            hub_state=HubState({}),
+            identity="TestHubStateMonitor-clock_sync_monitor",
+            subscribed_keys=[],
+        )
+        monitor.start()
+        try:
+            time.sleep(EXPECTED_HANDSHAKE_LATENCY * 3)
+            assert monitor.clock.is_synced
+            # central_hub is running on the same host and clock
+            assert abs(monitor.clock_offset) < EXPECTED_UPDATE_LATENCY
+            assert monitor.clock.rtt < EXPECTED_UPDATE_LATENCY
+        finally:
+            monitor.stop()
+
+    def test_blob_keys(self):
+        connected = threading.Event()
+        received = threading.Event()
+        hub_state = HubState({})
+
+        def on_state_update(_ws, msg_type, data):
+            if msg_type == "blobUpdate":
+                received.set()
+
+        monitor = HubStateMonitor(
+            hub_state=hub_state,
+            identity="TestHubStateMonitor-blob_monitor",
+            subscribed_keys=[],
+            blob_keys=["blob_foo"],
+            on_state_update=on_state_update,
+            on_connect=lambda _: connected.set(),
+        )
+        monitor.start()
+        try:
+            connected.wait()
+            ws_client = hub.connect("TestHubStateMonitor-blob_client")
+            hub.send_blob(ws_client, "blob_foo", b"\x00\x01binary\xff")
+            assert received.wait(1)
+            blob = hub_state.get_blob("blob_foo")
+            assert blob.data == b"\x00\x01binary\xff"
+            assert hub_state.state["blob_foo"]["size"] == len(blob.data)
+            ws_client.close()
+        finally:
+            monitor.stop()
+
+    def test_publish_from_threads(self):
+        monitor = HubStateMonitor(
+            hub_state=HubState({}),
+            identity="TestHubStateMonitor-publish_monitor",
+            subscribed_keys=[],
+        )
+        # published before connecting, sent once connected
+        early = monitor.publish({"published_early": True})
+        monitor.start()
+        try:
+            early.result(timeout=2)
+            ws_client = hub.connect("TestHubStateMonitor-publish_client")
+            hub.send_subscribe(ws_client, ["published_counter"])
+            time.sleep(EXPECTED_HANDSHAKE_LATENCY)
+
+            futures = []
+
+            def publish_counts(start):
+                for i in range(start, start + 50):
+                    futures.append(monitor.publish({"published_counter": i}))
+
+            threads = [threading.Thread(target=publish_counts, args=(n * 50,)) for n in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for future in futures:
+                future.result(timeout=1)
+
+            # pending publishes are merged so there are fewer messages than publishes
+            values = []
+            while (message := hub.has_received_data(ws_client)) is not None:
+                values.append(message["data"]["published_counter"])
+            assert 0 < len(values) <= len(futures)
+            ws_client.close()
+        finally:
+            monitor.stop()
+
+    def test_publishers_reset_on_reconnect(self):
+        monitor = HubStateMonitor(
+            hub_state=HubState({}),
+            identity="TestHubStateMonitor-reset_publishers",
+            subscribed_keys=[],
+        )
+        publisher = StatePublisher(monitor.publish)
+        monitor.add_publisher(publisher)
+        monitor.start()
+        try:
+            publisher.publish({"reset_foo": 1})
+            assert publisher.stats()["sent"] == 1
+
+            deadline = time.time() + 2
+            while monitor.connected_socket is None and time.time() < deadline:
+                time.sleep(0.01)
+            first_socket = monitor.connected_socket
+            assert monitor.loop and first_socket
+            asyncio.run_coroutine_threadsafe(first_socket.close(), monitor.loop)
+            while monitor.connected_socket in (None, first_socket):
+                assert time.time() < deadline
+                time.sleep(0.01)
+
+            # unchanged, but sent again since central_hub may have restarted
+            publisher.publish({"reset_foo": 1})
+            assert publisher.stats()["sent"] == 2
+        finally:
+            monitor.stop()
+
+    def test_values_that_fail_schemas_are_dropped(self):
+        on_state_update = Mock()
+        hub_state = HubState({}, schemas={"monitor_box": ArraySchema(shape=(4,))})
+        monitor = HubStateMonitor(
+            hub_state=hub_state,
+            identity="TestHubStateMonitor-schemas",
+            subscribed_keys=["monitor_box", "monitor_label"],
+            on_state_update=on_state_update,
+        )
+        monitor.start()
+        ws_client = hub.connect("TestHubStateMonitor-schemas_client")
+        try:
+            time.sleep(EXPECTED_HANDSHAKE_LATENCY)
+            connected_socket = monitor.connected_socket
+            hub.send_update_state(ws_client, {"monitor_box": [1, 2, 3], "monitor_label": "a"})
+            hub.send_update_state(ws_client, {"monitor_box": [1, 2, 3]})
+            hub.send_update_state(ws_client, {"monitor_box": [1, 2, 3, 4]})
+            time.sleep(EXPECTED_UPDATE_LATENCY * 10)
+
+            # the connection is kept and the keys that match are applied
+            assert monitor.connected_socket is connected_socket
+            assert hub_state.state["monitor_label"] == "a"
+            assert hub_state.state["monitor_box"].tolist() == [1, 2, 3, 4]
+            updates = [call.args[2] for call in on_state_update.call_args_list]
+            assert {"monitor_label": "a"} in updates
+            assert all(
+                len(update["monitor_box"]) == 4
+                for update in updates
+                if "monitor_box" in update
+            )
+        finally:
+            ws_client.close()
+            monitor.stop()
+
+    def test_callback_dispatcher(self):
+        connected = threading.Event()
+        received = []
+        done = threading.Event()
+
+        def slow_on_state_update(_ws, msg_type, data):
+            if "dispatched_foo" in data:
+                time.sleep(0.05)
+                received.append(data["dispatched_foo"])
+                if data["dispatched_foo"] == 9:
+                    done.set()
+
+        hub_state = HubState({})
+        monitor = HubStateMonitor(
+            hub_state=hub_state,
+            identity="TestHubStateMonitor-dispatch_monitor",
+            subscribed_keys=["dispatched_foo"],
+            on_state_update=slow_on_state_update,
+            on_connect=lambda _: connected.set(),
+            callback_dispatcher=CallbackDispatcher(latest_only_keys=["dispatched_foo"]),
+        )
+        monitor.start()
+        try:
+            connected.wait()
+            ws_client = hub.connect("TestHubStateMonitor-dispatch_client")
+            for i in range(10):
+                hub.send_update_state(ws_client, {"dispatched_foo": i})
+
+            # the slow callback does not hold up reading the socket
+            time.sleep(0.1)
+            assert hub_state.state["dispatched_foo"] == 9
+
+            assert done.wait(1)
+            # stale values were skipped and the order was kept
+            assert received == sorted(received)
+            assert len(received) < 10
+            stats = monitor.stats()["callbacks"]
+            assert stats["lanes"]["dispatched_foo"]["dropped"] > 0
+            ws_client.close()
+        finally:
+            monitor.stop()
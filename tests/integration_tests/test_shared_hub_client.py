@@ -0,0 +1,53 @@
+import time
+import threading
+
+import basic_bot.test_helpers.central_hub as hub
+import basic_bot.test_helpers.start_stop as sst
+from basic_bot.commons.shared_hub_client import SharedHubClient
+
+
+def setup_module():
+    sst.start_service("central_hub", "python -m basic_bot.services.central_hub")
+
+
+def teardown_module():
+    sst.stop_service("central_hub")
+
+
+class TestSharedHubClient:
+    def test_consumers_share_connection(self):
+        connected = threading.Event()
+        foo_updates = []
+        bar_updates = []
+
+        shared = SharedHubClient("TestSharedHubClient-shared")
+        shared.register(
+            ["shared_foo"],
+            on_state_update=lambda _ws, _type, data: foo_updates.append(data),
+            on_connect=lambda _ws: connected.set(),
+        )
+        shared.start()
+        try:
+            assert connected.wait(2)
+            # registered after connecting, still subscribed on the same socket
+            shared.register(
+                ["shared_bar"],
+                on_state_update=lambda _ws, _type, data: bar_updates.append(data),
+            )
+            time.sleep(0.1)
+
+            ws_client = hub.connect("TestSharedHubClient-client")
+            hub.send_subscribe(ws_client, ["shared_published"])
+            hub.send_update_state(ws_client, {"shared_foo": 1, "shared_bar": 2})
+            time.sleep(0.1)
+
+            assert foo_updates[-1] == {"shared_foo": 1}
+            assert bar_updates[-1] == {"shared_bar": 2}
+            assert shared.hub_state.state["shared_bar"] == 2
+
+            future = shared.publish({"shared_published": "hello"})
+            future.result(timeout=1)
+            assert hub.has_received_state_update(ws_client, "shared_published", "hello")
+            ws_client.close()
+        finally:
+            shared.stop()
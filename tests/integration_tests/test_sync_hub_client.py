@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pytest
+
+import basic_bot.test_helpers.central_hub as hub
+import basic_bot.test_helpers.start_stop as sst
+from basic_bot.commons.hub_state import HubState
+from basic_bot.commons.sync_hub_client import SyncHubClient
+
+
+def setup_module():
+    sst.start_service("central_hub", "python -m basic_bot.services.central_hub")
+
+
+def teardown_module():
+    sst.stop_service("central_hub")
+
+
+class TestSyncHubClient:
+    def test_get_and_wait_for_update(self):
+        connected = threading.Event()
+        client = SyncHubClient(
+            HubState({}),
+            "TestSyncHubClient",
+            ["sync_foo"],
+            on_connect=lambda _ws: connected.set(),
+        )
+        client.start()
+        try:
+            assert connected.wait(2)
+            assert client.get("sync_foo", "default") == "default"
+            with pytest.raises(TimeoutError):
+                client.wait_for_update("sync_foo", timeout=0.1)
+
+            ws_client = hub.connect("TestSyncHubClient-client")
+            hub.send_subscribe(ws_client, ["sync_published"])
+
+            # waits from another thread until the update is received
+            since = client.get_version("sync_foo")
+            timer = threading.Timer(
+                0.1, lambda: hub.send_update_state(ws_client, {"sync_foo": 1})
+            )
+            timer.start()
+            assert client.wait_for_update("sync_foo", timeout=2) == 1
+            assert client.get("sync_foo") == 1
+
+            # received since the version read above
+            assert client.wait_for_update("sync_foo", timeout=0, since=since) == 1
+
+            client.publish({"sync_published": "hello"})
+            assert hub.has_received_state_update(ws_client, "sync_published", "hello")
+            ws_client.close()
+
+            # stopping wakes waiting threads
+            threading.Timer(0.1, client.stop).start()
+            started_at = time.monotonic()
+            assert client.wait_for_update("sync_foo", timeout=2) is None
+            assert time.monotonic() - started_at < 1
+        finally:
+            client.stop()
@@ -0,0 +1,66 @@
+import threading
+import time
+
+from basic_bot.commons.callback_dispatcher import CallbackDispatcher
+
+
+class TestCallbackDispatcher:
+    def test_order_per_lane(self):
+        dispatcher = CallbackDispatcher(max_workers=4)
+        calls = {"a": [], "b": []}
+        done = threading.Event()
+
+        def callback(lane, value):
+            time.sleep(0.001)
+            calls[lane].append(value)
+            if len(calls["a"]) == 20 and len(calls["b"]) == 20:
+                done.set()
+
+        for i in range(20):
+            dispatcher.dispatch("a", callback, "a", i)
+            dispatcher.dispatch("b", callback, "b", i)
+
+        assert done.wait(2)
+        assert calls["a"] == list(range(20))
+        assert calls["b"] == list(range(20))
+        stats = dispatcher.stats()
+        assert stats["lanes"]["a"]["calls"] == 20
+        assert stats["queue_depth"] == 0
+        dispatcher.shutdown()
+
+    def test_latest_only(self):
+        dispatcher = CallbackDispatcher(max_workers=1, latest_only_keys=["angles"])
+        release = threading.Event()
+        values = []
+
+        def callback(value):
+            release.wait(1)
+            values.append(value)
+
+        for i in range(5):
+            dispatcher.dispatch("angles", callback, i)
+        assert dispatcher.queue_depth() <= 1
+
+        release.set()
+        time.sleep(0.1)
+        dispatcher.shutdown()
+        # the first call was already running; 1..3 were superseded before starting
+        assert values == [0, 4]
+        assert dispatcher.stats()["lanes"]["angles"]["dropped"] == 3
+
+    def test_dispatch_after_shutdown(self):
+        dispatcher = CallbackDispatcher(max_workers=1)
+        values = []
+        dispatcher.shutdown()
+
+        dispatcher.dispatch("a", values.append, 1)
+        assert values == []
+        assert dispatcher.queue_depth() == 0
+
+        # the executor was shut down without going through shutdown()
+        dispatcher = CallbackDispatcher(max_workers=1)
+        dispatcher.executor.shutdown()
+        dispatcher.dispatch("a", values.append, 1)
+        lane = dispatcher.lanes["a"]
+        assert not lane.is_running
+        assert not lane.pending
@@ -0,0 +1,65 @@
+"""
+    Unit tests of basic_bot.commons.clock_sync and hub_heartbeat.
+"""
+
+from basic_bot.commons.clock_sync import ClockSync
+from basic_bot.commons.hub_heartbeat import HubHeartbeat
+
+
+def test_not_synced_initially():
+    clock = ClockSync()
+    assert not clock.is_synced
+    assert clock.offset == 0
+    assert clock.rtt is None
+    assert clock.to_hub_time(100.0) == 100.0
+
+
+def test_offset_and_rtt():
+    clock = ClockSync()
+    # hub clock is 10s ahead, 0.1s each way, 0.01s in the hub
+    sample = clock.handle_pong({"t0": 100.0, "t1": 110.1, "t2": 110.11}, t3=100.21)
+
+    assert sample is not None
+    assert abs(sample.rtt - 0.2) < 1e-9
+    assert abs(clock.offset - 10.0) < 1e-9
+    assert abs(clock.to_hub_time(200.0) - 210.0) < 1e-9
+    assert abs(clock.from_hub_time(210.0) - 200.0) < 1e-9
+
+
+def test_uses_lowest_rtt_sample():
+    clock = ClockSync(window=3)
+    # asymmetric, slow exchange skews the offset
+    clock.handle_pong({"t0": 100.0, "t1": 110.9, "t2": 110.9}, t3=101.0)
+    # fast exchange is the better estimate
+    clock.handle_pong({"t0": 200.0, "t1": 210.01, "t2": 210.01}, t3=200.02)
+    assert abs(clock.offset - 10.0) < 1e-9
+
+    # the fast sample ages out of the window
+    clock.handle_pong({"t0": 300.0, "t1": 310.3, "t2": 310.3}, t3=300.5)
+    clock.handle_pong({"t0": 400.0, "t1": 410.3, "t2": 410.3}, t3=400.5)
+    clock.handle_pong({"t0": 500.0, "t1": 510.2, "t2": 510.2}, t3=500.4)
+    assert abs(clock.rtt - 0.4) < 1e-9
+
+
+def test_ignores_pong_without_timing():
+    clock = ClockSync()
+    assert clock.handle_pong(None) is None
+    assert clock.handle_pong({"t0": 1.0}) is None
+    assert not clock.is_synced
+
+
+def test_heartbeat_round_trip_stats():
+    heartbeat = HubHeartbeat(interval=1.0)
+    data = heartbeat.ping_data()
+    assert data["interval"] == 1.0
+    assert "rtt" not in data
+
+    t0 = data["t0"]
+    heartbeat.handle_pong({"t0": t0, "t1": t0 + 0.001, "t2": t0 + 0.001})
+    assert heartbeat.rtt is not None
+    assert heartbeat.pongs_received == 1
+    assert heartbeat.clock.is_synced
+
+    data = heartbeat.ping_data()
+    assert data["rtt"] == heartbeat.rtt
+    assert data["jitter"] == 0
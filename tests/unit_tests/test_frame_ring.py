@@ -0,0 +1,137 @@
+"""
+    Unit tests of the frame ring buffer in basic_bot.commons.base_camera
+"""
+
+import asyncio
+import threading
+import time
+
+from basic_bot.commons.base_camera import BaseCamera, FrameConsumer, FrameRing
+
+
+def push_frames(ring: FrameRing, count: int) -> None:
+    for i in range(count):
+        ring.push(f"frame {i}".encode(), time.time())
+
+
+def test_sequence_numbers_and_latest():
+    ring = FrameRing(3)
+    assert ring.latest() is None
+
+    push_frames(ring, 5)
+    latest = ring.latest()
+    assert latest is not None
+    assert latest.seq == 5
+    assert latest.image == b"frame 4"
+    # only the last 3 are kept
+    assert [frame.seq for frame in ring.frames] == [3, 4, 5]
+
+
+def test_get_after():
+    ring = FrameRing(3)
+    push_frames(ring, 5)
+
+    frame = ring.get_after(1)
+    assert frame is not None and frame.seq == 5
+    frame = ring.get_after(3, newest=False)
+    assert frame is not None and frame.seq == 4
+    # frames 2 and 3 are gone, the oldest kept is returned
+    frame = ring.get_after(1, newest=False)
+    assert frame is not None and frame.seq == 3
+
+    assert ring.get_after(5, timeout=0.01) is None
+
+
+def test_consumers_each_get_every_frame():
+    ring = FrameRing(3)
+    consumers = [FrameConsumer(ring, "a"), FrameConsumer(ring, "b")]
+    received = {"a": [], "b": []}
+
+    def consume(consumer: FrameConsumer) -> None:
+        for _ in range(3):
+            frame = consumer.next(timeout=1)
+            assert frame is not None
+            received[consumer.name].append(frame.seq)
+
+    threads = [threading.Thread(target=consume, args=(c,)) for c in consumers]
+    for thread in threads:
+        thread.start()
+    for _ in range(3):
+        time.sleep(0.05)
+        push_frames(ring, 1)
+    for thread in threads:
+        thread.join(1)
+
+    assert received == {"a": [1, 2, 3], "b": [1, 2, 3]}
+    assert consumers[0].stats() == {"frames": 3, "dropped": 0, "last_seq": 3}
+
+
+def test_consumer_counts_dropped_frames():
+    ring = FrameRing(3)
+    consumer = FrameConsumer(ring, "slow")
+    push_frames(ring, 1)
+    consumer.next()
+    push_frames(ring, 4)
+    frame = consumer.next()
+
+    assert frame is not None and frame.seq == 5
+    assert consumer.dropped == 3
+
+
+def test_close_wakes_consumers():
+    ring = FrameRing(3)
+    threading.Timer(0.05, ring.close).start()
+    started_at = time.time()
+    assert ring.get_after(0, timeout=2) is None
+    assert time.time() - started_at < 1
+
+
+def test_wait_after_does_not_block_loop():
+    ring = FrameRing(3)
+    ticks = []
+
+    async def tick() -> None:
+        while len(ticks) < 5:
+            ticks.append(1)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        threading.Timer(0.1, push_frames, (ring, 1)).start()
+        frame, _ = await asyncio.gather(ring.wait_after(0, timeout=2), tick())
+        return frame
+
+    frame = asyncio.run(main())
+    assert frame is not None and frame.seq == 1
+    assert len(ticks) == 5
+
+
+def test_wait_after_timeout_and_close():
+    ring = FrameRing(3)
+
+    async def main():
+        assert await ring.wait_after(0, timeout=0.05) is None
+        assert ring.async_waiters == []
+        threading.Timer(0.05, ring.close).start()
+        assert await ring.wait_after(0, timeout=2) is None
+
+    asyncio.run(main())
+
+
+def test_get_frame_per_thread(monkeypatch):
+    ring = FrameRing(4)
+    monkeypatch.setattr(BaseCamera, "ring", ring)
+    monkeypatch.setattr(BaseCamera, "get_frame_local", threading.local())
+    # without starting the camera thread
+    camera = BaseCamera.__new__(BaseCamera)
+    push_frames(ring, 1)
+
+    assert camera.get_frame() == b"frame 0"
+    # each thread gets the frames it has not seen yet
+    in_thread = []
+    thread = threading.Thread(target=lambda: in_thread.append(camera.get_frame()))
+    thread.start()
+    thread.join()
+    assert in_thread == [b"frame 0"]
+
+    ring.push(b"frame 1", time.time())
+    assert camera.get_frame() == b"frame 1"
@@ -0,0 +1,103 @@
+import json
+
+import numpy as np
+import pytest
+
+from basic_bot.commons.hub_state import HubState, MISSING
+from basic_bot.commons.state_schema import ArraySchema, SchemaError, schemas_from_config
+
+STATE = {
+    "servo_actual_angles": {"pan": 90, "tilt": 45},
+    "recognition": [{"label": "cat"}, {"label": "dog"}],
+    "velocity_factor": 1.5,
+}
+
+
+class TestHubState:
+    def test_get_path(self):
+        hub_state = HubState(STATE)
+        assert hub_state.get_path("servo_actual_angles.pan") == 90
+        assert hub_state.get_path("recognition.1.label") == "dog"
+        assert hub_state.get_path("recognition.2.label") is None
+        assert hub_state.get_path("velocity_factor.foo", MISSING) is MISSING
+        assert hub_state.get_path("not_a_key.foo", MISSING) is MISSING
+
+    def test_get_with_paths(self):
+        hub_state = HubState(STATE)
+        assert hub_state.get(
+            ["velocity_factor", "servo_actual_angles.tilt", "recognition.x"]
+        ) == {
+            "velocity_factor": 1.5,
+            "servo_actual_angles.tilt": 45,
+        }
+
+    def test_copy_on_write_snapshots(self):
+        hub_state = HubState(STATE)
+        version, snapshot = hub_state.versioned_snapshot()
+        state = hub_state.state
+
+        hub_state.update_state_from_message_data({"velocity_factor": 2.0})
+
+        assert hub_state.version == version + 1
+        assert hub_state.state["velocity_factor"] == 2.0
+        assert "velocity_factor_updated_at" in hub_state.state
+        # previous snapshots are unchanged
+        assert snapshot["velocity_factor"] == 1.5
+        assert state["velocity_factor"] == 1.5
+        # unchanged values are shared, not copied
+        assert hub_state.state["recognition"] is state["recognition"]
+
+        try:
+            snapshot["velocity_factor"] = 3.0  # type: ignore
+            assert False, "snapshot should be read only"
+        except TypeError:
+            pass
+
+    def test_update_without_touch(self):
+        hub_state = HubState({})
+        hub_state.update({"foo": 1}, touch=False)
+        assert hub_state.state == {"foo": 1}
+
+    def test_schemas(self):
+        hub_state = HubState(
+            STATE, schemas={"ranges": ArraySchema("float32"), "box": ArraySchema(shape=(4,))}
+        )
+        hub_state.update({"ranges": [1.5, 0.5], "box": (1, 2, 3, 4)})
+
+        ranges = hub_state.state["ranges"]
+        assert isinstance(ranges, np.ndarray)
+        assert ranges.dtype == np.float32
+        assert not ranges.flags.writeable
+        assert hub_state.get_path("box.2") == 3.0
+
+        # a value that doesn't match is rejected without changing the state
+        version = hub_state.version
+        with pytest.raises(SchemaError):
+            hub_state.update({"velocity_factor": 2.0, "box": [1, 2, 3]})
+        with pytest.raises(SchemaError):
+            hub_state.update({"ranges": [[1.0], [2.0]]})
+        assert hub_state.version == version
+        assert hub_state.state["velocity_factor"] == 1.5
+
+        assert json.loads(hub_state.serialize_state(["ranges", "box"]))["data"] == {
+            "ranges": [1.5, 0.5],
+            "box": [1.0, 2.0, 3.0, 4.0],
+        }
+
+    def test_schema_does_not_copy_arrays(self):
+        hub_state = HubState({}, schemas={"ranges": ArraySchema("float32")})
+        ranges = np.array([1.0, 2.0], dtype=np.float32)
+        hub_state.update({"ranges": ranges})
+
+        assert np.shares_memory(hub_state.state["ranges"], ranges)
+        # the caller's array is still writeable
+        assert ranges.flags.writeable
+
+    def test_schemas_from_config(self):
+        schemas = schemas_from_config(
+            {"boxes": {"dtype": "int16", "shape": [None, 4]}, "ranges": {}}
+        )
+        assert schemas == {
+            "boxes": ArraySchema("int16", (None, 4)),
+            "ranges": ArraySchema("float64", (None,)),
+        }
@@ -0,0 +1,67 @@
+"""
+    Unit tests of the shared jpeg encoding in basic_bot.commons.mjpeg_video
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+from basic_bot.commons.base_camera import CameraFrame
+from basic_bot.commons.mjpeg_video import JpegCache, JpegProfile
+
+
+def make_frame(seq: int) -> CameraFrame:
+    return CameraFrame(seq, time.time(), np.zeros((480, 640, 3), dtype=np.uint8))
+
+
+def test_encodes_each_frame_once_per_profile():
+    cache = JpegCache()
+    frame = make_frame(1)
+    full = cache.get(frame, JpegProfile())
+    assert cache.get(frame, JpegProfile()) is full
+
+    small = cache.get(frame, JpegProfile(quality=50, width=320))
+    image = cv2.imdecode(np.frombuffer(small, np.uint8), cv2.IMREAD_COLOR)
+    assert image.shape == (240, 320, 3)
+
+    cache.get(make_frame(2), JpegProfile())
+    assert cache.stats() == {"encodes": 3, "hits": 1, "profiles": 2}
+
+
+def test_profile_from_args():
+    assert JpegProfile.from_args({}) == JpegProfile(95, None)
+    assert JpegProfile.from_args({"quality": "150", "width": "320"}) == JpegProfile(
+        100, 320
+    )
+    assert JpegProfile.from_args({"quality": "x", "width": "0"}) == JpegProfile(
+        95, None
+    )
+    # frames are never scaled up
+    assert JpegProfile.from_args({"width": "100000"}) == JpegProfile(95, None)
+
+
+def test_never_scales_up():
+    cache = JpegCache()
+    jpeg = cache.get(make_frame(1), JpegProfile(width=100000))
+    image = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+    assert image.shape == (480, 640, 3)
+
+
+def test_older_frame_is_not_served_from_cache():
+    cache = JpegCache()
+    newer = cache.get(make_frame(2), JpegProfile())
+    older = cache.get(make_frame(1), JpegProfile())
+    assert older is not newer
+    assert cache.stats()["encodes"] == 2
+
+
+def test_least_recently_used_profiles_are_evicted():
+    cache = JpegCache(max_profiles=2)
+    frame = make_frame(1)
+    for quality in (10, 20, 10, 30):
+        cache.get(frame, JpegProfile(quality=quality))
+
+    assert list(cache.jpegs.keys()) == [JpegProfile(10), JpegProfile(30)]
+    assert set(cache.locks.keys()) <= set(cache.jpegs.keys())
+    assert cache.stats() == {"encodes": 3, "hits": 1, "profiles": 2}
@@ -0,0 +1,62 @@
+"""
+    Unit tests of basic_bot.commons.motion_detector
+"""
+
+import numpy as np
+
+from basic_bot.commons.motion_detector import MotionDetector
+
+
+def make_image(value: int = 100) -> np.ndarray:
+    return np.full((240, 320, 3), value, dtype=np.uint8)
+
+
+def test_static_scene_is_skipped_until_max_interval():
+    motion = MotionDetector(threshold=0.01, max_interval=5)
+
+    assert motion.update(make_image(), now=100)  # first frame
+    assert not motion.update(make_image(), now=101)
+    assert not motion.update(make_image(), now=104)
+    assert not motion.is_moving
+    # forced detection
+    assert motion.update(make_image(), now=105)
+    assert motion.stats()["skipped"] == 2
+
+
+def test_moving_object_is_detected():
+    motion = MotionDetector(threshold=0.01, max_interval=5)
+    motion.update(make_image(), now=100)
+
+    for x in range(0, 200, 40):
+        image = make_image()
+        image[100:160, x : x + 60] = 255
+        assert motion.update(image, now=101)
+        assert motion.is_moving
+
+    # the object stopped
+    assert not motion.update(image, now=102)
+    assert not motion.is_moving
+
+
+def test_slow_change_from_last_detection_is_detected():
+    motion = MotionDetector(threshold=0.01, max_interval=60)
+    motion.update(make_image(100), now=100)
+
+    detected = [
+        motion.update(make_image(100 + step * 5), now=100) for step in range(1, 6)
+    ]
+
+    # each frame differs from the one before it by less than PIXEL_THRESHOLD
+    assert not motion.is_moving
+    assert detected == [False, False, False, True, False]
+
+
+def test_sensor_noise_is_not_motion():
+    motion = MotionDetector(threshold=0.01, max_interval=60)
+    rng = np.random.default_rng(1)
+    motion.update(make_image(), now=100)
+
+    for _ in range(5):
+        noise = rng.integers(-20, 20, (240, 320, 3))
+        image = np.clip(make_image().astype(int) + noise, 0, 255).astype(np.uint8)
+        assert not motion.update(image, now=100)
@@ -0,0 +1,76 @@
+"""
+    Unit tests of basic_bot.commons.object_tracker
+"""
+
+import numpy as np
+
+from basic_bot.commons.object_tracker import ObjectTracker, iou_matrix
+
+
+def detection(x: float, y: float = 100, classification: str = "dog") -> dict:
+    return {
+        "bounding_box": [x, y, x + 100, y + 100],
+        "classification": classification,
+        "confidence": 0.9,
+    }
+
+
+def test_iou_matrix():
+    a = np.array([[0, 0, 10, 10], [0, 0, 0, 0]], dtype=float)
+    b = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]], dtype=float)
+
+    np.testing.assert_allclose(iou_matrix(a, b), [[1, 1 / 3, 0], [0, 0, 0]])
+
+
+def test_track_ids_persist_and_velocity():
+    tracker = ObjectTracker(iou_threshold=0.3, max_age=1)
+
+    # a dog moving right at 100 pixels per second and a cat that is still
+    for step in range(10):
+        objects = tracker.update(
+            [detection(step * 10), detection(400, classification="cat")],
+            timestamp=step * 0.1,
+        )
+        assert [o["track_id"] for o in objects] == [1, 2]
+
+    dog, cat = objects
+    assert 80 < dog["velocity"][0] < 120
+    assert abs(dog["velocity"][1]) < 1
+    assert cat["velocity"] == [0, 0]
+
+    predicted = tracker.predict(1.0)
+    assert 95 < predicted[0]["bounding_box"][0] < 105
+    assert predicted[1]["bounding_box"] == [400, 100, 500, 200]
+
+
+def test_new_and_expired_tracks():
+    tracker = ObjectTracker(iou_threshold=0.3, max_age=1)
+    tracker.update([detection(0)], timestamp=0)
+
+    # too far to be the same object
+    objects = tracker.update([detection(300)], timestamp=0.1)
+    assert objects[0]["track_id"] == 2
+    # a different class in the same place is a different object
+    objects = tracker.update([detection(300, classification="cat")], timestamp=0.2)
+    assert objects[0]["track_id"] == 3
+
+    assert len(tracker.predict(1.05)) == 2
+    assert tracker.predict(2) == []
+    tracker.update([], timestamp=2)
+    assert tracker.tracks == []
+
+
+def test_confirm_keeps_still_objects():
+    tracker = ObjectTracker(iou_threshold=0.3, max_age=1)
+    tracker.update([detection(0)], timestamp=0)
+    tracker.update([detection(10)], timestamp=0.1)
+
+    # a motion gate skips the unchanged frames for longer than max_age
+    for step in range(2, 40):
+        tracker.confirm(step * 0.1)
+
+    objects = tracker.predict(4)
+    assert [o["track_id"] for o in objects] == [1]
+    assert objects[0]["velocity"] == [0, 0]
+    assert objects[0]["bounding_box"] == tracker.tracks[0].box.tolist()
+    assert tracker.predict(5) == []
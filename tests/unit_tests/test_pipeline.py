@@ -0,0 +1,108 @@
+"""
+    Unit tests of basic_bot.commons.pipeline
+"""
+
+import threading
+import time
+
+from basic_bot.commons.pipeline import Pipeline, PipelineStage
+
+
+def test_items_pass_through_stages_in_order():
+    source = iter(range(1, 6))
+    published = []
+    done = threading.Event()
+
+    def produce(_):
+        item = next(source, None)
+        if item is None:
+            time.sleep(0.01)
+        return item
+
+    def publish(item):
+        published.append(item)
+        if item == 5:
+            done.set()
+
+    # queues big enough that nothing is dropped
+    pipeline = Pipeline(
+        [
+            ("produce", produce),
+            ("double", lambda item: item * 2),
+            ("odd_only", lambda item: item if item % 4 else None),
+            ("publish", publish),
+        ],
+        queue_size=10,
+    )
+    pipeline.start()
+    time.sleep(0.2)
+    pipeline.stop()
+
+    assert published == [2, 6, 10]
+    stats = pipeline.stats()
+    assert stats["double"]["count"] == 5
+    assert stats["odd_only"]["skipped"] == 2
+    assert stats["publish"]["count"] == 3
+    assert stats["publish"]["avg_duration"] >= 0
+
+
+def test_stages_overlap():
+    started_at = time.time()
+    published = []
+
+    def slow(item):
+        time.sleep(0.1)
+        return item
+
+    count = iter(range(4))
+    pipeline = Pipeline(
+        [
+            ("produce", lambda _: next(count, None)),
+            ("a", slow),
+            ("b", slow),
+            ("publish", published.append),
+        ],
+        queue_size=4,
+    )
+    pipeline.start()
+    while len(published) < 4 and time.time() - started_at < 2:
+        time.sleep(0.01)
+    pipeline.stop()
+
+    assert published == [0, 1, 2, 3]
+    # sequentially this would take 0.8 seconds
+    assert time.time() - started_at < 0.7
+
+
+def test_full_queue_drops_oldest():
+    stage = PipelineStage("test", lambda item: item, queue_size=2)
+    for item in range(5):
+        stage.put(item)
+
+    assert stage.dropped == 3
+    assert [stage.queue.get_nowait(), stage.queue.get_nowait()] == [3, 4]
+
+
+def test_run_and_failing_stage():
+    calls = []
+
+    def fail(item):
+        calls.append(item)
+        raise ValueError("test")
+
+    pipeline = Pipeline([("produce", lambda _: 1), ("fail", fail)])
+    threading.Timer(0.3, pipeline.stop).start()
+    pipeline.run()  # returns when stopped
+
+    assert calls
+    assert pipeline.stats()["fail"]["errors"] == len(calls)
+
+
+def test_first_stage_that_does_not_block_does_not_spin():
+    pipeline = Pipeline([("produce", lambda _: None), ("publish", print)])
+    pipeline.start()
+    time.sleep(0.1)
+    pipeline.stop()
+
+    # about 0.1 / IDLE_WAIT calls rather than hundreds of thousands
+    assert pipeline.stats()["produce"]["count"] < 100
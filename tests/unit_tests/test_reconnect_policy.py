@@ -0,0 +1,75 @@
+"""
+    Unit tests of basic_bot.commons.reconnect_policy
+"""
+
+import asyncio
+import time
+
+from basic_bot.commons.reconnect_policy import ReconnectPolicy
+
+
+def make_policy() -> ReconnectPolicy:
+    return ReconnectPolicy(first_delay=0.25, base_delay=0.5, max_delay=4.0, jitter=0.5)
+
+
+def test_fast_first_retry():
+    for _ in range(50):
+        delay = make_policy().next_delay()
+        assert 0 <= delay <= 0.25
+
+
+def test_backoff_grows_and_is_capped():
+    policy = make_policy()
+    policy.next_delay()
+    delays = [policy.next_delay() for _ in range(8)]
+
+    # base * 2^n with up to 50% removed by jitter
+    for n, delay in enumerate(delays[:4]):
+        expected = 0.5 * 2**n
+        assert expected * 0.5 <= delay <= expected
+    for delay in delays[4:]:
+        assert 2.0 <= delay <= 4.0
+
+
+def test_reset_restores_fast_retry():
+    policy = make_policy()
+    for _ in range(5):
+        policy.next_delay()
+    policy.reset()
+
+    assert policy.stats() == {"attempts": 0, "total_reconnects": 1}
+    assert policy.next_delay() <= 0.25
+
+    # reset without a failed attempt is not a reconnect
+    policy.reset()
+    policy.reset()
+    assert policy.stats()["total_reconnects"] == 2
+
+
+def test_wait_does_not_block_loop():
+    # the first retry is randomly sooner; the second waits exactly base_delay
+    policy = ReconnectPolicy(base_delay=0.2, jitter=0)
+    policy.next_delay()
+    tick_times = []
+
+    async def tick() -> None:
+        for _ in range(3):
+            tick_times.append(time.monotonic())
+            await asyncio.sleep(0.05)
+
+    async def wait() -> float:
+        await policy.wait()
+        return time.monotonic()
+
+    async def main() -> float:
+        wait_done, _ = await asyncio.gather(wait(), tick())
+        return wait_done
+
+    started = time.monotonic()
+    wait_done = asyncio.run(main())
+
+    # the ticks ran while waiting, not after a blocking sleep
+    assert len(tick_times) == 3
+    assert all(t < wait_done for t in tick_times)
+    # about max(0.2, 3 * 0.05), not their sum
+    assert time.monotonic() - started < 0.3
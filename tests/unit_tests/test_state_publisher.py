@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import numpy as np
+
+from basic_bot.commons.state_publisher import StatePublisher, within_deadband
+
+
+class TestStatePublisher:
+    def test_within_deadband(self):
+        assert within_deadband(1.0, 1.05, 0.1)
+        assert not within_deadband(1.0, 1.2, 0.1)
+        assert within_deadband({"pan": [1, 2.0]}, {"pan": [1.01, 2.0]}, 0.1)
+        assert not within_deadband({"pan": [1, 2]}, {"pan": [1, 2, 3]}, 0.1)
+        assert not within_deadband({"pan": 1}, {"tilt": 1}, 0.1)
+        assert not within_deadband(True, False, 1.0)
+        assert within_deadband("label", "label")
+
+    def test_within_deadband_arrays(self):
+        box = np.array([1.0, 2.0, 3.0, 4.0])
+        assert within_deadband(box, box.copy())
+        assert within_deadband(box, box + 0.05, 0.1)
+        assert not within_deadband(box, box + 0.2, 0.1)
+        assert not within_deadband(box, box[:3], 0.1)
+        assert within_deadband(box, [1.0, 2.0, 3.0, 4.0])
+        assert within_deadband(np.array(["a", "b"]), np.array(["a", "b"]))
+        assert not within_deadband(np.array(["a", "b"]), np.array(["a", "c"]))
+
+        sent = []
+        publisher = StatePublisher(sent.append)
+        publisher.publish({"box": box})
+        publisher.publish({"box": box.copy()})
+        assert len(sent) == 1
+
+    def test_only_changes_are_sent(self):
+        sent = []
+        publisher = StatePublisher(sent.append)
+        publisher.configure("angles", deadband=0.5)
+
+        publisher.publish({"angles": {"pan": 90.0}, "label": "cat"})
+        publisher.publish({"angles": {"pan": 90.4}, "label": "cat"})
+        publisher.publish({"angles": {"pan": 91.0}, "label": "cat"})
+        publisher.publish({"angles": {"pan": 91.0}, "label": "cat"}, force=True)
+
+        assert sent == [
+            {"angles": {"pan": 90.0}, "label": "cat"},
+            {"angles": {"pan": 91.0}},
+            {"angles": {"pan": 91.0}, "label": "cat"},
+        ]
+        assert publisher.stats()["unchanged"] == 3
+
+    def test_rate_limit_trailing_edge(self):
+        sent = []
+        publisher = StatePublisher(sent.append)
+        publisher.configure("throttle", max_rate=10)
+
+        for i in range(5):
+            publisher.publish({"throttle": i})
+        assert sent == [{"throttle": 0}]
+
+        # the last value held by the rate limit is sent at the trailing edge
+        time.sleep(0.2)
+        assert sent == [{"throttle": 0}, {"throttle": 4}]
+
+    def test_no_trailing_edge(self):
+        sent = []
+        publisher = StatePublisher(sent.append)
+        publisher.configure("throttle", max_rate=10, trailing=False)
+
+        publisher.publish({"throttle": 0})
+        publisher.publish({"throttle": 1})
+        time.sleep(0.2)
+        assert sent == [{"throttle": 0}]
+        publisher.publish({"throttle": 2})
+        assert sent == [{"throttle": 0}, {"throttle": 2}]
+
+    def test_stop_cancels_loop_flush(self):
+        async def main():
+            sent = []
+            fired = []
+            publisher = StatePublisher(sent.append, loop=asyncio.get_running_loop())
+            publisher._on_timer = lambda: fired.append(True)  # type: ignore
+            publisher.configure("throttle", max_rate=20)
+            publisher.publish({"throttle": 0})
+            publisher.publish({"throttle": 1})
+            await asyncio.sleep(0)
+            assert publisher.timer_handle is not None
+
+            publisher.stop()
+            await asyncio.sleep(0.1)
+            assert fired == []
+            assert sent == [{"throttle": 0}]
+
+        asyncio.run(main())
@@ -0,0 +1,65 @@
+"""
+    Unit tests of the model output postprocessing in basic_bot.commons.tflite_detect
+"""
+
+import numpy as np
+
+# skip this test if tflite_runtime is not installed
+import basic_bot.test_helpers.skip_unless_tflite_runtime  # noqa: F401
+
+from basic_bot.commons.tflite_detect import (
+    detections_from_outputs,
+    detections_to_dicts,
+)
+
+
+def make_outputs(batch: int = 1) -> list:
+    """SSD style outputs of a model for `batch` images with 10 max detections"""
+    boxes = np.zeros((batch, 10, 4), dtype=np.float32)
+    classes = np.zeros((batch, 10), dtype=np.float32)
+    scores = np.zeros((batch, 10), dtype=np.float32)
+    # [top, left, bottom, right], class id, score
+    detections = [
+        ([0.1, 0.2, 0.5, 0.6], 17, 0.9),  # dog
+        ([0.0, 0.0, 1.0, 1.0], 0, 0.3),  # person below threshold
+        ([0.5, 0.5, 0.75, 1.0], 0, 0.6),  # person
+    ]
+    for i, (box, class_id, score) in enumerate(detections):
+        boxes[:, i] = box
+        classes[:, i] = class_id
+        scores[:, i] = score
+    # detections past the count are ignored
+    scores[:, 5] = 0.99
+    counts = np.full((batch,), len(detections), dtype=np.float32)
+    return [boxes, classes, scores, counts]
+
+
+def test_threshold_and_scaling():
+    detections = detections_from_outputs(make_outputs(), (100, 200, 3), threshold=0.5)
+
+    assert detections["class_id"].tolist() == [17, 0]
+    np.testing.assert_allclose(
+        detections["bounding_box"], [[40, 10, 120, 50], [100, 50, 200, 75]]
+    )
+    np.testing.assert_allclose(detections["confidence"], [0.9, 0.6])
+
+
+def test_class_filter_and_batch_index():
+    outputs = make_outputs(batch=2)
+    outputs[2][1, 0] = 0.1  # the dog in the second image is below threshold
+
+    first = detections_from_outputs(outputs, (100, 200, 3), 0.5, class_ids=[17])
+    second = detections_from_outputs(outputs, (100, 200, 3), 0.5, batch_index=1)
+
+    assert first["class_id"].tolist() == [17]
+    assert second["class_id"].tolist() == [0]
+
+
+def test_detections_to_dicts():
+    detections = detections_from_outputs(make_outputs(), (100, 200, 3), threshold=0.5)
+    objects = detections_to_dicts(detections)
+
+    assert [o["classification"] for o in objects] == ["dog", "person"]
+    assert objects[1]["bounding_box"] == [100.0, 50.0, 200.0, 75.0]
+    assert isinstance(objects[0]["confidence"], float)
+    assert detections_to_dicts(detections[:0]) == []
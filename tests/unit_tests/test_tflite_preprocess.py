@@ -0,0 +1,86 @@
+"""
+    Unit tests of the input preprocessing in basic_bot.commons.tflite_detect
+"""
+
+from typing import Any
+
+import cv2
+import numpy as np
+import pytest
+
+# skip this test if tflite_runtime is not installed
+import basic_bot.test_helpers.skip_unless_tflite_runtime  # noqa: F401
+
+from basic_bot.commons import tflite_detect
+from basic_bot.commons.tflite_detect import SCRATCH_BUFFERS, TFLiteDetect
+
+
+class FakeInterpreter:
+    """Just enough of tflite.Interpreter to construct a TFLiteDetect"""
+
+    input_dtype: Any = np.uint8
+
+    def __init__(self, model_path: str, num_threads: int) -> None:
+        pass
+
+    def allocate_tensors(self) -> None:
+        pass
+
+    def get_input_details(self) -> list:
+        return [{"index": 0, "shape": [1, 300, 300, 3], "dtype": self.input_dtype}]
+
+    def get_output_details(self) -> list:
+        return [{"index": i} for i in range(1, 5)]
+
+
+def make_detector(monkeypatch, input_dtype: Any) -> TFLiteDetect:
+    FakeInterpreter.input_dtype = input_dtype
+    monkeypatch.setattr(tflite_detect.tflite, "Interpreter", FakeInterpreter)
+    return TFLiteDetect(model="fake.tflite")
+
+
+def make_image() -> np.ndarray:
+    return np.random.default_rng(1).integers(0, 256, (480, 640, 3), dtype=np.uint8)
+
+
+def test_quantized_input(monkeypatch):
+    detector = make_detector(monkeypatch, np.uint8)
+    img = make_image()
+
+    input_data = detector.preprocess(img)
+
+    assert input_data.dtype == np.uint8
+    np.testing.assert_array_equal(input_data[0], cv2.resize(img, (300, 300)))
+
+
+def test_float_input(monkeypatch):
+    detector = make_detector(monkeypatch, np.float32)
+    img = make_image()
+
+    input_data = detector.preprocess(img)
+
+    resized = np.expand_dims(cv2.resize(img, (300, 300)), axis=0)
+    expected = (np.float32(resized) - 127.5) / 127.5
+    assert input_data.dtype == np.float32
+    np.testing.assert_allclose(input_data, expected, atol=1e-6)
+
+
+def test_scratch_buffers_rotate(monkeypatch):
+    detector = make_detector(monkeypatch, np.uint8)
+    img = make_image()
+
+    outputs = [detector.preprocess(img) for _ in range(SCRATCH_BUFFERS + 1)]
+
+    ids = [id(out) for out in outputs]
+    assert len(set(ids[:SCRATCH_BUFFERS])) == SCRATCH_BUFFERS
+    assert outputs[SCRATCH_BUFFERS] is outputs[0]
+
+
+def test_rejects_images_that_cannot_be_resized_in_place(monkeypatch):
+    detector = make_detector(monkeypatch, np.uint8)
+    with pytest.raises(ValueError):
+        detector.preprocess(np.zeros((480, 640, 4), dtype=np.uint8))
+    with pytest.raises(ValueError):
+        detector.preprocess(np.zeros((480, 640, 3), dtype=np.float32))
+    with pytest.raises(ValueError):
+        detector.preprocess(np.zeros((480, 640), dtype=np.uint8))
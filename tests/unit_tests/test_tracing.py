@@ -0,0 +1,109 @@
+"""
+    Unit tests of basic_bot.commons.tracing.
+"""
+
+import asyncio
+import json
+import os
+import time
+
+from basic_bot.commons import messages, tracing
+from basic_bot.commons.clock_sync import ClockSync
+from basic_bot.commons.tracing import TraceCollector, TraceContext
+
+TEST_FILE = "./test_tracing.json"
+
+
+def remove_file_if(file_path):
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+
+def teardown_module():
+    remove_file_if(TEST_FILE)
+
+
+def test_new_trace_stamps_origin():
+    trace = tracing.new_trace("vision", origin_ts=100.0)
+    assert trace.id
+    assert trace.stamps == [["vision.origin", 100.0]]
+    assert trace.origin_ts == 100.0
+
+
+def test_round_trip_through_dict():
+    trace = tracing.new_trace("vision", origin_ts=100.0).stamp("send", 100.5)
+    trace.hold("central_hub").stamp("recv", 101.0)
+
+    received = tracing.from_message({"type": "stateUpdate", "trace": trace.to_dict()})
+    assert received is not None
+    assert received.id == trace.id
+    assert [s[0] for s in received.stamps] == [
+        "vision.origin",
+        "vision.send",
+        "central_hub.recv",
+    ]
+
+
+def test_stamps_in_hub_time():
+    clock = ClockSync()
+    # hub clock is 1000s ahead
+    now = time.time()
+    clock.handle_pong({"t0": now, "t1": now + 1000, "t2": now + 1000}, t3=now)
+    sent = []
+
+    class FakeWebsocket:
+        remote_address = ("127.0.0.1", 1234)
+
+        async def send(self, data):
+            sent.append(json.loads(data))
+
+    trace = tracing.new_trace("vision", origin_ts=now, clock=clock).stamp("detected")
+    asyncio.run(messages.send_update_state(FakeWebsocket(), {"a": 1}, trace=trace))
+
+    stamps = sent[0]["trace"]["stamps"]
+    assert [s[0] for s in stamps] == ["vision.origin", "vision.detected", "vision.send"]
+    assert stamps[0][1] == now + 1000
+    # each hop is measured on the hub clock, not offset by 1000s
+    assert all(0 <= b[1] - a[1] < 1 for a, b in zip(stamps, stamps[1:]))
+
+    # a received trace continued with the clock of the process that sends it
+    received = tracing.from_message(sent[0])
+    assert received is not None
+    received.hold("behavior", "deliver", clock)
+    asyncio.run(
+        messages.send_update_state(FakeWebsocket(), {"b": 2}, received, clock=clock)
+    )
+    stamps = sent[1]["trace"]["stamps"]
+    assert [s[0] for s in stamps[-2:]] == ["behavior.deliver", "behavior.send"]
+    assert all(0 <= b[1] - a[1] < 1 for a, b in zip(stamps, stamps[1:]))
+
+
+def test_from_message_without_trace():
+    assert tracing.from_message({"type": "stateUpdate", "data": {}}) is None
+    assert TraceContext.from_dict("not a trace") is None
+
+
+def test_collector_writes_chrome_trace():
+    remove_file_if(TEST_FILE)
+    trace = TraceContext(
+        id="abc",
+        stamps=[["a.origin", 1.0], ["hub.recv", 1.25], ["b.deliver", 2.0]],
+    )
+
+    collector = TraceCollector(TEST_FILE, "test_process")
+    collector.record(trace, "b")
+    collector.record(trace, "b")
+
+    events = tracing.load_trace_file(TEST_FILE)
+    assert events[0]["ph"] == "M"
+    assert events[0]["args"]["name"] == "test_process"
+
+    spans = [e for e in events if e["ph"] == "X"]
+    # two hops plus a total span for each of the two recorded traces
+    assert len(spans) == 6
+    assert spans[0]["name"] == "hub.recv"
+    assert spans[0]["ts"] == 1.0e6
+    assert spans[0]["dur"] == 0.25e6
+    assert spans[2]["name"] == "b total"
+    assert spans[2]["dur"] == 1.0e6
+    assert collector.traces_recorded == 2
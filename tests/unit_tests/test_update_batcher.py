@@ -0,0 +1,81 @@
+"""
+    Unit tests of basic_bot.commons.messages.UpdateBatcher
+"""
+
+import asyncio
+import gc
+import json
+import weakref
+
+from basic_bot.commons import messages, tracing
+
+
+class FakeWebsocket:
+    remote_address = ("127.0.0.1", 1234)
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, data):
+        self.sent.append(json.loads(data))
+
+
+def test_merges_until_flush():
+    async def main():
+        websocket = FakeWebsocket()
+        batcher = messages.UpdateBatcher(websocket)
+        await messages.send_update_state(websocket, {"a": 1, "b": 1})
+        await messages.send_update_state(websocket, {"b": 2})
+        assert websocket.sent == []
+
+        await batcher.flush()
+        assert websocket.sent == [{"type": "updateState", "data": {"a": 1, "b": 2}}]
+        assert batcher.stats() == {"updates": 2, "frames": 1, "pending_keys": 0}
+
+        # nothing to send
+        await batcher.flush()
+        assert len(websocket.sent) == 1
+
+    asyncio.run(main())
+
+
+def test_window_sends_one_frame():
+    async def main():
+        websocket = FakeWebsocket()
+        messages.UpdateBatcher(websocket, window_ms=20)
+        trace = tracing.new_trace("test")
+        await messages.send_update_state(websocket, {"a": 1})
+        await messages.send_update_state(websocket, {"b": 2}, trace=trace)
+        await asyncio.sleep(0.01)
+        assert websocket.sent == []
+
+        await asyncio.sleep(0.03)
+        assert len(websocket.sent) == 1
+        assert websocket.sent[0]["data"] == {"a": 1, "b": 2}
+        assert websocket.sent[0]["trace"]["id"] == trace.id
+
+    asyncio.run(main())
+
+
+def test_close_flushes_and_stops_batching():
+    async def main():
+        websocket = FakeWebsocket()
+        batcher = messages.UpdateBatcher(websocket, window_ms=1000)
+        await messages.send_update_state(websocket, {"a": 1})
+        await batcher.close()
+        assert websocket.sent[0]["data"] == {"a": 1}
+
+        await messages.send_update_state(websocket, {"a": 2})
+        assert websocket.sent[1]["data"] == {"a": 2}
+
+    asyncio.run(main())
+
+
+def test_unclosed_batcher_goes_away_with_websocket():
+    websocket = FakeWebsocket()
+    batcher = weakref.ref(messages.UpdateBatcher(websocket))
+    assert messages._update_batchers.get(websocket) is batcher()
+
+    del websocket
+    gc.collect()
+    assert batcher() is None
@@ -0,0 +1,37 @@
+"""
+    Unit tests of the video sizes that basic_bot.commons.webrtc_server offers
+"""
+
+from basic_bot.commons import constants as c
+from basic_bot.commons.webrtc_server import VIDEO_SCALES, WebrtcPeers
+
+
+def video_size(width, height):
+    peers = WebrtcPeers.__new__(WebrtcPeers)
+    return peers._video_size({"width": width, "height": height})
+
+
+def test_rounds_up_to_a_scale_of_the_captured_size():
+    quarter = (c.BB_VISION_WIDTH // 4, c.BB_VISION_HEIGHT // 4)
+    half = (c.BB_VISION_WIDTH // 2, c.BB_VISION_HEIGHT // 2)
+
+    assert video_size(1, 1) == quarter
+    assert video_size(*quarter) == quarter
+    assert video_size(quarter[0] + 1, quarter[1]) == half
+    assert video_size(1, half[1]) == half
+
+
+def test_captured_size_for_large_or_invalid_sizes():
+    assert video_size(c.BB_VISION_WIDTH, c.BB_VISION_HEIGHT) is None
+    assert video_size(c.BB_VISION_WIDTH * 10, c.BB_VISION_HEIGHT * 10) is None
+    assert video_size(0, 10) is None
+    assert video_size("wide", 10) is None
+
+
+def test_bounded_number_of_sizes():
+    sizes = {
+        video_size(width, height)
+        for width in range(1, c.BB_VISION_WIDTH * 2, 7)
+        for height in range(1, c.BB_VISION_HEIGHT * 2, 11)
+    }
+    assert len(sizes) <= len(VIDEO_SCALES)